@@ -1,17 +1,49 @@
+import time
+_T0 = time.perf_counter()  # 启动计时起点，尽量早
+import bisect
 import json
+import math
 import os
-import csv
+import sys
+import queue
+import threading
+import difflib
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 from datetime import datetime
-from collections import defaultdict
-import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 import customtkinter as ctk
-import matplotlib
-matplotlib.use("TkAgg")
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import matplotlib.ticker as mticker
+from pocket_core import (CATEGORIES, DATA_FILE, PERF, STORAGE_BACKEND, ExportCancelled, LedgerCorruptError,
+                         chart_series, export_csv, import_records, normalize_budget, open_ledger, period_range,
+                         restore_backup)
+# pocket_charts 只在第一次绘制时才导入 matplotlib，且发生在绘图线程里，侧边栏、卡片和列表先显示出来
+from pocket_charts import LEVEL_COLORS, ChartRenderer, budget_lines
+
+
+# 启动耗时打点 (毫秒，自进程导入本模块起)。设置 POCKETTRACK_STARTUP_TIMING=1 输出到 stderr，
+# 设为文件路径则追加一行 JSON，便于跨版本比较冷启动回归。
+class StartupTimer:
+    def __init__(self, t0):
+        self.t0 = t0
+        self.marks = {}
+
+    def mark(self, name):
+        self.marks.setdefault(name, round((time.perf_counter() - self.t0) * 1000, 1))
+
+    def report(self):
+        target = os.environ.get("POCKETTRACK_STARTUP_TIMING")
+        if not target:
+            return
+        line = json.dumps(dict(self.marks, ts=datetime.now().isoformat(timespec="seconds")))
+        if target == "1":
+            print(line, file=sys.stderr)
+        else:
+            with open(target, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+STARTUP = StartupTimer(_T0)
+STARTUP.mark("imports")
 
 # ---------- 主题配置 ----------
 ctk.set_appearance_mode("light")
@@ -30,6 +62,7 @@ COLORS = {
     "income_hover": "#05B88A",
     "expense": "#EF476F",
     "expense_hover": "#D63D63",
+    "warning": "#F4A261",
     "text": "#1A1A2E",
     "text_light": "#8D99AE",
     "border": "#DEE2E6",
@@ -37,73 +70,93 @@ COLORS = {
     "tab_inactive": "#2A2A4A",
 }
 
-CATEGORIES = {
-    "支出": ["餐饮", "文具", "零食", "交通", "娱乐", "购物", "其他"],
-    "收入": ["红包", "奖励", "零花钱", "兼职", "利息", "其他"],
-}
-
-DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "money_data.json")
-
-
-# ---------- 数据管理类 ----------
-class DataManager:
-    def __init__(self):
-        self.data = self.load()
-
-    def load(self):
-        if os.path.exists(DATA_FILE):
+LIST_PAGE_SIZE = 200  # 流水列表每次物化的行数
+ENTRY_FLUSH_MS = 1200  # 连续录入时，停止提交这么久后才写日志、重绘图表
+LEDGER_POLL_MS = 2000  # 检查其他进程 (导入脚本、命令行) 是否修改了账本的间隔
+PERIOD_LABELS = {"全部时间": "all", "本月": "month", "上月": "last_month", "近30天": "30d", "今年": "year"}
+BUDGET_PERIOD_LABELS = {"每周": "week", "每月": "month", "每年": "year"}
+
+
+# ---------- 刷新调度 ----------
+# 防抖 + 后台计算：request() 后 delay_ms 内没有新请求才提交给工作线程；
+# 工作线程只做计算，结果经队列交回主线程 (after() 轮询) 再调用 apply。
+# 新请求会使旧请求作废：未开始的直接取消；已在计算的在各阶段之间检查 cancelled()，为真时返回 None 提前结束，
+# 来不及退出的结果也会被丢弃。
+class RefreshScheduler:
+    def __init__(self, widget, compute, apply, delay_ms=180, poll_ms=15):
+        self.widget = widget
+        self.compute = compute
+        self.apply = apply
+        self.delay_ms = delay_ms
+        self.poll_ms = poll_ms
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._results = queue.Queue()
+        self._generation = 0
+        self._after_id = None
+        self._poll_id = None
+        self._future = None
+
+    def request(self, arg):
+        self.invalidate()
+        self._after_id = self.widget.after(self.delay_ms, self._start, arg)
+
+    # 有尚未开始或正在计算的请求
+    @property
+    def busy(self):
+        return self._after_id is not None or (self._future is not None and not self._future.done())
+
+    def invalidate(self):
+        self._generation += 1
+        if self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+            self._after_id = None
+        if self._future is not None:
+            self._future.cancel()
+
+    def _start(self, arg):
+        self._after_id = None
+        gen = self._generation
+        self._future = self._executor.submit(self._run, gen, arg)
+        if self._poll_id is None:
+            self._poll_id = self.widget.after(self.poll_ms, self._poll)
+
+    def _run(self, gen, arg):
+        try:
+            result = self.compute(arg, lambda: gen != self._generation)
+            self._results.put((gen, result, None))
+        except Exception as e:
+            self._results.put((gen, None, e))
+
+    def _poll(self):
+        self._poll_id = None
+        done = self._future is None or self._future.done()
+        while True:
             try:
-                with open(DATA_FILE, "r", encoding="utf-8") as f:
-                    return json.load(f)
-            except Exception:
-                pass
-        return {"records": []}
-
-    def save(self):
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(self.data, f, indent=2, ensure_ascii=False)
-
-    def add_record(self, r_type, amount, category, note=""):
-        record = {
-            "date": datetime.now().strftime("%Y-%m-%d %H:%M"),
-            "type": r_type,
-            "amount": float(amount),
-            "category": category,
-            "note": note,
-        }
-        self.data["records"].append(record)
-        self.save()
-
-    def delete_record(self, index):
-        if 0 <= index < len(self.data["records"]):
-            self.data["records"].pop(index)
-            self.save()
-
-    def get_stats(self, filter_text=""):
-        indexed = list(enumerate(self.data["records"]))
-        if filter_text:
-            ft = filter_text.lower()
-            indexed = [
-                (i, r) for i, r in indexed
-                if ft in r["category"].lower() or ft in r.get("note", "").lower()
-            ]
-
-        income = sum(r["amount"] for _, r in indexed if r["type"] == "收入")
-        expense = sum(r["amount"] for _, r in indexed if r["type"] == "支出")
-
-        cat_map = {}
-        for _, r in indexed:
-            if r["type"] == "支出":
-                cat_map[r["category"]] = cat_map.get(r["category"], 0) + r["amount"]
-
-        return income, expense, cat_map, indexed
+                gen, result, error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if gen != self._generation:
+                continue  # 已过期
+            if error is not None:
+                raise error
+            if result is not None:
+                self.apply(result)
+        if not done:
+            self._poll_id = self.widget.after(self.poll_ms, self._poll)
+
+    def shutdown(self):
+        self.invalidate()
+        if self._poll_id is not None:
+            self.widget.after_cancel(self._poll_id)
+            self._poll_id = None
+        self._executor.shutdown(wait=False)
 
 
 # ---------- 主界面 ----------
 class PocketTrackApp(ctk.CTk):
     def __init__(self):
         super().__init__()
-        self.db = DataManager()
+        self.db = self._open_ledger()
         self.title("PocketTrack Pro")
         self.geometry("1150x720")
         self.minsize(820, 600)
@@ -113,9 +166,80 @@ class PocketTrackApp(ctk.CTk):
         self.grid_columnconfigure(1, weight=1)
         self.grid_rowconfigure(0, weight=1)
 
+        # 搜索只影响列表：防抖后在后台线程过滤，结果回到主线程后只重建列表
+        self._search_scheduler = RefreshScheduler(self, self._build_list_rows, self._refresh_list)
+        # 图表在绘图线程里用 Agg 光栅化，像素回到主线程后贴到画布上；窗口缩放时同样防抖
+        self._chart_renderer = ChartRenderer()
+        self._chart_scheduler = RefreshScheduler(self, self._render_chart, self._show_chart, delay_ms=60)
+        self._entry_pending = False   # 有尚未持久化的录入
+        self._entry_flush_id = None
+
+        STARTUP.mark("data_loaded")
         self._build_sidebar()
         self._build_main()
         self.refresh_ui()
+        STARTUP.mark("ui_built")
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+        self._ledger_poll_id = self.after(LEDGER_POLL_MS, self._poll_ledger)
+        self._debug_panel = None
+        if PERF.enabled:
+            self.bind("<F12>", self._toggle_debug_panel)
+
+    # 账本损坏时不以空账本启动 (那样下次保存就会覆盖它)：只有日志损坏时保留损坏之前的修改，
+    # 快照损坏时提示从最近的备份恢复，损坏的文件改名保留
+    def _open_ledger(self):
+        try:
+            return open_ledger(DATA_FILE, STORAGE_BACKEND)
+        except LedgerCorruptError as e:
+            self.withdraw()
+            if not e.backups and e.journal is None:
+                messagebox.showerror("账本损坏", f"{e}\n\n没有可用的备份，请手动检查该文件。")
+                raise SystemExit(1)
+            question = ("是否保留账本和日志中损坏之前的修改？损坏之后的部分会移到 .corrupt 文件保留。"
+                        if e.journal else "是否从最近的备份恢复？损坏的文件会改名保留。")
+            if not messagebox.askyesno("账本损坏", f"{e}\n\n{question}"):
+                raise SystemExit(1)
+            try:
+                restore_backup(e.path)
+            except LedgerCorruptError as err:
+                messagebox.showerror("账本损坏", str(err))
+                raise SystemExit(1)
+            self.deiconify()
+            return open_ledger(DATA_FILE, STORAGE_BACKEND)
+
+    # 图表区域第一次映射到屏幕后，等界面画完再请求第一张图 (matplotlib 在绘图线程里导入)
+    def _on_chart_mapped(self, _event):
+        self._chart_container.unbind("<Map>", self._map_bind_id)
+        self.after_idle(self._on_first_paint)
+
+    def _on_first_paint(self):
+        STARTUP.mark("first_paint")
+        self._chart_ready = True
+        self._refresh_chart()
+
+    # 其他进程修改过账本时读入变更并刷新界面。没有变化时只比较锁文件里的序号；
+    # 录入尚未写出时本进程一直持有文件锁，不会有外部变更
+    def _poll_ledger(self):
+        if not self._entry_pending and self.db.refresh():
+            self.refresh_ui()
+        self._ledger_poll_id = self.after(LEDGER_POLL_MS, self._poll_ledger)
+
+    def _on_close(self):
+        self.after_cancel(self._ledger_poll_id)
+        self._search_scheduler.shutdown()
+        self._chart_scheduler.shutdown()
+        if self._entry_flush_id is not None:
+            self.after_cancel(self._entry_flush_id)
+        self.db.close()  # 会先写入推迟的录入
+        PERF.finish()
+        self.destroy()
+
+    def _toggle_debug_panel(self, _event=None):
+        if self._debug_panel is not None and self._debug_panel.winfo_exists():
+            self._debug_panel.destroy()
+            self._debug_panel = None
+        else:
+            self._debug_panel = DebugPanel(self)
 
     # ================================================================
     #  侧边栏
@@ -179,6 +303,9 @@ class PocketTrackApp(ctk.CTk):
                                      font=("Helvetica", 12), fg_color=COLORS["sidebar_input"],
                                      border_width=0, text_color="white")
         self.note_ent.pack(fill="x", pady=(4, 20))
+        # 回车直接提交，连续录入时手不用离开键盘
+        for entry in (self.amt_ent, self.note_ent):
+            entry.bind("<Return>", lambda e: self._on_submit_click())
 
         # ---- 提交按钮 (跟随当前 Tab) ----
         btn_frame = ctk.CTkFrame(sidebar, fg_color="transparent")
@@ -196,9 +323,15 @@ class PocketTrackApp(ctk.CTk):
         bottom = ctk.CTkFrame(sidebar, fg_color="transparent")
         bottom.grid(row=11, column=0, sticky="sew", padx=14, pady=(0, 14))
 
+        ctk.CTkButton(bottom, text="导入 CSV/JSON", height=34, corner_radius=8,
+                      font=("Helvetica", 11), fg_color="#34495E", hover_color="#4A6278",
+                      command=self.import_data).pack(fill="x", pady=(0, 8))
         ctk.CTkButton(bottom, text="导出 CSV 账单", height=34, corner_radius=8,
                       font=("Helvetica", 11), fg_color="#34495E", hover_color="#4A6278",
-                      command=self.export_data).pack(fill="x")
+                      command=self.export_data).pack(fill="x", pady=(0, 8))
+        ctk.CTkButton(bottom, text="预算设置", height=34, corner_radius=8,
+                      font=("Helvetica", 11), fg_color="#34495E", hover_color="#4A6278",
+                      command=lambda: BudgetDialog(self)).pack(fill="x")
 
     # ================================================================
     #  支出/收入 Tab 切换
@@ -243,9 +376,14 @@ class PocketTrackApp(ctk.CTk):
         card_row.grid(row=0, column=0, sticky="ew")
         card_row.grid_columnconfigure((0, 1, 2), weight=1)
 
-        self.lbl_balance = self._create_card(card_row, "当前余额", "￥0.00", COLORS["primary"], 0)
-        self.lbl_income = self._create_card(card_row, "累计收入", "￥0.00", COLORS["income"], 1)
-        self.lbl_expense = self._create_card(card_row, "累计支出", "￥0.00", COLORS["expense"], 2)
+        _, self.lbl_balance = self._create_card(card_row, "当前余额", "￥0.00", COLORS["primary"], 0)
+        self.lbl_income_title, self.lbl_income = self._create_card(card_row, "累计收入", "￥0.00", COLORS["income"], 1)
+        self.lbl_expense_title, self.lbl_expense = self._create_card(card_row, "累计支出", "￥0.00",
+                                                                     COLORS["expense"], 2)
+        # 预算提醒：设置了预算才显示在支出卡片底部
+        self.lbl_budget = ctk.CTkLabel(self.lbl_expense.master, text="", font=("Helvetica", 11),
+                                       justify="left", anchor="w")
+        self._budget_shown = False
 
         # ---- 中部：图表 ----
         chart_container = ctk.CTkFrame(self.main_frame, fg_color="transparent")
@@ -283,7 +421,15 @@ class PocketTrackApp(ctk.CTk):
                                        fg_color=COLORS["row_alt"], border_width=0,
                                        font=("Helvetica", 12), height=30)
         self.search_ent.pack(side="left", padx=15)
-        self.search_ent.bind("<KeyRelease>", lambda e: self.refresh_ui())
+        self.search_ent.bind("<KeyRelease>", lambda e: self._search_scheduler.request(self._list_args()))
+
+        # 统计区间：同时作用于列表、收支卡片和支出构成饼图
+        self.period = "all"
+        self._period_cache = None  # ((聚合版本, 区间), 区间统计)
+        self.period_menu = ctk.CTkOptionMenu(header, values=list(PERIOD_LABELS), width=100, height=30,
+                                             font=("Helvetica", 12), command=self._switch_period)
+        self.period_menu.set("全部时间")
+        self.period_menu.pack(side="left")
 
         # 删除按钮
         ctk.CTkButton(
@@ -327,9 +473,17 @@ class PocketTrackApp(ctk.CTk):
         sb = ctk.CTkScrollbar(tree_frame, orientation="vertical", command=self.tree.yview,
                               fg_color="transparent", button_color=COLORS["text_light"], 
                               button_hover_color=COLORS["primary"])
-        self.tree.configure(yscrollcommand=sb.set)
+        self._tree_sb = sb
+        self.tree.configure(yscrollcommand=self._on_tree_scroll)
         sb.grid(row=0, column=1, sticky="ns", pady=5, padx=(0, 5))
 
+        # 虚拟化列表状态：只物化前 _list_limit 行，滚动接近底部时再加载一页
+        self._list_source = []     # get_stats 返回的 (记录 id, 记录) 序列，按添加顺序
+        self._list_query = None
+        self._list_limit = LIST_PAGE_SIZE
+        self._list_items = []      # 当前显示的 (差异键, iid = 记录 id, tags)，自上而下
+        self._list_loading = False
+
         self.tree.tag_configure("income_row", foreground=COLORS["income"])
         self.tree.tag_configure("expense_row", foreground=COLORS["expense"])
         self.tree.tag_configure("alt", background=COLORS["row_alt"])
@@ -354,7 +508,7 @@ class PocketTrackApp(ctk.CTk):
 
         self.chart_mode = "pie"
         self._tab_buttons = {}
-        for mode, label in [("pie", "支出构成"), ("bar", "每日趋势"), ("compare", "收支对比")]:
+        for mode, label in [("pie", "支出构成"), ("bar", "支出趋势"), ("compare", "收支对比")]:
             btn = ctk.CTkButton(
                 tab_bar, text=label, width=90, height=30, corner_radius=6,
                 font=("Helvetica", 11),
@@ -366,14 +520,33 @@ class PocketTrackApp(ctk.CTk):
             btn.pack(side="left", padx=(0, 6))
             self._tab_buttons[mode] = btn
 
-        # Matplotlib 画布
-        chart_container = ctk.CTkFrame(panel, fg_color="white", corner_radius=0)
-        chart_container.grid(row=1, column=0, sticky="nswe", padx=8, pady=(0, 8))
-
-        self.fig, self.ax = plt.subplots(figsize=(4.2, 4.2), dpi=90)
-        self.fig.patch.set_facecolor("white")
-        self.canvas = FigureCanvasTkAgg(self.fig, master=chart_container)
-        self.canvas.get_tk_widget().pack(fill="both", expand=True)
+        # 趋势图时间范围：30 天以上读周/月汇总，不逐条统计
+        self.chart_span = "7d"
+        self._span_labels = {"7天": "7d", "30天": "30d", "12月": "12m", "全部": "all"}
+        self._span_selector = ctk.CTkSegmentedButton(
+            tab_bar, values=list(self._span_labels), height=26, font=("Helvetica", 10),
+            selected_color=COLORS["primary"], selected_hover_color=COLORS["primary_hover"],
+            command=self._switch_span, state="disabled",
+        )
+        self._span_selector.set("7天")
+        self._span_selector.pack(side="right")
+
+        # 图表画布只显示绘图线程送回的位图；尺寸由布局决定，不随位图大小变化
+        self._chart_container = ctk.CTkFrame(panel, fg_color="white", corner_radius=0)
+        self._chart_container.grid(row=1, column=0, sticky="nswe", padx=8, pady=(0, 8))
+        self._chart_canvas = tk.Canvas(self._chart_container, width=1, height=1, bg="white",
+                                       highlightthickness=0, bd=0)
+        self._chart_canvas.pack(fill="both", expand=True)
+        self._chart_canvas.bind("<Configure>", lambda _e: self._refresh_chart())
+        self._chart_image = None   # 画布上的 PhotoImage，尺寸不变时原地贴入新像素
+        self._chart_item = None
+        self._chart_data = {}      # 图表 -> ((聚合版本, 时间范围), 数据)
+        self._chart_shown = None   # 画布上当前位图对应的 (图表, 数据, 宽, 高)
+        self._chart_ready = False
+        self._chart_placeholder = ctk.CTkLabel(self._chart_container, text="图表加载中...",
+                                               font=("Helvetica", 12), text_color=COLORS["text_light"])
+        self._chart_placeholder.place(relx=0.5, rely=0.5, anchor="center")
+        self._map_bind_id = self._chart_container.bind("<Map>", self._on_chart_mapped)
 
     # ---- 卡片组件 ----
     def _create_card(self, parent, title, value, color, col):
@@ -385,12 +558,12 @@ class PocketTrackApp(ctk.CTk):
         bar = ctk.CTkFrame(card, fg_color=color, height=4, corner_radius=2)
         bar.pack(fill="x", padx=16, pady=(14, 8))
 
-        ctk.CTkLabel(card, text=title, font=("Helvetica", 11),
-                     text_color=COLORS["text_light"]).pack(anchor="w", padx=18)
+        title_lbl = ctk.CTkLabel(card, text=title, font=("Helvetica", 11), text_color=COLORS["text_light"])
+        title_lbl.pack(anchor="w", padx=18)
         val_lbl = ctk.CTkLabel(card, text=value, font=("Helvetica", 22, "bold"),
                                text_color=color)
         val_lbl.pack(anchor="w", padx=18, pady=(2, 14))
-        return val_lbl
+        return title_lbl, val_lbl
 
     # ================================================================
     #  图表 Tab 切换
@@ -402,32 +575,85 @@ class PocketTrackApp(ctk.CTk):
                 btn.configure(fg_color=COLORS["primary"], text_color="white")
             else:
                 btn.configure(fg_color="transparent", text_color=COLORS["text_light"])
+        self._span_selector.configure(state="disabled" if mode == "pie" else "normal")
+        self.refresh_ui(("chart",))
+
+    def _switch_span(self, label):
+        self.chart_span = self._span_labels[label]
+        self.refresh_ui(("chart",))
+
+    def _switch_period(self, label):
+        self.period = PERIOD_LABELS[label]
+        self._period_cache = None
         self.refresh_ui()
 
     # ================================================================
     #  事件处理
     # ================================================================
+    # 连续录入：新记录立即进入内存账本，列表顶部只插入这一行，卡片读增量聚合；
+    # 写日志和重绘图表推迟到停止提交 ENTRY_FLUSH_MS 之后的空闲时刻，合并成一次完成
     def on_submit(self, r_type):
         try:
             amt = float(self.amt_ent.get())
-            if amt <= 0:
+            if not (math.isfinite(amt) and amt > 0):
                 raise ValueError
-            self.db.add_record(r_type, amt, self.cat_combo.get(), self.note_ent.get())
-            self.amt_ent.delete(0, "end")
-            self.note_ent.delete(0, "end")
-            self.refresh_ui()
         except (ValueError, TypeError):
             messagebox.showerror("错误", "请输入有效的正数金额！")
+            return
+        with PERF.span("entry.submit"):
+            if not self._entry_pending:
+                self.db.defer_writes()
+                self._entry_pending = True
+            old_version = self.db.agg.version
+            record_id = self.db.add_record(r_type, amt, self.cat_combo.get(), self.note_ent.get())
+            self.amt_ent.delete(0, "end")
+            self.note_ent.delete(0, "end")
+            self.amt_ent.focus_set()
+            self._show_new_record(self.db.get_record(record_id), old_version)
+        if self._entry_flush_id is not None:
+            self.after_cancel(self._entry_flush_id)
+        self._entry_flush_id = self.after(ENTRY_FLUSH_MS, self._schedule_entry_flush)
+
+    def _schedule_entry_flush(self):
+        self._entry_flush_id = self.after_idle(self._flush_entries)
+
+    def _flush_entries(self):
+        self._entry_flush_id = None
+        self._entry_pending = False
+        with PERF.span("entry.flush"):
+            self.db.flush()
+            self._refresh_chart()
+
+    def _show_new_record(self, record, old_version):
+        self._add_period_stats(record, old_version)
+        self._refresh_cards()
+        if self._search_scheduler.busy:
+            # 后台搜索可能在新增之前就取了数据，按当前条件重新请求
+            self._search_scheduler.request(self._list_args())
+        elif self._list_matches(record):
+            if isinstance(self._list_source, list):  # SQLite 后端的列表是实时查询的视图
+                self._list_source.append((record["id"], record))
+            self._sync_list()
 
     def export_data(self):
-        path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV Files", "*.csv")])
-        if path:
-            with open(path, "w", newline="", encoding="utf-8-sig") as f:
-                writer = csv.writer(f)
-                writer.writerow(["时间", "类型", "分类", "金额", "备注"])
-                for r in self.db.data["records"]:
-                    writer.writerow([r["date"], r["type"], r["category"], r["amount"], r.get("note", "")])
-            messagebox.showinfo("成功", "账单已导出！")
+        ExportDialog(self)
+
+    def import_data(self):
+        path = filedialog.askopenfilename(filetypes=[("CSV / JSON", "*.csv *.json"), ("All Files", "*.*")])
+        if not path:
+            return
+        try:
+            added, skipped, errors = import_records(self.db, path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("错误", f"导入失败：{e}")
+            return
+        if added:
+            self.refresh_ui()
+        msg = f"新增 {added} 条，跳过重复 {skipped} 条"
+        if errors:
+            detail = "\n".join(f"第 {line} 行：{reason}" for line, reason in errors[:10])
+            msg += f"，{len(errors)} 行无效：\n{detail}"
+        messagebox.showinfo("导入完成", msg)
 
     def _show_ctx_menu(self, event):
         row = self.tree.identify_row(event.y)
@@ -435,166 +661,486 @@ class PocketTrackApp(ctk.CTk):
             self.tree.selection_set(row)
             self.ctx_menu.post(event.x_root, event.y_root)
 
+    # 列表行的 iid 就是记录 id：按 id 删除后只从列表里摘掉这一行，不重新过滤整个列表
     def _delete_selected(self):
         sel = self.tree.selection()
         if not sel:
             return
-        idx_str = self.tree.item(sel[0], "tags")
-        if idx_str:
-            real_idx = int(idx_str[-1])
-            if messagebox.askyesno("确认", "确定删除该记录？"):
-                self.db.delete_record(real_idx)
-                self.refresh_ui()
+        if messagebox.askyesno("确认", "确定删除该记录？"):
+            record_id = int(sel[0])
+            if self.db.delete_record(record_id):
+                self._remove_list_row(record_id)
+                self.refresh_ui(("cards", "chart"))
+
+    def _remove_list_row(self, record_id):
+        source = self._list_source
+        if isinstance(source, list):  # SQLite 后端的列表是实时查询的视图，不需要摘除
+            i = bisect.bisect_left(source, (record_id,))
+            if i < len(source) and source[i][0] == record_id:
+                del source[i]
+        if self._search_scheduler.busy:
+            # 正在计算的搜索结果可能还包含这一行，按当前搜索词重新请求
+            self._search_scheduler.request(self._list_args())
+        self._sync_list()
 
     # ================================================================
     #  刷新界面
     # ================================================================
-    def refresh_ui(self):
-        s_text = self.search_ent.get().strip()
-
-        # 全局统计 (卡片 + 图表不受搜索影响)
-        total_income, total_expense, all_cat_stats, all_indexed = self.db.get_stats("")
-        balance = total_income - total_expense
+    def refresh_ui(self, parts=("cards", "list", "chart")):
+        with PERF.span("refresh_ui"):
+            if "cards" in parts:
+                self._refresh_cards()
+            if "list" in parts:
+                # 同步刷新时丢弃尚未返回的后台搜索结果
+                self._search_scheduler.invalidate()
+                self._refresh_list(self._build_list_rows(self._list_args()))
+            if "chart" in parts:
+                self._refresh_chart()
+
+    def _refresh_cards(self):
+        # 卡片与图表不受搜索影响：余额始终是全部记录，收入/支出按所选区间，全部时间时直接读取增量聚合
+        agg = self.db.agg
+        balance = agg.income - agg.expense
+        total_income, total_expense, _ = self._period_stats()
+        prefix = "累计" if self.period == "all" else self.period_menu.get()
 
         self.lbl_balance.configure(text=f"￥{balance:.2f}")
+        self.lbl_income_title.configure(text=f"{prefix}收入")
+        self.lbl_expense_title.configure(text=f"{prefix}支出")
         self.lbl_income.configure(text=f"￥{total_income:.2f}")
         self.lbl_expense.configure(text=f"￥{total_expense:.2f}")
-
-        # 搜索仅影响列表
-        if s_text:
-            _, _, _, filtered = self.db.get_stats(s_text)
-        else:
-            filtered = all_indexed
-
-        # 图表始终使用全量数据
-        cat_stats = all_cat_stats
-        indexed = all_indexed
-
-        # ---- 更新列表 ----
-        for i in self.tree.get_children():
-            self.tree.delete(i)
-
-        display = list(reversed(filtered))
-        for row_idx, (real_idx, r) in enumerate(display):
-            prefix = "+" if r["type"] == "收入" else "-"
-            color_tag = "income_row" if r["type"] == "收入" else "expense_row"
-            alt_tag = "alt" if row_idx % 2 == 1 else ""
-            tags = (color_tag, alt_tag, str(real_idx))
-            self.tree.insert("", "end",
-                             values=(r["date"], r["category"], r.get("note", ""), f"{prefix}{r['amount']:.2f}"),
-                             tags=tags)
-
-        # ---- 更新图表 ----
-        self.fig.clear()
-        ax = self.fig.add_subplot(111)
-        ax.set_facecolor("white")
-        chart_colors = ["#4361EE", "#EF476F", "#FFD166", "#06D6A0", "#9B59B6", "#E67E22", "#1ABC9C"]
+        self._refresh_budget()
+
+    # 预算计数器随每次增删增量更新，这里只读取当前状态
+    def _refresh_budget(self):
+        lines, level = budget_lines(self.db.budget_status(), (self.db.budget.config or {}).get("period"))
+        if not lines:
+            if self._budget_shown:
+                self.lbl_budget.pack_forget()
+                self._budget_shown = False
+            return
+        self.lbl_budget.configure(text="\n".join(lines), text_color=LEVEL_COLORS[level])
+        if not self._budget_shown:
+            self.lbl_budget.pack(anchor="w", padx=18, pady=(0, 12))
+            self._budget_shown = True
+
+    # 所选区间的 (收入, 支出, 分类支出)；按日期索引查询，结果按聚合版本缓存，卡片和饼图共用
+    def _period_stats(self):
+        agg = self.db.agg
+        if self.period == "all":
+            return agg.income, agg.expense, agg.cat_expense
+        key = (agg.version, self.period)
+        cache = self._period_cache
+        if cache is None or cache[0] != key:
+            start, end = period_range(self.period)
+            income, expense, cat_map, _ = self.db.get_stats(start=start, end=end)
+            cache = self._period_cache = (key, (income, expense, cat_map))
+        return cache[1]
+
+    # 新记录落在缓存的区间统计内时直接累加，不重新查询
+    def _add_period_stats(self, record, old_version):
+        cache = self._period_cache
+        if cache is None or cache[0] != (old_version, self.period):
+            return
+        income, expense, cat_map = cache[1]
+        start, end = period_range(self.period)
+        if start <= record["date"][:10] <= end:
+            if record["type"] == "收入":
+                income += record["amount"]
+            else:
+                expense += record["amount"]
+                cat_map = dict(cat_map)
+                cat_map[record["category"]] = cat_map.get(record["category"], 0.0) + record["amount"]
+        self._period_cache = ((self.db.agg.version, self.period), (income, expense, cat_map))
+
+    # 记录是否符合列表当前显示的条件 (与 get_stats 的关键字匹配规则一致)
+    def _list_matches(self, r):
+        s_text, period = self._list_query or ("", "all")
+        start, end = period_range(period)
+        ft = s_text.lower()
+        return ((not ft or ft in r["category"].lower() or ft in r.get("note", "").lower())
+                and (start is None or start <= r["date"][:10] <= end))
+
+    # 列表的查询条件：(搜索词, 统计区间)
+    def _list_args(self):
+        return self.search_ent.get().strip(), self.period
+
+    # 过滤列表数据；可在后台线程执行，不触碰任何 Tk 控件。
+    # 连续输入时排在主线程写入后面等锁的旧查询，拿到锁后先确认没有被新的搜索取代
+    def _build_list_rows(self, args, cancelled=lambda: False):
+        s_text, period = args
+        start, end = period_range(period)
+        with self.db.lock:
+            if cancelled():
+                return None
+            _, _, _, filtered = self.db.get_stats(s_text, start=start, end=end)
+        return args, filtered
+
+    def _refresh_list(self, result):
+        args, source = result
+        if args != self._list_query:
+            # 新的搜索条件：回到第一页
+            self._list_query = args
+            self._list_limit = LIST_PAGE_SIZE
+            self.tree.yview_moveto(0)
+        self._list_source = source
+        self._sync_list()
+
+    # 返回 (差异键, 显示值, tags)；差异键含记录 id，内容被修改过的行也会重建。
+    # pos 为记录在结果中的位置 (最早的为 0)，斑马纹按它计算，顶部新增一行时其余行的样式不变
+    @staticmethod
+    def _format_row(pos, record_id, r):
+        prefix = "+" if r["type"] == "收入" else "-"
+        color_tag = "income_row" if r["type"] == "收入" else "expense_row"
+        alt_tag = "alt" if pos % 2 == 1 else ""
+        values = (r["date"], r["category"], r.get("note", ""), f"{prefix}{r['amount']:.2f}")
+        return (record_id, values, color_tag), values, (color_tag, alt_tag)
+
+    # 把当前窗口 (最新的 _list_limit 行) 与已显示的行做差异同步，只增删变化的行
+    def _sync_list(self):
+        with PERF.span("tree.sync"):
+            self._sync_list_rows()
+
+    def _sync_list_rows(self):
+        source = self._list_source
+        n = len(source)
+        count = min(n, self._list_limit)
+        window = source[n - count:] if count else []
+        new_rows = [self._format_row(n - 1 - row_idx, record_id, r)
+                    for row_idx, (record_id, r) in enumerate(reversed(window))]
+
+        old_items = self._list_items
+        matcher = difflib.SequenceMatcher(None, [it[0] for it in old_items],
+                                          [row[0] for row in new_rows], autojunk=False)
+        items = []
+        changed = 0
+        for op, i1, i2, j1, j2 in matcher.get_opcodes():
+            if op == "equal":
+                for (key, iid, old_tags), (_, _, tags) in zip(old_items[i1:i2], new_rows[j1:j2]):
+                    if tags != old_tags:
+                        self.tree.item(iid, tags=tags)
+                    items.append((key, iid, tags))
+                continue
+            if i2 > i1:
+                self.tree.delete(*[it[1] for it in old_items[i1:i2]])
+            for key, values, tags in new_rows[j1:j2]:
+                iid = self.tree.insert("", len(items), iid=str(key[0]), values=values, tags=tags)
+                items.append((key, iid, tags))
+            changed += (i2 - i1) + (j2 - j1)
+        self._list_items = items
+        PERF.observe("tree.rows_changed", changed)
+
+    def _on_tree_scroll(self, first, last):
+        self._tree_sb.set(first, last)
+        if (float(last) >= 0.9 and not self._list_loading
+                and len(self._list_items) < len(self._list_source)):
+            self._list_loading = True
+            self.after_idle(self._load_more_rows)
+
+    def _load_more_rows(self):
+        self._list_loading = False
+        self._list_limit += LIST_PAGE_SIZE
+        self._sync_list()
+
+    # 主线程只从增量聚合取图表数据 (很便宜)，绘制与光栅化交给绘图线程；
+    # 数据和画布尺寸都没变时不发请求
+    def _refresh_chart(self):
+        if not self._chart_ready:
+            return  # 首次绘制由 _on_first_paint 负责
         mode = self.chart_mode
-
-        if mode == "pie":
-            if cat_stats:
-                labels = list(cat_stats.keys())
-                sizes = list(cat_stats.values())
-                total = sum(sizes)
-                wedges, _, _ = ax.pie(
-                    sizes, labels=None, autopct="", startangle=140,
-                    colors=chart_colors[:len(labels)],
-                    wedgeprops={"width": 0.42, "edgecolor": "white", "linewidth": 2.5},
-                    pctdistance=0.78,
-                )
-                ax.text(0, 0, f"￥{total:.0f}", ha="center", va="center",
-                        fontsize=16, fontweight="bold", color=COLORS["text"])
-                ax.text(0, -0.25, "总支出", ha="center", va="center",
-                        fontsize=9, color=COLORS["text_light"])
-                legend_labels = [f"{l}  ￥{s:.0f} ({s/total*100:.1f}%)" for l, s in zip(labels, sizes)]
-                ax.legend(wedges, legend_labels, loc="lower center",
-                          bbox_to_anchor=(0.5, -0.12), fontsize=8, frameon=False, ncol=2)
+        agg = self.db.agg
+        version = (agg.version, self.period if mode == "pie" else self.chart_span)
+        cached = self._chart_data.get(mode)
+        if cached is None or cached[0] != version:
+            if mode == "pie" and self.period != "all":
+                data = tuple(self._period_stats()[2].items())
             else:
-                ax.text(0.5, 0.5, "暂无支出数据", ha="center", va="center",
-                        fontsize=13, color=COLORS["text_light"], transform=ax.transAxes)
-                ax.axis("off")
-
-        elif mode == "bar":
-            daily = defaultdict(float)
-            for _, r in indexed:
-                if r["type"] == "支出":
-                    daily[r["date"][:10]] += r["amount"]
-            if daily:
-                sorted_days = sorted(daily.keys())[-7:]
-                amounts = [daily[d] for d in sorted_days]
-                short_labels = [d[5:] for d in sorted_days]
-                bars = ax.bar(short_labels, amounts, color=COLORS["primary"], width=0.55,
-                              edgecolor="white", linewidth=0.8, zorder=3)
-                for bar, val in zip(bars, amounts):
-                    ax.text(bar.get_x() + bar.get_width() / 2, bar.get_height() + max(amounts) * 0.03,
-                            f"￥{val:.0f}", ha="center", va="bottom", fontsize=8, color=COLORS["text"])
-                ax.set_ylabel("支出 (￥)", fontsize=9, color=COLORS["text_light"])
-                self._style_bar_axes(ax)
+                data = chart_series(agg, mode, self.chart_span)
+            cached = self._chart_data[mode] = (version, data)
+        width, height = self._chart_canvas.winfo_width(), self._chart_canvas.winfo_height()
+        if width <= 1 or height <= 1:
+            return  # 还没有布局，<Configure> 时再请求
+        request = (mode, cached[1], width, height)
+        if request != self._chart_shown:
+            self._chart_scheduler.request(request)
+
+    # 绘图线程：只读 request，不碰 Tk 控件
+    def _render_chart(self, request, cancelled):
+        mode, data, width, height = request
+        with PERF.span("chart.render"):
+            image = self._chart_renderer.render(mode, data, width, height, cancelled)
+        return None if image is None else (request, image)
+
+    # 主线程：把 RGBA 像素贴到画布上；尺寸不变时复用同一个 PhotoImage
+    def _show_chart(self, result):
+        from PIL import Image, ImageTk
+        request, (width, height, rgba) = result
+        with PERF.span("chart.blit"):
+            image = Image.frombuffer("RGBA", (width, height), rgba, "raw", "RGBA", 0, 1)
+            photo = self._chart_image
+            if photo is not None and (photo.width(), photo.height()) == (width, height):
+                photo.paste(image)
             else:
-                ax.text(0.5, 0.5, "暂无支出记录", ha="center", va="center",
-                        fontsize=13, color=COLORS["text_light"], transform=ax.transAxes)
-                ax.axis("off")
-
-        elif mode == "compare":
-            daily_in = defaultdict(float)
-            daily_out = defaultdict(float)
-            all_days = set()
-            for _, r in indexed:
-                day = r["date"][:10]
-                all_days.add(day)
-                if r["type"] == "收入":
-                    daily_in[day] += r["amount"]
+                self._chart_image = ImageTk.PhotoImage(image)
+                if self._chart_item is None:
+                    self._chart_item = self._chart_canvas.create_image(0, 0, anchor="nw", image=self._chart_image)
                 else:
-                    daily_out[day] += r["amount"]
-            if all_days:
-                sorted_days = sorted(all_days)[-7:]
-                incomes = [daily_in.get(d, 0) for d in sorted_days]
-                expenses = [daily_out.get(d, 0) for d in sorted_days]
-                short_labels = [d[5:] for d in sorted_days]
-                x = np.arange(len(sorted_days))
-                w = 0.32
-                ax.bar(x - w / 2, incomes, w, label="收入", color=COLORS["income"], edgecolor="white", zorder=3)
-                ax.bar(x + w / 2, expenses, w, label="支出", color=COLORS["expense"], edgecolor="white", zorder=3)
-                ax.set_xticks(x)
-                ax.set_xticklabels(short_labels, fontsize=8)
-                ax.legend(fontsize=8, frameon=False, loc="upper right")
-                ax.set_ylabel("金额 (￥)", fontsize=9, color=COLORS["text_light"])
-                self._style_bar_axes(ax)
-            else:
-                ax.text(0.5, 0.5, "暂无记录数据", ha="center", va="center",
-                        fontsize=13, color=COLORS["text_light"], transform=ax.transAxes)
-                ax.axis("off")
-
-        self.fig.tight_layout()
-        if mode == "pie" and cat_stats:
-            # 给图例留出空间，避免小窗口被裁切
-            self.fig.subplots_adjust(bottom=0.26)
-        self.canvas.draw()
-        self.ax = ax
-
-    def _style_bar_axes(self, ax):
-        ax.spines["top"].set_visible(False)
-        ax.spines["right"].set_visible(False)
-        ax.spines["left"].set_color(COLORS["border"])
-        ax.spines["bottom"].set_color(COLORS["border"])
-        ax.tick_params(colors=COLORS["text_light"], labelsize=8)
-        ax.yaxis.set_major_formatter(mticker.FormatStrFormatter("%.0f"))
-        ax.set_axisbelow(True)
-        ax.yaxis.grid(True, linestyle="--", alpha=0.3, color=COLORS["border"])
+                    self._chart_canvas.itemconfigure(self._chart_item, image=self._chart_image)
+        self._chart_shown = request
+        if self._chart_placeholder is not None:
+            self._chart_placeholder.destroy()
+            self._chart_placeholder = None
+            STARTUP.mark("first_chart")
+            STARTUP.report()
+
+
+# ---------- 导出对话框 ----------
+# 对话框表单的一行：左侧标签，右侧输入控件
+def _form_field(form, row, label, widget):
+    ctk.CTkLabel(form, text=label, font=("Helvetica", 11),
+                 text_color=COLORS["text_light"]).grid(row=row, column=0, sticky="w", padx=(0, 10), pady=4)
+    widget.grid(row=row, column=1, sticky="ew", pady=4)
+    return widget
+
+
+# 选择过滤条件后在后台线程流式导出，进度经队列回到主线程显示，可随时取消
+class ExportDialog(ctk.CTkToplevel):
+    ALL = "全部"
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.app = app
+        self.title("导出 CSV 账单")
+        self.resizable(False, False)
+        self.transient(app)
+        self._messages = queue.Queue()
+        self._cancel = threading.Event()
+        self._worker = None
+
+        form = ctk.CTkFrame(self, fg_color="transparent")
+        form.pack(fill="both", padx=18, pady=(16, 8))
+        form.grid_columnconfigure(1, weight=1)
+
+        categories = list(dict.fromkeys(CATEGORIES["支出"] + CATEGORIES["收入"]))
+        self.start_ent = _form_field(form, 0, "开始日期", ctk.CTkEntry(form, placeholder_text="YYYY-MM-DD"))
+        self.end_ent = _form_field(form, 1, "结束日期", ctk.CTkEntry(form, placeholder_text="YYYY-MM-DD"))
+        self.type_combo = _form_field(form, 2, "类型", ctk.CTkComboBox(
+            form, values=[self.ALL, "支出", "收入"], state="readonly"))
+        self.cat_combo = _form_field(form, 3, "分类", ctk.CTkComboBox(
+            form, values=[self.ALL] + categories, state="readonly"))
+        self.text_ent = _form_field(form, 4, "搜索", ctk.CTkEntry(form, placeholder_text="分类/备注关键字"))
+        self.min_ent = _form_field(form, 5, "最小金额", ctk.CTkEntry(form, placeholder_text="不限"))
+        self.max_ent = _form_field(form, 6, "最大金额", ctk.CTkEntry(form, placeholder_text="不限"))
+        self.type_combo.set(self.ALL)
+        self.cat_combo.set(self.ALL)
+        # 默认沿用主界面当前的搜索词和统计区间
+        search = app.search_ent.get().strip()
+        if search:
+            self.text_ent.insert(0, search)
+        start, end = period_range(app.period)
+        if start:
+            self.start_ent.insert(0, start)
+            self.end_ent.insert(0, end)
+
+        self.progress = ctk.CTkProgressBar(self)
+        self.progress.set(0)
+        self.progress.pack(fill="x", padx=18, pady=(4, 2))
+        self.status = ctk.CTkLabel(self, text="", font=("Helvetica", 11), text_color=COLORS["text_light"])
+        self.status.pack(anchor="w", padx=18)
+
+        btns = ctk.CTkFrame(self, fg_color="transparent")
+        btns.pack(fill="x", padx=18, pady=(6, 16))
+        self.cancel_btn = ctk.CTkButton(btns, text="取消", width=90, fg_color="#34495E",
+                                        hover_color="#4A6278", command=self._on_cancel)
+        self.cancel_btn.pack(side="right")
+        self.export_btn = ctk.CTkButton(btns, text="导出", width=90, fg_color=COLORS["primary"],
+                                        hover_color=COLORS["primary_hover"], command=self._on_export)
+        self.export_btn.pack(side="right", padx=(0, 8))
+        self.protocol("WM_DELETE_WINDOW", self._on_cancel)
+
+    def _read_filter(self):
+        start, end = self.start_ent.get().strip() or None, self.end_ent.get().strip() or None
+        try:
+            for value in (start, end):
+                if value:
+                    datetime.strptime(value, "%Y-%m-%d")
+        except ValueError:
+            raise ValueError("日期格式应为 YYYY-MM-DD！") from None
+        r_type = self.type_combo.get()
+        category = self.cat_combo.get()
+        min_text, max_text = self.min_ent.get().strip(), self.max_ent.get().strip()
+        try:
+            min_amount = float(min_text) if min_text else None
+            max_amount = float(max_text) if max_text else None
+        except ValueError:
+            raise ValueError("金额范围应为数字！") from None
+        return {
+            "start": start, "end": end,
+            "r_type": None if r_type == self.ALL else r_type,
+            "categories": None if category == self.ALL else [category],
+            "min_amount": min_amount, "max_amount": max_amount,
+            "text": self.text_ent.get().strip(),
+        }
+
+    def _on_export(self):
+        try:
+            flt = self._read_filter()
+        except ValueError as e:
+            messagebox.showerror("错误", str(e), parent=self)
+            return
+        path = filedialog.asksaveasfilename(parent=self, defaultextension=".csv",
+                                            filetypes=[("CSV Files", "*.csv")])
+        if not path:
+            return
+        self.export_btn.configure(state="disabled")
+        self._worker = threading.Thread(target=self._run, args=(path, flt), daemon=True)
+        self._worker.start()
+        self.after(50, self._poll)
+
+    def _run(self, path, flt):
+        written = [0]
+
+        # 每扫描一批报告一次进度；过滤条件很窄时也能及时响应取消。
+        # total 是实际要扫描的条数 (有日期范围时只是范围内的记录)
+        def on_batch(scanned, total):
+            if self._cancel.is_set():
+                raise ExportCancelled
+            self._messages.put(("progress", scanned / max(total, 1), written[0]))
+
+        def on_written(n):
+            written[0] = n
+
+        try:
+            records = self.app.db.iter_records(on_batch=on_batch, **flt)
+            count = export_csv(path, records, cancelled=self._cancel.is_set, progress=on_written)
+            self._messages.put(("done", count) if count is not None else ("cancelled",))
+        except Exception as e:
+            self._messages.put(("error", e))
+
+    def _poll(self):
+        while True:
+            try:
+                msg = self._messages.get_nowait()
+            except queue.Empty:
+                break
+            if msg[0] == "progress":
+                self.progress.set(min(msg[1], 1.0))
+                self.status.configure(text=f"已写入 {msg[2]} 条")
+            elif msg[0] == "done":
+                self.progress.set(1.0)
+                messagebox.showinfo("成功", f"账单已导出！共 {msg[1]} 条", parent=self.app)
+                self.destroy()
+                return
+            elif msg[0] == "cancelled":
+                self.destroy()
+                return
+            elif msg[0] == "error":
+                messagebox.showerror("错误", f"导出失败：{msg[1]}", parent=self)
+                self.export_btn.configure(state="normal")
+                self._worker = None
+                return
+        self.after(50, self._poll)
+
+    def _on_cancel(self):
+        if self._worker is not None and self._worker.is_alive():
+            self._cancel.set()
+            self.status.configure(text="正在取消...")
+        else:
+            self.destroy()
+
+
+# ---------- 预算设置 ----------
+# 总预算和各支出分类的预算，留空表示不限；全部留空则清除预算
+class BudgetDialog(ctk.CTkToplevel):
+    def __init__(self, app):
+        super().__init__(app)
+        self.app = app
+        self.title("预算设置")
+        self.resizable(False, False)
+        self.transient(app)
+
+        form = ctk.CTkFrame(self, fg_color="transparent")
+        form.pack(fill="both", padx=18, pady=(16, 8))
+        form.grid_columnconfigure(1, weight=1)
+
+        budget = normalize_budget(app.db.budget.config) or {"period": "month", "total": None,
+                                                            "categories": {}, "warn": 0.8}
+        self.period_combo = _form_field(form, 0, "周期", ctk.CTkComboBox(
+            form, values=list(BUDGET_PERIOD_LABELS), state="readonly"))
+        self.period_combo.set(next(k for k, v in BUDGET_PERIOD_LABELS.items() if v == budget["period"]))
+        self.total_ent = _form_field(form, 1, "总预算", ctk.CTkEntry(form, placeholder_text="不限"))
+        self.warn_ent = _form_field(form, 2, "提醒比例 %", ctk.CTkEntry(form))
+        self.warn_ent.insert(0, f"{budget['warn'] * 100:g}")
+        if budget["total"] is not None:
+            self.total_ent.insert(0, f"{budget['total']:g}")
+        self.cat_ents = {}
+        for row, cat in enumerate(CATEGORIES["支出"], start=3):
+            ent = _form_field(form, row, cat, ctk.CTkEntry(form, placeholder_text="不限"))
+            if cat in budget["categories"]:
+                ent.insert(0, f"{budget['categories'][cat]:g}")
+            self.cat_ents[cat] = ent
+
+        btns = ctk.CTkFrame(self, fg_color="transparent")
+        btns.pack(fill="x", padx=18, pady=(6, 16))
+        ctk.CTkButton(btns, text="取消", width=90, fg_color="#34495E", hover_color="#4A6278",
+                      command=self.destroy).pack(side="right")
+        ctk.CTkButton(btns, text="保存", width=90, fg_color=COLORS["primary"],
+                      hover_color=COLORS["primary_hover"], command=self._on_save).pack(side="right", padx=(0, 8))
+
+    def _read_budget(self):
+        try:
+            total = self.total_ent.get().strip()
+            categories = {cat: float(ent.get()) for cat, ent in self.cat_ents.items() if ent.get().strip()}
+            warn = float(self.warn_ent.get().strip() or 80) / 100
+            total = float(total) if total else None
+        except ValueError:
+            raise ValueError("预算金额和提醒比例应为数字！") from None
+        if total is None and not categories:
+            return None
+        return {"period": BUDGET_PERIOD_LABELS[self.period_combo.get()], "total": total,
+                "categories": categories, "warn": warn}
+
+    def _on_save(self):
+        try:
+            self.app.db.set_budget(self._read_budget())
+        except ValueError as e:
+            messagebox.showerror("错误", str(e), parent=self)
+            return
+        self.app.refresh_ui(("cards",))
+        self.destroy()
+
+
+# ---------- 性能面板 ----------
+# 开启埋点 (POCKETTRACK_PROFILE 或 --profile) 后按 F12 打开，每秒刷新各项的滚动分位数
+class DebugPanel(ctk.CTkToplevel):
+    INTERVAL_MS = 1000
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.title("性能面板 (ms)")
+        self.geometry("620x360")
+        self.transient(app)
+        self.text = ctk.CTkTextbox(self, font=("Courier", 12), wrap="none")
+        self.text.pack(fill="both", expand=True, padx=8, pady=8)
+        self._update()
+
+    def _update(self):
+        self.text.configure(state="normal")
+        self.text.delete("1.0", "end")
+        self.text.insert("1.0", PERF.format_summary())
+        self.text.configure(state="disabled")
+        self.after(self.INTERVAL_MS, self._update)
 
 
 # ================================================================
 #  启动
 # ================================================================
 if __name__ == "__main__":
-    import platform
-    if platform.system() == "Darwin":
-        plt.rcParams["font.sans-serif"] = ["PingFang SC", "Heiti TC", "STHeiti"]
-    elif platform.system() == "Windows":
-        plt.rcParams["font.sans-serif"] = ["SimHei", "Microsoft YaHei"]
-    else:
-        plt.rcParams["font.sans-serif"] = ["WenQuanYi Micro Hei", "Noto Sans CJK SC"]
-    plt.rcParams["axes.unicode_minus"] = False
-
+    # 与命令行一致：--profile 等价于 POCKETTRACK_PROFILE=1，--profile-out=PATH 同时写出分析文件
+    for arg in sys.argv[1:]:
+        if arg == "--profile":
+            PERF.configure("1")
+        elif arg.startswith("--profile-out="):
+            PERF.configure(arg.partition("=")[2])
     app = PocketTrackApp()
     app.mainloop()
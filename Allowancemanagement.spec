@@ -16,19 +16,17 @@ a = Analysis(
 )
 pyz = PYZ(a.pure)
 
+# onedir: 启动时不再把所有依赖解压到临时目录，冷启动明显更快
 exe = EXE(
     pyz,
     a.scripts,
-    a.binaries,
-    a.datas,
     [],
+    exclude_binaries=True,
     name='Allowancemanagement',
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
     upx=True,
-    upx_exclude=[],
-    runtime_tmpdir=None,
     console=False,
     disable_windowed_traceback=False,
     argv_emulation=False,
@@ -36,8 +34,17 @@ exe = EXE(
     codesign_identity=None,
     entitlements_file=None,
 )
-app = BUNDLE(
+coll = COLLECT(
     exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=True,
+    upx_exclude=[],
+    name='Allowancemanagement',
+)
+app = BUNDLE(
+    coll,
     name='Allowancemanagement.app',
     icon=None,
     bundle_identifier=None,
@@ -0,0 +1,361 @@
+# PocketTrack 基准测试：生成合成账本，对 DataManager 与界面刷新的热路径计时。
+# 结果以 JSON 输出 (stdout 或 -o 文件)，可与另一次提交的结果比较，发现性能回归。
+#
+#   python benchmarks/bench_ledger.py                               # 10k / 100k，journal 后端
+#   python benchmarks/bench_ledger.py --sizes 10k,100k,1m -o after.json
+#   python benchmarks/bench_ledger.py --backend sqlite --compare before.json --threshold 1.25
+#
+# --compare 时任一项中位数比基线慢超过阈值倍数，退出码为 1，便于接入 CI。
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+import warnings
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pocket_core import (BINARY_EXT, CATEGORIES, BinaryStorage, JournalStorage, MappedLedger,  # noqa: E402
+                         chart_series, open_ledger)
+
+# ---------- 合成账本 ----------
+# 分类权重、金额量级、备注词表大致模拟真实的零花钱账本：支出为主，餐饮/零食最频繁
+EXPENSE_PROFILE = {
+    "餐饮": (30, 18, ["午饭", "晚饭", "早餐", "外卖", "食堂", "聚餐", "奶茶", "咖啡"]),
+    "文具": (8, 12, ["笔记本", "中性笔", "文件夹", "练习册", "橡皮", "尺子"]),
+    "零食": (20, 8, ["薯片", "饮料", "巧克力", "冰淇淋", "水果", "面包"]),
+    "交通": (12, 6, ["公交", "地铁", "打车", "共享单车", "加油"]),
+    "娱乐": (8, 45, ["电影", "游戏充值", "KTV", "桌游", "演唱会"]),
+    "购物": (10, 80, ["衣服", "鞋", "耳机", "书", "日用品", "礼物"]),
+    "其他": (5, 25, ["理发", "打印", "快递", "捐款", ""]),
+}
+INCOME_PROFILE = {
+    "红包": (15, 100, ["春节红包", "生日红包", "压岁钱"]),
+    "奖励": (15, 50, ["考试奖励", "竞赛奖金", "家务奖励"]),
+    "零花钱": (50, 120, ["周零花钱", "月零花钱"]),
+    "兼职": (12, 150, ["家教", "发传单", "暑期工"]),
+    "利息": (3, 2, ["余额宝", "银行利息"]),
+    "其他": (5, 30, ["退款", "卖二手", ""]),
+}
+EXPENSE_SHARE = 0.85
+BASE_DATE = datetime(2024, 1, 1)
+
+
+def _check_profiles():
+    for r_type, profile in (("支出", EXPENSE_PROFILE), ("收入", INCOME_PROFILE)):
+        if sorted(profile) != sorted(CATEGORIES[r_type]):
+            raise SystemExit(f"基准分类表与 CATEGORIES[{r_type}] 不一致，请同步 EXPENSE/INCOME_PROFILE")
+
+
+# 按日期递增生成 n 条记录；固定种子保证每次结果一致
+def make_records(n, seed=42):
+    rng = random.Random(seed)
+    tables = {}
+    for r_type, profile in (("支出", EXPENSE_PROFILE), ("收入", INCOME_PROFILE)):
+        cats = list(profile)
+        tables[r_type] = (cats, [profile[c][0] for c in cats], profile)
+    per_day = max(1, n // 730)  # 大约两年的数据
+    records = []
+    for i in range(n):
+        r_type = "支出" if rng.random() < EXPENSE_SHARE else "收入"
+        cats, weights, profile = tables[r_type]
+        cat = rng.choices(cats, weights)[0]
+        _, scale, notes = profile[cat]
+        when = BASE_DATE + timedelta(days=i // per_day, minutes=rng.randrange(7 * 60, 23 * 60))
+        records.append({
+            "date": when.strftime("%Y-%m-%d %H:%M"),
+            "type": r_type,
+            "amount": round(rng.lognormvariate(0, 0.6) * scale, 2),
+            "category": cat,
+            "note": rng.choice(notes),
+        })
+    return records
+
+
+def write_ledger(path, records):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"records": records}, f, indent=2, ensure_ascii=False)
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    for suffix, mul in (("m", 1_000_000), ("k", 1_000)):
+        if text.endswith(suffix):
+            return int(float(text[:-1]) * mul)
+    return int(text)
+
+
+# ---------- 计时 ----------
+# 先跑一次预热，再跑 repeat 次；返回每次的单次操作耗时 (秒)
+def measure(fn, repeat, ops=1, setup=None):
+    samples = []
+    for i in range(repeat + 1):
+        if setup is not None:
+            setup()
+        t = time.perf_counter()
+        fn()
+        elapsed = (time.perf_counter() - t) / ops
+        if i:
+            samples.append(elapsed)
+    return samples
+
+
+class Suite:
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = []
+
+    def run(self, name, size, backend, fn, ops=1, setup=None, repeat=None):
+        samples = measure(fn, repeat or self.repeat, ops, setup)
+        result = {"name": name, "size": size, "backend": backend, "ops": ops,
+                  "runs": len(samples), "min": min(samples), "median": statistics.median(samples)}
+        self.results.append(result)
+        print(f"  {name:<32} {result['median'] * 1000:>10.3f} ms  (min {result['min'] * 1000:.3f})",
+              file=sys.stderr)
+        return result
+
+
+# ---------- DataManager ----------
+def bench_data_manager(suite, size, backend, workdir, records, ops):
+    path = os.path.join(workdir, f"ledger_{size}.json")
+    write_ledger(path, records)
+    db = open_ledger(path, backend)  # sqlite / binary 后端在这里完成一次性迁移
+    db.close()
+
+    if backend == "journal":
+        suite.run("load", size, backend, lambda: JournalStorage(path).load())
+    elif backend == "binary":
+        ptl = os.path.splitext(path)[0] + BINARY_EXT
+        suite.run("load", size, backend, lambda: BinaryStorage(ptl).load())
+        suite.run("load[mmap]", size, backend, lambda: MappedLedger(ptl).close())
+    suite.run("open", size, backend, lambda: open_ledger(path, backend).close())
+
+    db = open_ledger(path, backend)
+    try:
+        suite.run("save", size, backend, db.save)
+
+        day = (BASE_DATE + timedelta(days=800)).strftime("%Y-%m-%d 12:00")
+
+        def add_many():
+            for _ in range(ops):
+                db.add_record("支出", 12.5, "餐饮", "基准测试", date=day)
+        suite.run("add_record", size, backend, add_many, ops=ops)
+
+        # 连续录入：持久化推迟到最后一次 flush
+        def add_deferred():
+            db.defer_writes()
+            add_many()
+            db.flush()
+        suite.run("add_record[deferred]", size, backend, add_deferred, ops=ops)
+
+        # 设置预算后每次增删只累加当前周期的计数器并判定受影响的两项，耗时不应随账本变大
+        db.set_budget({"period": "month", "total": 5000.0, "categories": {"餐饮": 800.0}})
+        today = datetime.now().strftime("%Y-%m-%d 12:00")
+
+        def add_budgeted():
+            for _ in range(ops):
+                db.add_record("支出", 12.5, "餐饮", "基准测试", date=today)
+                db.budget_alerts()
+        suite.run("add_record[budget]", size, backend, add_budgeted, ops=ops)
+        suite.run("budget.init", size, backend, db._init_budget)
+
+        # 另一个实例 (相当于另一个进程) 读入变更：没有变化时只读锁文件，有变化时只读新增的日志条目
+        peer = open_ledger(path, backend)
+        try:
+            suite.run("refresh[idle]", size, backend, peer.refresh)
+            suite.run("refresh[one add]", size, backend, peer.refresh,
+                      setup=lambda: db.add_record("支出", 12.5, "餐饮", "基准测试", date=day))
+        finally:
+            peer.close()
+
+        def delete_many():
+            for _ in range(ops):
+                db.delete_record(db.data["records"][len(db.data["records"]) // 2]["id"])
+        suite.run("delete_record", size, backend, delete_many, ops=ops)
+
+        suite.run("get_stats", size, backend, lambda: db.get_stats(""))
+        suite.run("get_stats[category]", size, backend, lambda: db.get_stats("餐饮"))
+        suite.run("get_stats[note]", size, backend, lambda: db.get_stats("奶茶"))
+        suite.run("get_stats[rare]", size, backend, lambda: db.get_stats("演唱会"))
+        # 单月区间：日期索引二分定位，耗时只与当月记录数有关
+        month = (BASE_DATE + timedelta(days=400)).strftime("%Y-%m")
+        suite.run("query[month]", size, backend, lambda: db.query(start=f"{month}-01", end=f"{month}-31"))
+        suite.run("get_stats[month]", size, backend,
+                  lambda: db.get_stats(start=f"{month}-01", end=f"{month}-31"))
+        if hasattr(db, "_columns"):
+            # 列式存储在第一次过滤时才构建，单独测一次冷启动代价
+            def drop_columns():
+                db._columns = None
+            suite.run("get_stats[note,cold]", size, backend, lambda: db.get_stats("奶茶"),
+                      setup=drop_columns)
+        bench_refresh(suite, size, backend, db, workdir)
+    finally:
+        db.close()
+
+
+# ---------- 界面刷新 (离屏) ----------
+# 不创建窗口：列表部分复用 PocketTrackApp 的取数与行格式化，图表部分用界面绘图线程里的同一个
+# ChartRenderer 在 Agg 画布上光栅化。Treeview 的插入/删除和位图贴到画布上必须有显示器，不在测量范围内。
+def _load_gui():
+    try:
+        import Allowancemanagement as gui
+    except Exception as e:  # 没有 customtkinter 时跳过列表部分
+        print(f"  (跳过列表刷新基准：{e})", file=sys.stderr)
+        return None
+    return gui
+
+
+def _load_charts():
+    try:
+        import pocket_charts
+        pocket_charts.load_matplotlib()
+    except Exception as e:  # 没有 matplotlib 时只跑核心部分
+        print(f"  (跳过图表基准：{e})", file=sys.stderr)
+        return None
+    # 服务器上通常没有中文字体，缺字形的警告与 findfont 日志会淹没结果
+    warnings.filterwarnings("ignore", message="Glyph .* missing from")
+    logging.getLogger("matplotlib.font_manager").setLevel(logging.ERROR)
+    return pocket_charts
+
+
+def bench_refresh(suite, size, backend, db, workdir):
+    gui = _load_gui()
+    if gui is not None:
+        app_cls = gui.PocketTrackApp
+        host = types.SimpleNamespace(db=db)
+
+        def list_fill(text):
+            # 与 _sync_list 相同：取最新一页，倒序格式化
+            _, source = app_cls._build_list_rows(host, (text, "all"))
+            window = source[-gui.LIST_PAGE_SIZE:]
+            return [app_cls._format_row(row_idx, record_id, r)
+                    for row_idx, (record_id, r) in enumerate(reversed(window))]
+
+        suite.run("refresh.list_fill", size, backend, lambda: list_fill(""))
+        suite.run("refresh.list_fill[note]", size, backend, lambda: list_fill("奶茶"))
+
+    charts = _load_charts()
+    if charts is None:
+        return
+    for mode in ("pie", "bar", "compare"):
+        suite.run(f"refresh.chart_series[{mode}]", size, backend, lambda: chart_series(db.agg, mode))
+        data = chart_series(db.agg, mode)
+        renderer = charts.ChartRenderer()
+
+        def fresh_renderer():
+            renderer._charts.clear()
+        suite.run(f"refresh.chart_build[{mode}]", size, backend,
+                  lambda: renderer.render(mode, data, 500, 400), setup=fresh_renderer)
+
+        # 与录入一条记录后相同：数据结构不变，原地更新图元后重新光栅化
+        bumped = _bump_last(data)
+        renderer.render(mode, data, 500, 400)
+        frames = [bumped, data]
+
+        def update():
+            frames.reverse()
+            renderer.render(mode, frames[0], 500, 400)
+        suite.run(f"refresh.chart_update[{mode}]", size, backend, update)
+
+    # 长时间范围的趋势图读周/月汇总，耗时应与记录数无关
+    for span in ("30d", "12m", "all"):
+        suite.run(f"refresh.chart_series[compare:{span}]", size, backend,
+                  lambda: chart_series(db.agg, "compare", span))
+
+    # 无界面报表：渲染一次，分别写出三种格式
+    for fmt in charts.REPORT_FORMATS:
+        path = os.path.join(workdir, f"report_{size}.{fmt}")
+        suite.run(f"report.export[{fmt}]", size, backend,
+                  lambda: charts.export_report(db, [path], span="12m"), repeat=3)
+
+
+# 最后一项金额加一，用于测原地更新
+def _bump_last(data):
+    if not data:
+        return data
+    last = data[-1]
+    return data[:-1] + ((last[0], last[1] + 1) + tuple(last[2:]),)
+
+
+# ---------- 结果 ----------
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {(r["name"], r["size"], r["backend"]): r for r in json.load(f)["results"]}
+    regressions = []
+    for r in results:
+        base = baseline.get((r["name"], r["size"], r["backend"]))
+        if base is None or not base["median"]:
+            continue
+        ratio = r["median"] / base["median"]
+        if ratio > threshold:
+            regressions.append((r, base, ratio))
+    for r, base, ratio in regressions:
+        print(f"回归: {r['name']} size={r['size']} {r['backend']}  "
+              f"{base['median'] * 1000:.3f} -> {r['median'] * 1000:.3f} ms (x{ratio:.2f})", file=sys.stderr)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PocketTrack 基准测试")
+    parser.add_argument("--sizes", default="10k,100k", help="逗号分隔，如 10k,100k,1m")
+    parser.add_argument("--backend", default="journal", choices=["journal", "binary", "sqlite"])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--ops", type=int, default=200, help="add_record / delete_record 每轮操作数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("-o", "--output", help="结果 JSON 文件 (默认输出到 stdout)")
+    parser.add_argument("--compare", help="基线结果 JSON")
+    parser.add_argument("--threshold", type=float, default=1.25, help="中位数慢于基线的倍数阈值")
+    args = parser.parse_args(argv)
+    _check_profiles()
+
+    sizes = [parse_size(s) for s in args.sizes.split(",") if s.strip()]
+    suite = Suite(args.repeat)
+    with tempfile.TemporaryDirectory(prefix="pocket_bench_") as workdir:
+        for size in sizes:
+            print(f"[{size} 条, {args.backend}]", file=sys.stderr)
+            t = time.perf_counter()
+            records = make_records(size, args.seed)
+            print(f"  (生成数据 {time.perf_counter() - t:.1f}s)", file=sys.stderr)
+            bench_data_manager(suite, size, args.backend, workdir, records, args.ops)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sizes": sizes, "backend": args.backend, "repeat": args.repeat,
+            "ops": args.ops, "seed": args.seed,
+        },
+        "results": suite.results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        return 1 if compare(suite.results, args.compare, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
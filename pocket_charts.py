@@ -0,0 +1,349 @@
+# PocketTrack 图表：只用 matplotlib 的 Figure + Agg 画布，不依赖 Tk / pyplot。
+# 界面在后台线程里用 ChartRenderer 光栅化后贴到画布上；命令行用 export_report 在没有显示器的
+# 服务器上批量导出 PNG / SVG / PDF 报表。
+#
+#   renderer = ChartRenderer()
+#   width, height, rgba = renderer.render("bar", chart_series(db.agg, "bar", "30d"), 600, 400)
+#   export_report(db, ["report.png", "report.pdf"], period="month", span="30d")
+import os
+import threading
+
+from pocket_core import PERF, chart_series, period_range
+
+# 与界面主题一致
+COLORS = {
+    "primary": "#4361EE",
+    "income": "#06D6A0",
+    "expense": "#EF476F",
+    "warning": "#F4A261",
+    "text": "#1A1A2E",
+    "text_light": "#8D99AE",
+    "border": "#DEE2E6",
+}
+PIE_COLORS = ["#4361EE", "#EF476F", "#FFD166", "#06D6A0", "#9B59B6", "#E67E22", "#1ABC9C"]
+MAX_TICK_LABELS = 12  # 趋势图最多显示的刻度标签数，柱子更多时隔几个显示一个，并省略柱顶金额
+REPORT_FORMATS = ("png", "svg", "pdf")
+PERIOD_PREFIX = {"all": "累计", "week": "本周", "month": "本月", "last_month": "上月", "30d": "近30天",
+                 "year": "今年"}
+
+# matplotlib 导入较慢，第一次绘制时才导入；界面里这一步发生在绘图线程，不阻塞主线程
+Figure = FigureCanvasAgg = mticker = None
+_load_lock = threading.Lock()
+
+
+def load_matplotlib():
+    global Figure, FigureCanvasAgg, mticker
+    with _load_lock:
+        if Figure is None:
+            import matplotlib
+            from matplotlib.backends.backend_agg import FigureCanvasAgg as canvas_cls
+            from matplotlib.figure import Figure as figure_cls
+            import matplotlib.ticker as ticker_mod
+            _configure_fonts(matplotlib.rcParams)
+            Figure, FigureCanvasAgg, mticker = figure_cls, canvas_cls, ticker_mod
+
+
+def _configure_fonts(rc):
+    import platform
+    if platform.system() == "Darwin":
+        rc["font.sans-serif"] = ["PingFang SC", "Heiti TC", "STHeiti"]
+    elif platform.system() == "Windows":
+        rc["font.sans-serif"] = ["SimHei", "Microsoft YaHei"]
+    else:
+        rc["font.sans-serif"] = ["WenQuanYi Micro Hei", "Noto Sans CJK SC"]
+    rc["axes.unicode_minus"] = False
+
+
+# 汇总桶的刻度标签：日/周 (YYYY-MM-DD) 显示 MM-DD，月 (YYYY-MM) 显示 YY-MM
+def bucket_labels(keys):
+    step = -(-len(keys) // MAX_TICK_LABELS) or 1
+    return [(k[5:] if len(k) > 7 else k[2:]) if i % step == 0 else "" for i, k in enumerate(keys)]
+
+
+# ---------- 绘制 ----------
+# data 与 pocket_core.chart_series 的返回值相同；返回可原地更新的图元，空数据时为 None
+def plot_chart(ax, mode, data):
+    import numpy as np
+    ax.set_facecolor("white")
+
+    if not data:
+        empty = {"pie": "暂无支出数据", "bar": "暂无支出记录", "compare": "暂无记录数据"}[mode]
+        ax.text(0.5, 0.5, empty, ha="center", va="center",
+                fontsize=13, color=COLORS["text_light"], transform=ax.transAxes)
+        ax.axis("off")
+        return None
+
+    if mode == "pie":
+        labels = [l for l, _ in data]
+        sizes = [s for _, s in data]
+        total = sum(sizes)
+        wedges, _, _ = ax.pie(
+            sizes, labels=None, autopct="", startangle=140,
+            colors=PIE_COLORS[:len(labels)],
+            wedgeprops={"width": 0.42, "edgecolor": "white", "linewidth": 2.5},
+            pctdistance=0.78,
+        )
+        total_text = ax.text(0, 0, f"￥{total:.0f}", ha="center", va="center",
+                             fontsize=16, fontweight="bold", color=COLORS["text"])
+        ax.text(0, -0.25, "总支出", ha="center", va="center",
+                fontsize=9, color=COLORS["text_light"])
+        legend = ax.legend(wedges, pie_legend_labels(labels, sizes, total), loc="lower center",
+                           bbox_to_anchor=(0.5, -0.12), fontsize=8, frameon=False, ncol=2)
+        return {"wedges": wedges, "total": total_text, "legend": legend}
+
+    if mode == "bar":
+        amounts = [a for _, a in data]
+        x = np.arange(len(data))
+        bars = ax.bar(x, amounts, color=COLORS["primary"], width=0.55,
+                      edgecolor="white", linewidth=0.8, zorder=3)
+        ax.set_xticks(x)
+        ax.set_xticklabels(bucket_labels([d for d, _ in data]))
+        texts = []
+        for bar, val in zip(bars, amounts if len(data) <= MAX_TICK_LABELS else ()):
+            texts.append(ax.text(bar.get_x() + bar.get_width() / 2, bar.get_height() + max(amounts) * 0.03,
+                                 f"￥{val:.0f}", ha="center", va="bottom", fontsize=8, color=COLORS["text"]))
+        ax.set_ylabel("支出 (￥)", fontsize=9, color=COLORS["text_light"])
+        _style_bar_axes(ax)
+        return {"bars": bars, "texts": texts}
+
+    x = np.arange(len(data))
+    w = 0.32
+    bars_in = ax.bar(x - w / 2, [i for _, i, _ in data], w, label="收入",
+                     color=COLORS["income"], edgecolor="white", zorder=3)
+    bars_out = ax.bar(x + w / 2, [o for _, _, o in data], w, label="支出",
+                      color=COLORS["expense"], edgecolor="white", zorder=3)
+    ax.set_xticks(x)
+    ax.set_xticklabels(bucket_labels([d for d, _, _ in data]), fontsize=8)
+    ax.legend(fontsize=8, frameon=False, loc="upper right")
+    ax.set_ylabel("金额 (￥)", fontsize=9, color=COLORS["text_light"])
+    _style_bar_axes(ax)
+    return {"bars_in": bars_in, "bars_out": bars_out}
+
+
+def pie_legend_labels(labels, sizes, total):
+    return [f"{l}  ￥{s:.0f} ({s/total*100:.1f}%)" for l, s in zip(labels, sizes)]
+
+
+# 结构不变 (同样的分类 / 同样数量的柱子) 时原地修改图元，返回 False 表示需要完整重绘
+def update_chart(ax, mode, artists, old, data):
+    if artists is None or not data or len(data) != len(old):
+        return False
+
+    if mode == "pie":
+        labels = [l for l, _ in data]
+        if labels != [l for l, _ in old]:
+            return False
+        sizes = [s for _, s in data]
+        total = sum(sizes)
+        # 与 ax.pie(startangle=140) 相同的角度计算 (逆时针)
+        theta = 140.0
+        for wedge, size in zip(artists["wedges"], sizes):
+            span = 360.0 * size / total
+            wedge.set_theta1(theta)
+            wedge.set_theta2(theta + span)
+            theta += span
+        artists["total"].set_text(f"￥{total:.0f}")
+        for text, label in zip(artists["legend"].get_texts(), pie_legend_labels(labels, sizes, total)):
+            text.set_text(label)
+        return True
+
+    if mode == "bar":
+        amounts = [a for _, a in data]
+        for bar, val in zip(artists["bars"], amounts):
+            bar.set_height(val)
+        for text, val in zip(artists["texts"], amounts):
+            text.set_y(val + max(amounts) * 0.03)
+            text.set_text(f"￥{val:.0f}")
+        ax.set_xticklabels(bucket_labels([d for d, _ in data]))
+    else:
+        for bar, val in zip(artists["bars_in"], [i for _, i, _ in data]):
+            bar.set_height(val)
+        for bar, val in zip(artists["bars_out"], [o for _, _, o in data]):
+            bar.set_height(val)
+        ax.set_xticklabels(bucket_labels([d for d, _, _ in data]), fontsize=8)
+    ax.relim()
+    ax.autoscale_view()
+    return True
+
+
+def _style_bar_axes(ax):
+    ax.spines["top"].set_visible(False)
+    ax.spines["right"].set_visible(False)
+    ax.spines["left"].set_color(COLORS["border"])
+    ax.spines["bottom"].set_color(COLORS["border"])
+    ax.tick_params(colors=COLORS["text_light"], labelsize=8)
+    ax.yaxis.set_major_formatter(mticker.FormatStrFormatter("%.0f"))
+    ax.set_axisbelow(True)
+    ax.yaxis.grid(True, linestyle="--", alpha=0.3, color=COLORS["border"])
+
+
+# ---------- 离屏光栅化 ----------
+# 每种图表各有一套 Figure/Agg 画布；数据结构不变时原地更新图元，数据和尺寸都不变时直接返回上次的像素。
+# 不加锁：同一个实例只能在一个线程里使用 (界面里是绘图线程)
+class ChartRenderer:
+    def __init__(self, dpi=90):
+        self.dpi = dpi
+        self._charts = {}
+
+    def _chart_for(self, mode):
+        chart = self._charts.get(mode)
+        if chart is None:
+            load_matplotlib()
+            fig = Figure(dpi=self.dpi)
+            fig.patch.set_facecolor("white")
+            # size: 上次绘制的像素尺寸；data: 上次绘制的数据；artists: 可原地更新的图元；image: 上次的结果
+            chart = {"fig": fig, "canvas": FigureCanvasAgg(fig), "size": None, "data": None,
+                     "artists": None, "image": None}
+            self._charts[mode] = chart
+        return chart
+
+    # 返回 (宽, 高, RGBA 字节)，逐行从左上角开始。
+    # cancelled() 为真时 (界面里已有更新的绘制请求) 跳过最贵的光栅化，返回 None
+    def render(self, mode, data, width, height, cancelled=None):
+        chart = self._chart_for(mode)
+        size = (width, height)
+        if chart["image"] is not None and chart["size"] == size and chart["data"] == data:
+            return chart["image"]
+        if cancelled is not None and cancelled():
+            return None
+        fig = chart["fig"]
+        resized = chart["size"] != size
+        if resized:
+            fig.set_size_inches(width / self.dpi, height / self.dpi)
+
+        with PERF.span("chart.update"):
+            updated = (chart["data"] is not None and chart["data"] != data
+                       and update_chart(fig.axes[0], mode, chart["artists"], chart["data"], data))
+        if not updated and chart["data"] != data:
+            # chart.plot 包含下面的 clear / tight_layout 子项
+            with PERF.span("chart.plot"):
+                with PERF.span("chart.clear"):
+                    fig.clear()
+                chart["artists"] = plot_chart(fig.add_subplot(111), mode, data)
+                _layout(fig, mode, data)
+        elif resized or mode != "pie":
+            # 尺寸或刻度标签宽度可能变化，重新排版 (比整图重建便宜得多)
+            _layout(fig, mode, data)
+
+        # 图元已经是新数据：先记下，放弃光栅化时下次请求会重画而不是复用旧像素
+        chart["size"], chart["data"], chart["image"] = size, data, None
+        if cancelled is not None and cancelled():
+            return None
+        with PERF.span("chart.draw"):
+            chart["canvas"].draw()
+        w, h = chart["canvas"].get_width_height()
+        chart["image"] = (w, h, bytes(chart["canvas"].buffer_rgba()))
+        return chart["image"]
+
+
+def _layout(fig, mode, data):
+    with PERF.span("chart.tight_layout"):
+        fig.tight_layout()
+    if mode == "pie" and data:
+        # 给图例留出空间，避免小窗口被裁切
+        fig.subplots_adjust(bottom=0.26)
+
+
+# ---------- 预算提示 ----------
+BUDGET_PERIOD_PREFIX = {"week": "本周", "month": "本月", "year": "今年"}
+
+
+# budget_status() -> (提示行, 最严重的级别)：第一行是总预算 (没有总预算时为最严重的分类提醒)，
+# 第二行是最严重的分类提醒；界面的支出卡片和导出的报表共用
+def budget_lines(status, period):
+    if not status:
+        return [], "ok"
+    prefix = BUDGET_PERIOD_PREFIX[period]
+    items = [status[0]] if status[0][0] is None else []
+    alerts = sorted((item for item in status if item[0] is not None and item[3] != "ok"),
+                    key=lambda item: item[3] != "over")
+    items += alerts[:1]
+    level = max((item[3] for item in items), key=("ok", "near", "over").index, default="ok")
+    return [_budget_line(prefix, *item) for item in items] or [f"{prefix}各分类预算均充足"], level
+
+
+def _budget_line(prefix, category, spent, limit, level):
+    name = f"{prefix}预算" if category is None else f"{category}预算"
+    if level == "over":
+        return f"{name}已超出 ￥{spent - limit:.2f} (￥{spent:.2f} / ￥{limit:.2f})"
+    hint = "，即将用完" if level == "near" else ""
+    return f"{name} ￥{spent:.2f} / ￥{limit:.2f}{hint}"
+
+
+LEVEL_COLORS = {"ok": COLORS["text_light"], "near": COLORS["warning"], "over": COLORS["expense"]}
+
+
+# ---------- 报表导出 ----------
+# 报表数据：余额 (全部记录)、所选区间的收支与分类支出、趋势序列、预算状态；全部来自增量聚合与日期索引
+def report_data(db, period="all", span="30d"):
+    start, end = period_range(period)
+    with db.lock:
+        agg = db.agg
+        if period == "all":
+            income, expense, cat_map = agg.income, agg.expense, dict(agg.cat_expense)
+        else:
+            income, expense, cat_map, _ = db.get_stats(start=start, end=end)
+        return {
+            "period": period, "start": start, "end": end, "span": span,
+            "balance": agg.income - agg.expense, "income": income, "expense": expense,
+            "charts": {"pie": tuple(cat_map.items()),
+                       "bar": chart_series(agg, "bar", span),
+                       "compare": chart_series(agg, "compare", span)},
+            "budget": budget_lines(db.budget_status(), db.budget.config["period"]) if db.budget.active else None,
+        }
+
+
+# 一页报表：顶部三张汇总卡片，下面是支出构成 / 支出趋势 / 收支对比
+def build_report_figure(report, title="PocketTrack 报表"):
+    from matplotlib.patches import FancyBboxPatch, Rectangle
+    load_matplotlib()
+    fig = Figure(figsize=(12, 7.5), dpi=100)
+    FigureCanvasAgg(fig)
+    fig.patch.set_facecolor("white")
+    grid = fig.add_gridspec(2, 3, height_ratios=(1, 3), left=0.05, right=0.97, top=0.88, bottom=0.1,
+                            hspace=0.3, wspace=0.28)
+    scope = "全部记录" if report["period"] == "all" else f"{report['start']} ~ {report['end']}"
+    fig.suptitle(f"{title}  ·  {scope}", x=0.05, ha="left", fontsize=15, fontweight="bold",
+                 color=COLORS["text"])
+
+    prefix = PERIOD_PREFIX[report["period"]]
+    budget, level = report["budget"] or ([], "ok")
+    cards = [("当前余额", report["balance"], COLORS["primary"], []),
+             (f"{prefix}收入", report["income"], COLORS["income"], []),
+             (f"{prefix}支出", report["expense"], COLORS["expense"], budget)]
+    for col, (label, value, color, notes) in enumerate(cards):
+        ax = fig.add_subplot(grid[0, col])
+        ax.axis("off")
+        ax.add_patch(FancyBboxPatch((0, 0), 1, 1, boxstyle="round,pad=0,rounding_size=0.06",
+                                    transform=ax.transAxes, facecolor="white", edgecolor=COLORS["border"]))
+        ax.add_patch(Rectangle((0.05, 0.86), 0.9, 0.04, transform=ax.transAxes, color=color))
+        ax.text(0.06, 0.66, label, fontsize=10, color=COLORS["text_light"], transform=ax.transAxes)
+        ax.text(0.06, 0.36, f"￥{value:.2f}", fontsize=20, fontweight="bold", color=color,
+                transform=ax.transAxes)
+        if notes:
+            ax.text(0.06, 0.08, "\n".join(notes), fontsize=8, color=LEVEL_COLORS[level],
+                    transform=ax.transAxes)
+
+    for col, (mode, label) in enumerate([("pie", f"{prefix}支出构成"), ("bar", "支出趋势"), ("compare", "收支对比")]):
+        ax = fig.add_subplot(grid[1, col])
+        ax.set_anchor("N")  # 饼图的坐标区按等比例缩小，靠上对齐让三个标题在同一行
+        ax.set_title(label, fontsize=11, color=COLORS["text"], loc="left")
+        plot_chart(ax, mode, report["charts"][mode])
+    return fig
+
+
+# 渲染一次，按扩展名依次写出 (png / svg / pdf)；返回报表数据
+def export_report(db, paths, period="all", span="30d", title="PocketTrack 报表"):
+    formats = []
+    for path in paths:
+        fmt = os.path.splitext(path)[1].lower().lstrip(".")
+        if fmt not in REPORT_FORMATS:
+            raise ValueError(f"不支持的报表格式：{path} (可用：{', '.join(REPORT_FORMATS)})")
+        formats.append(fmt)
+    report = report_data(db, period, span)
+    with PERF.span("report.build"):
+        fig = build_report_figure(report, title)
+    for path, fmt in zip(paths, formats):
+        with PERF.span(f"report.save[{fmt}]"):
+            fig.savefig(path, format=fmt, facecolor="white")
+    return report
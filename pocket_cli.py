@@ -0,0 +1,284 @@
+# PocketTrack 命令行：无需图形界面即可记账、统计、导入导出、生成报表。
+#
+#   python pocket_cli.py add 支出 12.5 餐饮 --note 午饭
+#   python pocket_cli.py stats --filter 餐
+#   python pocket_cli.py stats --period month --type 支出 --min-amount 50
+#   python pocket_cli.py export out.csv --start 2026-01-01 --type 支出
+#   python pocket_cli.py import history.csv
+#   python pocket_cli.py report --days 30 --json
+#   python pocket_cli.py budget --total 1500 --category 餐饮=600
+#   python pocket_cli.py batch-report ledgers/ extra.json --workers 8
+#   python pocket_cli.py chart-report report.png report.pdf --period month
+#   python pocket_cli.py convert money_data.json money_data.ptl
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+from pocket_core import (BINARY_EXT, BUDGET_PERIODS, CATEGORIES, CHART_SPANS, DATA_FILE, PERF, PERIODS,
+                         STORAGE_BACKEND, LedgerCorruptError, batch_report, build_report, convert_ledger,
+                         discover_ledgers, export_csv, import_records, normalize_budget, normalize_record, open_ledger,
+                         period_range, restore_backup)
+from pocket_charts import REPORT_FORMATS, export_report
+
+
+def cmd_add(db, args):
+    record = normalize_record({
+        "date": args.date or datetime.now().strftime("%Y-%m-%d %H:%M"),
+        "type": args.type, "amount": args.amount, "category": args.category, "note": args.note,
+    })
+    db.add_record(record["type"], record["amount"], record["category"], record["note"], date=record["date"])
+    print(f"已记录：{record['type']} {record['category']} ￥{record['amount']:.2f}")
+
+
+def cmd_stats(db, args):
+    income, expense, cat_map, indexed = db.get_stats(args.filter, **_criteria(args))
+    result = {"records": len(indexed), "income": income, "expense": expense,
+              "balance": income - expense, "categories": cat_map}
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+    print(f"记录数  {result['records']}")
+    print(f"收入    ￥{income:.2f}")
+    print(f"支出    ￥{expense:.2f}")
+    print(f"余额    ￥{income - expense:.2f}")
+    for cat, amount in sorted(cat_map.items(), key=lambda kv: -kv[1]):
+        print(f"  {cat}\t￥{amount:.2f}")
+
+
+def cmd_export(db, args):
+    records = db.iter_records(text=args.text, **_criteria(args))
+    count = export_csv(args.path, records)
+    print(f"已导出 {count} 条到 {args.path}")
+
+
+def cmd_import(db, args):
+    added, skipped, errors = import_records(db, args.path)
+    print(f"新增 {added} 条，跳过重复 {skipped} 条，无效 {len(errors)} 行")
+    for line, reason in errors[:20]:
+        print(f"  第 {line} 行：{reason}", file=sys.stderr)
+    return 1 if errors and not added else 0
+
+
+def cmd_report(db, args):
+    _print_report(build_report(db, days=args.days), args)
+
+
+# 不带参数时查看当前周期的预算状态；给出任一设置项时在现有预算上修改
+def cmd_budget(db, args):
+    if args.clear:
+        db.set_budget(None)
+    elif any(v is not None for v in (args.period, args.total, args.category, args.warn)):
+        budget = normalize_budget(db.budget.config) or {"period": "month", "total": None,
+                                                        "categories": {}, "warn": None}
+        if args.period:
+            budget["period"] = args.period
+        if args.total is not None:
+            budget["total"] = args.total or None  # --total 0 取消总预算
+        for item in args.category or ():
+            cat, sep, amount = item.partition("=")
+            if not sep:
+                raise ValueError(f"分类预算格式应为 分类=金额：{item}")
+            budget["categories"].pop(cat, None)
+            if amount.strip():
+                budget["categories"][cat] = float(amount)
+        if args.warn is not None:
+            budget["warn"] = args.warn
+        if budget["warn"] is None:
+            del budget["warn"]
+        db.set_budget(budget if budget["total"] is not None or budget["categories"] else None)
+
+    status = db.budget_status()
+    if args.json:
+        print(json.dumps({"start": db.budget.start, "end": db.budget.end, "items": [
+            {"category": cat, "spent": spent, "limit": limit, "level": level}
+            for cat, spent, limit, level in status]}, ensure_ascii=False, indent=2))
+        return
+    if not status:
+        print("未设置预算")
+        return
+    print(f"预算周期 {db.budget.start} ~ {db.budget.end}")
+    marks = {"ok": "", "near": "  即将用完", "over": "  已超出"}
+    for cat, spent, limit, level in status:
+        print(f"  {cat or '总预算'}\t￥{spent:.2f} / ￥{limit:.2f}\t{spent / limit * 100:.0f}%{marks[level]}")
+
+
+def cmd_chart_report(db, args):
+    report = export_report(db, args.paths, period=args.period, span=args.span, title=args.title)
+    print(f"已导出报表 ({report['start'] or '全部'} ~ {report['end'] or '全部'})：{', '.join(args.paths)}")
+
+
+def cmd_batch_report(args):
+    paths = discover_ledgers(args.paths)
+    if not paths:
+        raise ValueError("没有找到账本文件")
+    report = batch_report(paths, workers=args.workers, days=args.days)
+    _print_report(report, args)
+    if not args.json:
+        print(f"账本 {len(report['ledgers'])} 个，失败 {len(report['errors'])} 个")
+        if args.per_ledger:
+            for ledger in report["ledgers"]:
+                print(f"  {ledger['path']}\t{ledger['records']} 条\t"
+                      f"+{ledger['income']:.2f}\t-{ledger['expense']:.2f}")
+        for err in report["errors"]:
+            print(f"  {err['path']}：{err['error']}", file=sys.stderr)
+    return 1 if report["errors"] else 0
+
+
+def cmd_restore(args):
+    path = args.file
+    if args.backend == "binary" and not path.endswith(BINARY_EXT):
+        path = os.path.splitext(path)[0] + BINARY_EXT
+    backup = restore_backup(path)
+    if backup == path:
+        print(f"已保留 {path} 及日志中损坏之前的修改，损坏之后的日志已移到 .corrupt 文件保留")
+    else:
+        print(f"已从 {backup} 恢复账本，损坏的文件已改名保留")
+
+
+def cmd_convert(args):
+    count = convert_ledger(args.src, args.dst)
+    print(f"已转换 {count} 条记录：{args.src} -> {args.dst}")
+
+
+# 查询条件参数 -> DataManager.query 的关键字参数；--period 给出默认区间，--start/--end 可覆盖
+def _criteria(args):
+    start, end = period_range(args.period)
+    return {"start": args.start or start, "end": args.end or end, "r_type": args.type,
+            "categories": args.category, "min_amount": args.min_amount, "max_amount": args.max_amount}
+
+
+def _add_query_args(p):
+    p.add_argument("--period", default="all", choices=PERIODS, help="统计区间 (默认: all)")
+    p.add_argument("--start", help="开始日期 YYYY-MM-DD")
+    p.add_argument("--end", help="结束日期 YYYY-MM-DD")
+    p.add_argument("--type", choices=list(CATEGORIES))
+    p.add_argument("--category", action="append", help="可重复")
+    p.add_argument("--min-amount", type=float)
+    p.add_argument("--max-amount", type=float)
+
+
+def _print_report(report, args):
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    print(f"记录数 {report['records']}  收入 ￥{report['income']:.2f}  "
+          f"支出 ￥{report['expense']:.2f}  余额 ￥{report['balance']:.2f}")
+    print("支出构成:")
+    total = report["expense"] or 1
+    for cat, amount in report["categories"].items():
+        print(f"  {cat}\t￥{amount:.2f}\t{amount / total * 100:.1f}%")
+    print(f"最近 {args.days} 天:")
+    for day in report["daily"]:
+        print(f"  {day['date']}\t+{day['income']:.2f}\t-{day['expense']:.2f}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="pocket_cli", description="PocketTrack 命令行")
+    parser.add_argument("--file", default=DATA_FILE, help="账本文件 (默认: 程序目录下的 money_data.json)")
+    parser.add_argument("--backend", default=STORAGE_BACKEND, choices=["journal", "binary", "sqlite"])
+    parser.add_argument("--profile", action="store_true", help="结束时输出各环节耗时分位数")
+    parser.add_argument("--profile-out", metavar="PATH",
+                        help="同时写出分析文件：*.prof 为 cProfile，其他为 Chrome trace JSON")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("add", help="新增一条记录")
+    p.add_argument("type", choices=list(CATEGORIES))
+    p.add_argument("amount")
+    p.add_argument("category")
+    p.add_argument("--note", default="")
+    p.add_argument("--date", help="YYYY-MM-DD HH:MM，默认当前时间")
+    p.set_defaults(func=cmd_add)
+
+    p = sub.add_parser("stats", help="收支统计")
+    p.add_argument("--filter", default="", help="按分类/备注过滤")
+    _add_query_args(p)
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_stats)
+
+    p = sub.add_parser("export", help="导出 CSV")
+    p.add_argument("path")
+    _add_query_args(p)
+    p.add_argument("--text", default="", help="分类/备注关键字")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("import", help="导入 CSV / JSON")
+    p.add_argument("path")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("report", help="汇总报表")
+    p.add_argument("--days", type=int, default=7)
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_report)
+
+    p = sub.add_parser("chart-report", help=f"导出带图表的报表 ({' / '.join(REPORT_FORMATS)})，无需图形界面")
+    p.add_argument("paths", nargs="+", help="输出文件，按扩展名决定格式；多个文件只渲染一次")
+    p.add_argument("--period", default="all", choices=PERIODS, help="卡片与饼图的统计区间 (默认: all)")
+    p.add_argument("--span", default="30d", choices=list(CHART_SPANS), help="趋势图时间范围 (默认: 30d)")
+    p.add_argument("--title", default="PocketTrack 报表")
+    p.set_defaults(func=cmd_chart_report)
+
+    p = sub.add_parser("budget", help="查看或设置预算")
+    p.add_argument("--period", choices=BUDGET_PERIODS, help="预算周期")
+    p.add_argument("--total", type=float, help="总预算，0 表示不设")
+    p.add_argument("--category", action="append", metavar="分类=金额", help="分类预算，可重复；金额留空表示删除")
+    p.add_argument("--warn", type=float, help="花费达到预算的这个比例时提醒 (默认 0.8)")
+    p.add_argument("--clear", action="store_true", help="清除全部预算")
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_budget)
+
+    p = sub.add_parser("batch-report", help="多账本并行汇总报表")
+    p.add_argument("paths", nargs="+", help="账本文件或包含 *.json 账本的目录")
+    p.add_argument("--workers", type=int, help="进程数 (默认: CPU 核数)")
+    p.add_argument("--days", type=int, default=7)
+    p.add_argument("--per-ledger", action="store_true", help="列出每个账本的小计")
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_batch_report, ledger=False)
+
+    p = sub.add_parser("restore", help="账本损坏时从最近的备份恢复")
+    p.set_defaults(func=cmd_restore, ledger=False)
+
+    p = sub.add_parser("convert", help=f"JSON 账本与二进制账本 (*{BINARY_EXT}) 互相转换，按扩展名判断格式")
+    p.add_argument("src")
+    p.add_argument("dst")
+    p.set_defaults(func=cmd_convert, ledger=False)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    PERF.configure(args.profile_out or ("1" if args.profile else None))
+    try:
+        return _run(args)
+    finally:
+        PERF.finish()
+
+
+def _run(args):
+    if not getattr(args, "ledger", True):
+        try:
+            return args.func(args) or 0
+        except (ValueError, LedgerCorruptError) as e:
+            print(f"错误：{e}", file=sys.stderr)
+            return 2
+    try:
+        db = open_ledger(args.file, args.backend)
+    except LedgerCorruptError as e:
+        print(f"错误：{e}", file=sys.stderr)
+        if e.journal:
+            print("可运行 `pocket_cli.py restore` 保留日志中损坏之前的修改", file=sys.stderr)
+        elif e.backups:
+            print("可运行 `pocket_cli.py restore` 从最近的备份恢复", file=sys.stderr)
+        return 2
+    try:
+        return args.func(db, args) or 0
+    except ValueError as e:
+        print(f"错误：{e}", file=sys.stderr)
+        return 2
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2655 @@
+# PocketTrack 核心：存储、聚合、索引、导入导出。
+# 不依赖 Tk / matplotlib，可在无显示环境下运行 (命令行见 pocket_cli.py，图形界面见 Allowancemanagement.py)。
+import copy
+import json
+import math
+import mmap
+import os
+import shutil
+import struct
+import sys
+import csv
+import sqlite3
+import time
+import threading
+import bisect
+import contextlib
+import heapq
+from datetime import date, datetime, timedelta
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+np = None  # 延迟导入，只有列式统计才需要
+
+
+def _load_numpy():
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+    return np
+
+
+CATEGORIES = {
+    "支出": ["餐饮", "文具", "零食", "交通", "娱乐", "购物", "其他"],
+    "收入": ["红包", "奖励", "零花钱", "兼职", "利息", "其他"],
+}
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "money_data.json")
+SQLITE_FILE = os.path.splitext(DATA_FILE)[0] + ".db"
+# 存储引擎: "journal" (默认, JSON 快照 + 追加日志)、"binary" (二进制快照 + 追加日志) 或 "sqlite"
+STORAGE_BACKEND = os.environ.get("POCKETTRACK_BACKEND", "journal")
+BACKUP_COUNT = 3  # 保存时轮换保留的历史快照份数 (money_data.json.1 ~ .3)
+BINARY_EXT = ".ptl"  # 二进制账本扩展名
+ROLLUP_VERSION = 1  # 快照中 rollups 的格式版本，不一致时加载后重新统计
+READ_RETRIES = 5  # 只读加载遇到其他进程正在压缩日志时的重读次数
+
+
+# ---------- 性能埋点 ----------
+# 默认关闭：span() 直接返回共享的空上下文，observe() 立即返回，热路径几乎没有额外开销。
+# POCKETTRACK_PROFILE=1 (或命令行 --profile) 打开计时，每项保留最近 window 个样本用于滚动分位数，
+# 退出时把汇总打印到 stderr。设为 *.prof 路径时同时用 cProfile 采样主线程并写出；
+# 设为其他路径则写出 Chrome trace 事件 (chrome://tracing 或 Perfetto 可打开)。
+class Instrumentation:
+    MAX_TRACE_EVENTS = 200_000
+
+    def __init__(self, window=512):
+        self.enabled = False
+        self.target = None
+        self.window = window
+        self._samples = {}
+        self._counts = defaultdict(int)
+        self._lock = threading.Lock()
+        self._events = None
+        self._profile = None
+        self._t0 = time.perf_counter()
+
+    def configure(self, target):
+        if not target or target == "0" or self.enabled:
+            return
+        self.enabled = True
+        self.target = target
+        if target.endswith(".prof"):
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        elif target != "1":
+            self._events = []
+
+    def span(self, name):
+        if not self.enabled:
+            return _NO_SPAN
+        return _Span(self, name)
+
+    # 记录一个数值样本 (如本次扫描的记录数)；span 的耗时以毫秒记在同名项下
+    def observe(self, name, value):
+        if not self.enabled:
+            return
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+            samples.append(value)
+            self._counts[name] += 1
+
+    def _finish_span(self, name, start, end):
+        self.observe(name, (end - start) * 1000)
+        if self._events is not None:
+            with self._lock:
+                if len(self._events) < self.MAX_TRACE_EVENTS:
+                    self._events.append({
+                        "name": name, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+                        "ts": round((start - self._t0) * 1e6), "dur": round((end - start) * 1e6),
+                    })
+
+    # {名称: {n, p50, p90, p99, max}}；分位数基于最近 window 个样本
+    def summary(self):
+        with self._lock:
+            items = [(name, sorted(samples), self._counts[name]) for name, samples in self._samples.items()]
+        result = {}
+        for name, values, n in sorted(items):
+            result[name] = dict({f"p{p}": values[min(len(values) - 1, len(values) * p // 100)]
+                                 for p in (50, 90, 99)}, n=n, max=values[-1])
+        return result
+
+    # 耗时单位为毫秒，*.scanned / *.rows 等计数项为条数
+    def format_summary(self):
+        lines = [f"{'name':<26}{'n':>8}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}"]
+        for name, s in self.summary().items():
+            lines.append(f"{name:<26}{s['n']:>8}"
+                         + "".join(f"{s[k]:>10.2f}" for k in ("p50", "p90", "p99", "max")))
+        return "\n".join(lines)
+
+    def finish(self):
+        if not self.enabled:
+            return
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(self.target)
+        elif self._events is not None:
+            with self._lock:
+                events = list(self._events)
+            with open(self.target, "w", encoding="utf-8") as f:
+                json.dump({"traceEvents": events, "otherData": self.summary()}, f, ensure_ascii=False)
+        print(self.format_summary(), file=sys.stderr)
+
+
+class _Span:
+    __slots__ = ("perf", "name", "start")
+
+    def __init__(self, perf, name):
+        self.perf = perf
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.perf._finish_span(self.name, self.start, time.perf_counter())
+        return False
+
+
+_NO_SPAN = contextlib.nullcontext()
+PERF = Instrumentation()
+PERF.configure(os.environ.get("POCKETTRACK_PROFILE"))
+
+
+# ---------- 存储后端 ----------
+class LedgerCorruptError(Exception):
+    # 账本文件存在但无法解析。加载直接失败而不是当作空账本，避免之后的保存把它覆盖掉。
+    # journal 为损坏的日志文件 (快照本身完好，restore_backup 不需要备份也能修复)
+    def __init__(self, path, reason, backups=(), journal=None):
+        super().__init__(f"账本文件已损坏：{path} ({reason})")
+        self.path = path
+        self.reason = reason
+        self.backups = list(backups)
+        self.journal = journal
+
+
+def _read_ledger(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except ValueError as e:
+        raise LedgerCorruptError(path, e, list_backups(path)) from e
+    if not isinstance(data, dict) or not isinstance(data.get("records", []), list):
+        raise LedgerCorruptError(path, "缺少 records 列表", list_backups(path))
+    return data
+
+
+# 记录以外的字段 (如 budget)；None 表示删除
+def _set_meta(data, key, value):
+    if value is None:
+        data.pop(key, None)
+    else:
+        data[key] = value
+
+
+# 在调用方线程 (持有数据锁) 复制一份快照，之后可以在后台线程序列化。
+# 记录字典写入后不再修改，复制列表即可；其余字段 (如 budget) 很小，深拷贝
+def _snapshot(data, **extra):
+    snapshot = {k: copy.deepcopy(v) for k, v in data.items() if k != "records"}
+    snapshot["records"] = list(data.get("records", []))
+    snapshot.update(extra)
+    return snapshot
+
+
+# 写临时文件并 fsync，再原子替换目标文件；任何时刻磁盘上都有一份完整的账本
+def _atomic_write_json(path, data, backups=0):
+    _atomic_write(path, json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8"), backups)
+
+
+def _atomic_write(path, payload, backups=0):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    if backups and os.path.exists(path):
+        _rotate_backups(path, backups)
+    os.replace(tmp, path)
+    _fsync_dir(path)
+
+
+# path.1 最新 ... path.N 最旧。当前文件复制为 path.1 而不是改名，主文件在替换前后都一直存在；
+# 也不用硬链接，免得别的程序原地改写主文件时连带改坏备份
+def _rotate_backups(path, count):
+    for i in range(count - 1, 0, -1):
+        if os.path.exists(f"{path}.{i}"):
+            os.replace(f"{path}.{i}", f"{path}.{i + 1}")
+    shutil.copy2(path, path + ".1")
+
+
+def _fsync_dir(path):
+    if os.name != "posix":
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def list_backups(path):
+    return [p for p in (f"{path}.{i}" for i in range(1, BACKUP_COUNT + 1)) if os.path.exists(p)]
+
+
+# 修复损坏的账本，返回恢复所用的文件。
+# 快照可读时只是日志损坏：保留快照和日志中损坏之前的条目，从第一条无法解析的行起 (连同之后的日志)
+# 移到 *.journal.corrupt-时间戳，返回账本自身的路径。
+# 快照损坏时用最新的可读备份替换，返回所用备份的路径；损坏的文件和日志改名为 *.corrupt-时间戳 保留下来
+# (日志基于损坏的快照，不能重放到旧备份上)
+def restore_backup(path):
+    read = _read_binary_ledger if path.endswith(BINARY_EXT) else _read_ledger
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    try:
+        if os.path.exists(path):
+            read(path)
+    except LedgerCorruptError:
+        pass
+    else:
+        _quarantine_journal_tail(path, stamp)
+        return path
+    for backup in list_backups(path):
+        try:
+            read(backup)
+        except LedgerCorruptError:
+            continue
+        journal = _journal_path(path)
+        for p in (path, journal, journal + ".old"):
+            if os.path.exists(p):
+                os.replace(p, f"{p}.corrupt-{stamp}")
+        shutil.copy2(backup, path)
+        return backup
+    raise LedgerCorruptError(path, "没有可用的备份")
+
+
+# 日志中第一条无法解析、且后面还有内容的行的位置；只有最后一行写了一半 (加载时自行截断) 或全部完好时为 None
+def _journal_damage(raw):
+    offset = 0
+    for line in raw.splitlines(keepends=True):
+        try:
+            json.loads(line.decode("utf-8"))
+        except ValueError:
+            return offset if raw[offset + len(line):].strip() else None
+        offset += len(line)
+    return None
+
+
+# 依次检查 .journal.old 与 .journal：先把损坏处之后的内容 (和之后的整份日志) 写入 .corrupt 文件，再截断原日志
+def _quarantine_journal_tail(path, stamp):
+    journal = _journal_path(path)
+    cuts = []
+    for p in (journal + ".old", journal):
+        if not os.path.exists(p):
+            continue
+        with open(p, "rb") as f:
+            raw = f.read()
+        end = 0 if cuts else _journal_damage(raw)
+        if end is not None:
+            cuts.append((p, end, raw[end:]))
+    if not cuts:
+        return
+    with open(f"{journal}.corrupt-{stamp}", "wb") as f:
+        f.write(b"".join(tail for _, _, tail in cuts))
+        f.flush()
+        os.fsync(f.fileno())
+    for p, end, _ in cuts:
+        with open(p, "r+b") as f:
+            f.truncate(end)
+
+
+# money_data.json -> money_data.journal；二进制账本 money_data.ptl -> money_data.ptl.journal，两种格式可以并存
+def _journal_path(path):
+    if path.endswith(BINARY_EXT):
+        return path + ".journal"
+    return os.path.splitext(path)[0] + ".journal"
+
+
+# money_data.json -> money_data.lock；二进制账本 money_data.ptl -> money_data.ptl.lock
+def _lock_path(path):
+    if path.endswith(BINARY_EXT):
+        return path + ".lock"
+    return os.path.splitext(path)[0] + ".lock"
+
+
+# ---------- 进程间文件锁 ----------
+# 多个进程 (界面、导入脚本、命令行) 共用一个账本时，写日志、切换日志和写快照都在锁内进行。
+# 锁是咨询锁 (POSIX flock / Windows msvcrt)，只在单次写入、重新加载或批量录入 (defer) 期间持有，进程退出时由系统释放。
+# 同一进程内可重入，线程之间用 RLock 互斥。
+#
+# 锁文件的内容是 "全局日志序号 日志代数"：追加日志后更新序号，切换日志 (压缩) 时代数加一。
+# 其他进程不用加锁，读这几十个字节就能判断有没有新变更，以及上次读到的日志文件是否还是当前日志。
+_LOCK_STATE = struct.Struct("20s1s20s1s")  # 定宽，原地覆盖写，读者不会读到截断的内容
+_LOCK_BYTE = 0x7FFFFFFF  # Windows 按字节区间加锁：锁内容之外的一个字节，读状态不受影响
+
+if os.name == "nt":
+    def _lock_fd(fd, blocking):
+        os.lseek(fd, _LOCK_BYTE, os.SEEK_SET)
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+                time.sleep(0.02)
+
+    def _unlock_fd(fd):
+        os.lseek(fd, _LOCK_BYTE, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+else:
+    def _lock_fd(fd, blocking):
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def _unlock_fd(fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+class LedgerLock:
+    def __init__(self, path):
+        self.path = path
+        self._mutex = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def acquire(self, blocking=True):
+        if not self._mutex.acquire(blocking):
+            return False
+        if self._depth == 0:
+            try:
+                if self._fd is None:
+                    self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                with PERF.span("lock.wait"):
+                    locked = _lock_fd(self._fd, blocking)
+            except BaseException:
+                self._mutex.release()
+                raise
+            if not locked:
+                self._mutex.release()
+                return False
+        self._depth += 1
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            _unlock_fd(self._fd)
+        self._mutex.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+    # (全局日志序号, 日志代数)；不需要持有锁。锁文件还不存在时为 (0, 0)，内容无法解析时为 None
+    def read_state(self):
+        try:
+            with open(self.path, "rb") as f:
+                raw = f.read(_LOCK_STATE.size)
+        except FileNotFoundError:
+            return 0, 0
+        if not raw:
+            return 0, 0
+        try:
+            seq, _, gen, _ = _LOCK_STATE.unpack(raw)
+            return int(seq), int(gen)
+        except (struct.error, ValueError):
+            return None
+
+    # 持有锁时调用
+    def write_state(self, seq, gen):
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        os.write(self._fd, _LOCK_STATE.pack(b"%20d" % seq, b" ", b"%20d" % gen, b"\n"))
+
+    def close(self):
+        with self._mutex:
+            if self._fd is not None and self._depth == 0:
+                os.close(self._fd)
+                self._fd = None
+
+
+# ---------- 后台写入 ----------
+# 合并短时间内的多次保存：schedule() 只替换待写任务，后台线程在 delay 秒内没有新任务
+# (或距第一次排队超过 max_delay) 时执行最新的那个。任务是写完整快照的无参函数，新任务总是覆盖旧任务。
+# 写入失败会记在 error 里并输出到 stderr；close() 时在调用方线程重试一次，仍失败则抛出。
+class WriteBehind:
+    def __init__(self, delay=0.3, max_delay=2.0):
+        self.delay = delay
+        self.max_delay = max_delay
+        self.error = None
+        self._cond = threading.Condition()
+        self._job = None
+        self._failed = None
+        self._first = self._last = 0.0
+        self._busy = False
+        self._closed = False
+        self._thread = None
+
+    def schedule(self, job):
+        with self._cond:
+            now = time.monotonic()
+            if self._job is None:
+                self._first = now
+            self._job, self._last = job, now
+            self._failed = None
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ledger-writer", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    # 立即执行排队的任务并等待后台线程空闲。discard=True 时丢弃排队的任务 (调用方马上自己写完整快照)
+    def flush(self, discard=False):
+        with self._cond:
+            if discard:
+                self._job = self._failed = None
+            elif self._job is not None:
+                self._first = float("-inf")
+            self._cond.notify_all()
+            while self._busy or self._job is not None:
+                self._cond.wait()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._failed is not None:
+            job, self._failed = self._failed, None
+            job()
+            self.error = None
+
+    def _next_job(self):
+        with self._cond:
+            while True:
+                timeout = None
+                if self._job is not None:
+                    timeout = min(self._last + self.delay, self._first + self.max_delay) - time.monotonic()
+                    if timeout <= 0 or self._closed:
+                        job, self._job = self._job, None
+                        self._busy = True
+                        return job
+                elif self._closed:
+                    return None
+                self._cond.wait(timeout)
+
+    def _run(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            try:
+                job()
+                error = None
+            except Exception as e:
+                error = e
+                print(f"后台保存失败：{e}", file=sys.stderr)
+            with self._cond:
+                self._busy = False
+                self.error = error
+                if error is not None and self._job is None:
+                    self._failed = job
+                self._cond.notify_all()
+
+
+# 快照文件存储的公共部分：快照读写 (轮换备份)、后台写入线程与文件锁。
+# 增删改的持久化 (追加日志、压缩成快照) 见 JournalStorage
+class JsonStorage:
+    # 快照文件的读写函数，子类替换为其他格式
+    read_file = staticmethod(_read_ledger)
+    write_file = staticmethod(_atomic_write_json)
+
+    def __init__(self, path=DATA_FILE, backups=BACKUP_COUNT, write_delay=0.3):
+        self.path = path
+        self.backups = backups
+        self.snapshot_extras = None  # 返回随快照一起保存的附加字段 (如 rollups)，在持有数据锁时调用
+        self.replayed = []           # 最近一次 load 在快照之后重放的增减 (1 / -1, 记录)
+        self.file_lock = LedgerLock(_lock_path(path))
+        self._writer = WriteBehind(delay=write_delay)
+
+    def load(self):
+        self.replayed = []
+        if not os.path.exists(self.path):
+            return {"records": []}
+        return self.read_file(self.path)
+
+    def _snapshot(self, data, **extra):
+        if self.snapshot_extras is not None:
+            extra.update(self.snapshot_extras())
+        return _snapshot(data, **extra)
+
+    # 后台线程取文件锁。调用方线程可能正持有文件锁并等待后台线程空闲 (flush)，
+    # 所以不能阻塞等待：superseded() 为真说明这次写入已被取代，放弃
+    def _acquire_unless(self, superseded):
+        while not self.file_lock.acquire(blocking=False):
+            if superseded():
+                return False
+            time.sleep(0.01)
+        return True
+
+
+# 快照 + 追加日志存储：
+# 快照沿用 money_data.json 格式；每次增删改只向 .journal 追加一行 (删除/修改按记录 id)，fsync 按条数/时间批量进行。
+# 日志达到阈值后压缩：在调用方线程复制记录列表并把日志改名为 .journal.old，新的变更写入新日志；
+# 后台线程写完新快照后才删除 .journal.old。启动时读快照，再依次重放 .journal.old 与 .journal 中
+# 序号大于 journal_seq 的条目，忽略写了一半的尾行。
+#
+# 多进程共用：追加日志、切换日志和写快照都持有 LedgerLock；写入前先用 changes() 读入其他进程追加的条目，
+# 日志序号在所有进程间连续。锁文件里的 (序号, 代数) 是变更检测器：序号变大说明有新条目，只需从上次
+# 读到的位置往后读；代数变化说明日志被切换过，从 .journal.old 开头重读并跳过已见过的序号；
+# 序号接不上 (其他进程的快照已写完并删掉了旧日志) 时才完整重新加载。
+class JournalStorage(JsonStorage):
+    def __init__(self, path=DATA_FILE, fsync_every=32, fsync_interval=1.0, compact_every=2000, read_only=False,
+                 backups=BACKUP_COUNT):
+        super().__init__(path, backups)
+        self.journal_path = _journal_path(path)
+        self.old_journal_path = self.journal_path + ".old"
+        self.read_only = read_only  # 只读加载 (批量报表)：不加锁、不修复日志尾部
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+        self._seq = 0          # 最后一条已写入的日志序号
+        self._journal_ops = 0  # 快照之后累积的日志条数
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._fh = None
+        self._fh_gen = None    # 打开 _fh 时的日志代数；代数变了说明文件已被其他进程改名为 .journal.old
+        self._gen = 0          # 已读到的日志代数 (锁文件中的第二个数)
+        self._offset = 0       # 当前日志中已读到的字节位置
+        self._pending = None   # defer() 之后尚未写入日志的条目
+        self._pending_data = None
+
+    # 在锁内加载，读快照与两份日志期间不会被其他进程切换日志。
+    # 只读加载 (批量报表、格式转换) 不创建也不占用锁文件：直接读，读完比较锁文件中的日志代数和快照文件，
+    # 期间有其他进程切换日志或写完快照就重读；连续 READ_RETRIES 次都撞上压缩才退回加锁读取
+    def load(self):
+        if self.read_only:
+            for _ in range(READ_RETRIES):
+                stamp = self._stamp()
+                data = self._load()
+                if self._stamp() == stamp:
+                    return data
+                if isinstance(data["records"], MappedLedger):
+                    data["records"].close()
+        with self.file_lock:
+            return self._load()
+
+    # 只读加载的一致性检查：(锁文件状态, 快照文件标识)
+    def _stamp(self):
+        try:
+            st = os.stat(self.path)
+            snapshot = (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            snapshot = None
+        return self.file_lock.read_state(), snapshot
+
+    def _load(self):
+        state = self.file_lock.read_state() or (0, 0)
+        data = super().load()
+        data.setdefault("records", [])
+        self._seq = data.pop("journal_seq", 0)
+        self._journal_ops = 0
+        self._offset = 0
+        removed, updated = set(), {}
+        for path in (self.old_journal_path, self.journal_path):
+            if os.path.exists(path):
+                end = self._replay(data, path, removed, updated)
+                if path == self.journal_path:
+                    self._offset = end
+        if not self.read_only and state[0] > self._seq:
+            # 日志中损坏的部分已被 restore_backup 移走：锁文件里的序号退回到实际重放到的位置，
+            # 代数加一让其他实例从头核对
+            state = (self._seq, state[1] + 1)
+            self.file_lock.write_state(*state)
+        self._gen = state[1]
+        if removed or updated:
+            # 按 id 的删除/修改最后一次性应用 (id 不会复用，顺序无关)，重放不必逐条查找位置
+            records = []
+            for r in data["records"]:
+                record_id = r.get("id")
+                if record_id in removed:
+                    self.replayed.append((-1, r))
+                    continue
+                if record_id in updated:
+                    self.replayed.append((-1, r))
+                    r = updated[record_id]
+                    self.replayed.append((1, r))
+                records.append(r)
+            data["records"] = records
+        return data
+
+    def _replay(self, data, path, removed, updated):
+        valid_end = 0
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    op = json.loads(line.decode("utf-8"))
+                except ValueError as e:
+                    self._check_torn_tail(f, path, e)
+                    break  # 崩溃时写了一半的尾行
+                valid_end += len(line)
+                if op["seq"] <= self._seq:
+                    continue  # 已经压缩进快照
+                self._apply(data, op, removed, updated, self.replayed)
+                self._seq = op["seq"]
+                self._journal_ops += 1
+        if not self.read_only and valid_end < os.path.getsize(path):
+            # 截掉损坏的尾部，避免后续追加接在半行后面
+            with open(path, "r+b") as f:
+                f.truncate(valid_end)
+        return valid_end
+
+    # 无法解析的行只允许是最后一行 (崩溃时写了一半)。后面还有内容说明日志中间损坏，
+    # 截断或跳过都会永久丢掉之后的修改：按账本损坏处理，由 restore_backup 把损坏之后的部分移走
+    def _check_torn_tail(self, f, path, error):
+        if f.read().strip():
+            raise LedgerCorruptError(self.path, f"{os.path.basename(path)} 中间有无法解析的行：{error}",
+                                     list_backups(self.path), journal=path) from error
+
+    @staticmethod
+    def _apply(data, op, removed, updated, replayed):
+        records = data["records"]
+        if op["op"] == "add":
+            records.append(op["record"])
+            replayed.append((1, op["record"]))
+            if "id" in op["record"]:
+                # 快照之后分配的 id 只记在日志里；已删除记录的 id 也不能再分配
+                data["next_id"] = max(data.get("next_id", 1), op["record"]["id"] + 1)
+        elif op["op"] == "update":
+            updated[op["record"]["id"]] = op["record"]
+        elif op["op"] == "delete":
+            if "id" in op:
+                removed.add(op["id"])
+            elif 0 <= op["index"] < len(records):
+                replayed.append((-1, records.pop(op["index"])))  # 旧版本日志按位置删除
+        elif op["op"] == "meta":
+            _set_meta(data, op["key"], op["value"])
+
+    # 同步压缩 (显式保存、批量导入)
+    def save(self, data):
+        with PERF.span("journal.snapshot"), self.file_lock:
+            self._write_snapshot(self._begin_snapshot(data))
+
+    # 在持有数据锁和文件锁的调用方线程执行：复制快照并切换日志文件，日志代数加一。
+    # 尚未写出的上一次压缩直接作废：.journal 会接到 .journal.old 后面，新快照包含它的全部内容
+    def _begin_snapshot(self, data):
+        self._gen += 1
+        self.file_lock.write_state(self._seq, self._gen)
+        self._writer.flush(discard=True)
+        self._close_journal()
+        if os.path.exists(self.journal_path):
+            if os.path.exists(self.old_journal_path):
+                # 上一次压缩没有完成 (崩溃或写入失败)：接到旧日志后面，等新快照落盘后一起删除
+                with open(self.old_journal_path, "ab") as dst, open(self.journal_path, "rb") as src:
+                    shutil.copyfileobj(src, dst)
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.remove(self.journal_path)
+            else:
+                os.replace(self.journal_path, self.old_journal_path)
+        self._journal_ops = 0
+        self._offset = 0
+        if self._pending:
+            self._pending = []  # 快照已包含这些变更
+        return self._snapshot(data, journal_seq=self._seq)
+
+    def _write_snapshot(self, snapshot):
+        self.write_file(self.path, snapshot, self.backups)
+        if os.path.exists(self.old_journal_path):
+            os.remove(self.old_journal_path)
+
+    def _compact_later(self, data):
+        snapshot = self._begin_snapshot(data)
+        gen = self._gen
+
+        # 后台线程：拿到文件锁后确认日志没有再被切换过 (本进程或其他进程)，否则这份快照已经过时
+        def job():
+            if not self._acquire_unless(lambda: self._gen != gen):
+                return
+            try:
+                state = self.file_lock.read_state()
+                if self._gen != gen or (state is not None and state[1] != gen):
+                    return
+                with PERF.span("journal.snapshot"):
+                    self._write_snapshot(snapshot)
+            finally:
+                self.file_lock.release()
+        self._writer.schedule(job)
+
+    def record_added(self, data, record):
+        self._append(data, {"op": "add", "record": record})
+
+    def record_deleted(self, data, record_id):
+        self._append(data, {"op": "delete", "id": record_id})
+
+    def record_updated(self, data, record):
+        self._append(data, {"op": "update", "record": record})
+
+    # 批量导入：一次写入、一次 fsync；条数超过压缩阈值时直接写快照
+    def records_added(self, data, records):
+        if self._journal_ops + len(records) >= self.compact_every:
+            self.save(data)
+            return
+        self._append(data, *({"op": "add", "record": r} for r in records))
+        self.sync()
+
+    def meta_changed(self, data, key):
+        self._append(data, {"op": "meta", "key": key, "value": data.get(key)})
+        self.sync()
+
+    # 批量录入：之后的日志条目先留在内存，flush_deferred() 时一次写入并 fsync。
+    # 期间一直持有文件锁，其他进程的写入要等到 flush，本进程先分配的 id 不会和它们冲突
+    def defer(self):
+        if self._pending is None:
+            self.file_lock.acquire()
+            self._pending = []
+
+    def flush_deferred(self):
+        if self._pending is None:
+            return
+        ops, data = self._pending, self._pending_data
+        self._pending = self._pending_data = None
+        try:
+            if ops:
+                self._append(data, *ops)
+                self.sync()
+        finally:
+            self.file_lock.release()
+
+    # 持有文件锁的写入方在此之前已经用 changes() 读入其他进程的条目，序号接在全局最新序号之后
+    def _append(self, data, *ops):
+        if self._pending is not None:
+            self._pending.extend(ops)
+            self._pending_data = data
+            return
+        with self.file_lock:
+            self._write_ops(data, ops)
+
+    def _write_ops(self, data, ops):
+        if self._fh is not None and self._fh_gen != self._gen:
+            self._close_journal()  # 其他进程切换过日志，旧句柄指向的是 .journal.old
+        if self._fh is None:
+            self._fh = open(self.journal_path, "ab")
+            self._fh_gen = self._gen
+        if os.fstat(self._fh.fileno()).st_size > self._offset:
+            # 其他进程写到一半时崩溃，留下没有登记到锁文件的尾部：截掉，新条目接在最后一个已知条目之后，
+            # 否则这段残行会变成日志中间的损坏行
+            self._fh.truncate(self._offset)
+        lines = []
+        for op in ops:
+            self._seq += 1
+            op["seq"] = self._seq
+            lines.append(json.dumps(op, ensure_ascii=False) + "\n")
+        self._fh.write("".join(lines).encode("utf-8"))
+        self._fh.flush()
+        self._offset = self._fh.tell()
+        self.file_lock.write_state(self._seq, self._gen)
+        self._unsynced += len(lines)
+        self._journal_ops += len(lines)
+        if (self._unsynced >= self.fsync_every
+                or time.monotonic() - self._last_sync >= self.fsync_interval):
+            self.sync()
+        if self._journal_ops >= self.compact_every:
+            self._compact_later(data)
+
+    def sync(self):
+        if self._fh is not None and self._unsynced:
+            os.fsync(self._fh.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _close_journal(self):
+        if self._fh is not None:
+            self.sync()
+            self._fh.close()
+            self._fh = None
+
+    # 不加锁，只读锁文件：其他进程追加过日志或切换过日志
+    def has_changes(self):
+        state = self.file_lock.read_state()
+        return state is None or state[0] > self._seq or state[1] != self._gen
+
+    # 持有文件锁时调用：返回其他进程在本进程上次读写之后追加的日志条目 (按序号)，
+    # 序号接不上时返回 None，由调用方完整重新加载
+    def changes(self):
+        state = self.file_lock.read_state()
+        if state is not None and state[0] <= self._seq and state[1] == self._gen:
+            return []
+        rotated = state is None or state[1] != self._gen
+        ops = []
+        with PERF.span("journal.changes"):
+            if rotated and os.path.exists(self.old_journal_path):
+                self._read_ops(self.old_journal_path, 0, ops)
+            if os.path.exists(self.journal_path):
+                self._offset = self._read_ops(self.journal_path, 0 if rotated else self._offset, ops)
+            elif rotated:
+                self._offset = 0
+        seq = self._seq
+        for op in ops:
+            if op["seq"] != seq + 1:
+                return None
+            seq = op["seq"]
+        if state is not None and seq < state[0]:
+            return None
+        PERF.observe("journal.changes.ops", len(ops))
+        self._seq = seq
+        self._journal_ops = len(ops) if rotated else self._journal_ops + len(ops)
+        if state is not None:
+            self._gen = state[1]
+        return ops
+
+    # 从 start 起读取序号大于 _seq 的条目，返回读到的最后一个完整行之后的位置
+    def _read_ops(self, path, start, ops):
+        with open(path, "rb") as f:
+            f.seek(start)
+            end = start
+            for line in f:
+                try:
+                    op = json.loads(line.decode("utf-8"))
+                except ValueError as e:
+                    self._check_torn_tail(f, path, e)
+                    break  # 写了一半的尾行
+                end += len(line)
+                if op["seq"] > self._seq:
+                    ops.append(op)
+        return end
+
+    def close(self):
+        self.flush_deferred()
+        self._writer.close()
+        self._close_journal()
+        self.file_lock.close()
+
+
+# ---------- 二进制账本 ----------
+# money_data.ptl：定长记录数组 + 类型/分类字典 + 备注字符串堆，启动时 mmap 映射，按需解码。
+#
+#   文件头 (80 字节) | 字典 JSON {"types": [...], "categories": [...]} | 其他字段 JSON (next_id/budget/rollups...)
+#   | 对齐到 8 字节 | 记录数组 count x 56 字节 | 字符串堆 (UTF-8 备注、非标准字段的 JSON)
+#
+# 每条记录：id(i8) amount(f8) date(16 字节, 不足补 \0) type(u2) category(u2) flags(u2) 对齐(2)
+#          note 偏移/长度(u4 x2) extra 偏移/长度(u4 x2)；偏移相对字符串堆起点。
+# flags 标明哪些字段存放在定长列中；缺失的字段不写，放不进定长列的值 (超长日期、非数字金额、
+# 多余的键) 以 JSON 存入 extra，因此与 JSON 格式互转不丢失内容。
+_BIN_MAGIC = b"PTLEDGR\0"
+_BIN_VERSION = 1
+_BIN_HEADER = struct.Struct("<8sHHI8Q")
+_BIN_RECORD = struct.Struct("<qd16sHHHxxIIII")
+_F_ID, _F_DATE, _F_TYPE, _F_AMOUNT, _F_CATEGORY, _F_NOTE, _F_INT = 1, 2, 4, 8, 16, 32, 64
+_F_COLUMNS = _F_DATE | _F_TYPE | _F_AMOUNT | _F_CATEGORY  # 列式统计需要的字段
+
+
+def _encode_binary(data):
+    names = {"types": [], "categories": []}
+    ids = {"types": {}, "categories": {}}
+    records = data.get("records", [])
+    body = bytearray(_BIN_RECORD.size * len(records))
+    heap = bytearray()
+
+    def heap_add(raw):
+        offset = len(heap)
+        heap.extend(raw)
+        return offset, len(raw)
+
+    for i, r in enumerate(records):
+        flags, extra = 0, {}
+        rid, amount, day, t, c = 0, 0.0, b"", 0, 0
+        note = extra_ref = (0, 0)
+        for key, value in r.items():
+            if key == "id" and type(value) is int and -2 ** 63 <= value < 2 ** 63:
+                rid, flags = value, flags | _F_ID
+            elif key == "date" and isinstance(value, str) and len(value.encode("utf-8")) <= 16 and "\0" not in value:
+                day, flags = value.encode("utf-8"), flags | _F_DATE
+            elif key == "amount" and type(value) is float:
+                amount, flags = value, flags | _F_AMOUNT
+            elif key == "amount" and type(value) is int and abs(value) <= 2 ** 53:
+                amount, flags = float(value), flags | _F_AMOUNT | _F_INT
+            elif key in ("type", "category") and isinstance(value, str):
+                table = "types" if key == "type" else "categories"
+                code = ids[table].get(value)
+                if code is None:
+                    code = ids[table][value] = len(names[table])
+                    names[table].append(value)
+                if key == "type":
+                    t, flags = code, flags | _F_TYPE
+                else:
+                    c, flags = code, flags | _F_CATEGORY
+            elif key == "note" and isinstance(value, str):
+                note, flags = heap_add(value.encode("utf-8")), flags | _F_NOTE
+            else:
+                extra[key] = value
+        if extra:
+            extra_ref = heap_add(json.dumps(extra, ensure_ascii=False).encode("utf-8"))
+        _BIN_RECORD.pack_into(body, i * _BIN_RECORD.size, rid, amount, day, t, c, flags, *note, *extra_ref)
+    if len(heap) >= 2 ** 32 or max(len(names["types"]), len(names["categories"])) >= 2 ** 16:
+        raise ValueError("账本过大，无法保存为二进制格式")
+
+    names_raw = json.dumps(names, ensure_ascii=False).encode("utf-8")
+    meta_raw = json.dumps({k: v for k, v in data.items() if k != "records"}, ensure_ascii=False).encode("utf-8")
+    names_off = _BIN_HEADER.size
+    meta_off = names_off + len(names_raw)
+    records_off = -(-(meta_off + len(meta_raw)) // 8) * 8
+    heap_off = records_off + len(body)
+    header = _BIN_HEADER.pack(_BIN_MAGIC, _BIN_VERSION, _BIN_RECORD.size, 0, len(records), records_off,
+                              heap_off, len(heap), names_off, len(names_raw), meta_off, len(meta_raw))
+    padding = bytes(records_off - meta_off - len(meta_raw))
+    return b"".join((header, names_raw, meta_raw, padding, body, heap))
+
+
+def write_binary_ledger(path, data, backups=0):
+    _atomic_write(path, _encode_binary(data), backups)
+
+
+# 只读映射一个二进制账本。作为记录序列使用 (len / 下标 / 切片 / 迭代)，每次访问才解码对应记录；
+# meta 为 records 以外的字段。columns() 直接从记录数组构建 ColumnStore，不经过字典。
+class MappedLedger:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:  # 空文件
+                raise LedgerCorruptError(path, e, list_backups(path)) from e
+        try:
+            self._parse_header()
+        except (struct.error, ValueError, KeyError, TypeError) as e:
+            self._mm.close()
+            raise LedgerCorruptError(path, e, list_backups(path)) from e
+
+    def _parse_header(self):
+        mm = self._mm
+        (magic, version, record_size, _, self.count, self._records_off, self._heap_off, heap_len,
+         names_off, names_len, meta_off, meta_len) = _BIN_HEADER.unpack_from(mm, 0)
+        if magic != _BIN_MAGIC or version != _BIN_VERSION or record_size != _BIN_RECORD.size:
+            raise ValueError("不是 PocketTrack 二进制账本或版本不支持")
+        if self._heap_off + heap_len > len(mm) or self._records_off + self.count * record_size > self._heap_off:
+            raise ValueError("文件被截断")
+        names = json.loads(mm[names_off:names_off + names_len])
+        self.types = [sys.intern(t) for t in names["types"]]
+        self.categories = [sys.intern(c) for c in names["categories"]]
+        self.meta = json.loads(mm[meta_off:meta_off + meta_len])
+        if not isinstance(self.meta, dict):
+            raise ValueError("文件头损坏")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._mm.close()
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self.count))]
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError("record index out of range")
+        fields = _BIN_RECORD.unpack_from(self._mm, self._records_off + i * _BIN_RECORD.size)
+        return self._decode(fields, {})
+
+    def __iter__(self):
+        end = self._records_off + self.count * _BIN_RECORD.size
+        dates = {}  # 同一天的记录很多，日期字符串共用
+        with memoryview(self._mm)[self._records_off:end] as view:
+            for fields in _BIN_RECORD.iter_unpack(view):
+                yield self._decode(fields, dates)
+
+    def _decode(self, fields, dates):
+        rid, amount, day, t, c, flags, note_off, note_len, extra_off, extra_len = fields
+        mm, heap = self._mm, self._heap_off
+        r = {}
+        if flags & _F_ID:
+            r["id"] = rid
+        if flags & _F_DATE:
+            text = dates.get(day)
+            if text is None:
+                text = dates[day] = day.rstrip(b"\0").decode("utf-8")
+            r["date"] = text
+        if flags & _F_TYPE:
+            r["type"] = self.types[t]
+        if flags & _F_AMOUNT:
+            r["amount"] = int(amount) if flags & _F_INT else amount
+        if flags & _F_CATEGORY:
+            r["category"] = self.categories[c]
+        if flags & _F_NOTE:
+            r["note"] = mm[heap + note_off:heap + note_off + note_len].decode("utf-8")
+        if extra_len:
+            r.update(json.loads(mm[heap + extra_off:heap + extra_off + extra_len]))
+        return r
+
+    # 解码成与 JSON 快照相同的 dict
+    def to_data(self):
+        data = dict(self.meta)
+        data["records"] = list(self)
+        return data
+
+    def columns(self):
+        _load_numpy()
+        n = self.count
+        dtype = np.dtype({"names": ["amount", "date", "type", "category", "flags"],
+                          "formats": ["<f8", "S16", "<u2", "<u2", "<u2"],
+                          "offsets": [8, 16, 32, 34, 36], "itemsize": _BIN_RECORD.size})
+        rows = np.frombuffer(self._mm, dtype=dtype, count=n, offset=self._records_off)
+        try:
+            if n and (rows["flags"] & _F_COLUMNS != _F_COLUMNS).any():
+                return ColumnStore.from_records(list(self))  # 有字段不在定长列中，逐条处理
+            cols = ColumnStore(capacity=max(1024, n))
+            cols.amount[:n] = rows["amount"]
+            cols.type_code[:n] = rows["type"]
+            cols.cat_code[:n] = rows["category"]
+            cols.day[:n] = cols._day_codes(rows["date"].astype("S10"))
+        finally:
+            del rows  # 释放对映射内存的引用，之后才能 close()
+        cols.n = n
+        cols.types, cols.categories = list(self.types), list(self.categories)
+        cols._type_ids = {t: i for i, t in enumerate(cols.types)}
+        cols._cat_ids = {c: i for i, c in enumerate(cols.categories)}
+        return cols
+
+
+def _read_binary_ledger(path):
+    with MappedLedger(path) as ledger:
+        try:
+            return ledger.to_data()
+        except (struct.error, ValueError) as e:
+            raise LedgerCorruptError(path, e, list_backups(path)) from e
+
+
+# 二进制快照 + 追加日志：日志与 JournalStorage 相同 (JSON 行)，只有快照换成二进制格式。
+# json_path 指向的旧 JSON 账本在二进制文件不存在时一次性转换过来。
+# 只读且没有待重放的日志时 (批量报表)，records 直接是映射的 MappedLedger，不逐条解码
+class BinaryStorage(JournalStorage):
+    read_file = staticmethod(_read_binary_ledger)
+    write_file = staticmethod(write_binary_ledger)
+
+    def __init__(self, path, json_path=None, **kwargs):
+        super().__init__(path, **kwargs)
+        self.json_path = json_path
+
+    def _load(self):
+        if not os.path.exists(self.path) and self.json_path and os.path.exists(self.json_path):
+            self._migrate_json()
+        journals = (self.journal_path, self.old_journal_path)
+        if self.read_only and os.path.exists(self.path) and not any(map(os.path.exists, journals)):
+            self.replayed = []
+            ledger = MappedLedger(self.path)
+            data = dict(ledger.meta)
+            data["records"] = ledger
+            self._seq = data.pop("journal_seq", 0)
+            return data
+        return super()._load()
+
+    def _migrate_json(self):
+        storage = JournalStorage(self.json_path, read_only=True)
+        try:
+            legacy = storage.load()
+        finally:
+            storage.close()  # 关闭锁文件句柄
+        legacy.pop("rollups", None)  # 日志重放后可能过期，打开时重新统计
+        write_binary_ledger(self.path, legacy)
+
+
+# 按扩展名在 JSON 与二进制账本之间转换 (连同尚未压缩的日志)，返回记录条数
+def convert_ledger(src, dst):
+    storage = (BinaryStorage if src.endswith(BINARY_EXT) else JournalStorage)(src, read_only=True)
+    try:
+        data = storage.load()
+    finally:
+        storage.close()
+    if storage.replayed:
+        data.pop("rollups", None)
+    if isinstance(data["records"], MappedLedger):
+        with data["records"] as ledger:
+            data["records"] = list(ledger)
+    if dst.endswith(BINARY_EXT):
+        write_binary_ledger(dst, data)
+    else:
+        _atomic_write_json(dst, data)
+    return len(data["records"])
+
+
+# ---------- 增量聚合 ----------
+# 物化的统计结果：总收支、分类支出、按天收支。每次增删 O(1) 更新，刷新界面时不再全量扫描。
+# 计数归零时移除对应键并把金额清零，避免浮点残差和空分类/空日期残留。
+class LedgerAggregates:
+    def __init__(self):
+        self.version = 0
+        self.totals = {"收入": 0.0, "支出": 0.0}
+        self.cat_expense = {}
+        self.daily = {"收入": {}, "支出": {}}    # 日期 -> 金额
+        self.weekly = {"收入": {}, "支出": {}}   # 周一的日期 -> 金额
+        self.monthly = {"收入": {}, "支出": {}}  # YYYY-MM -> 金额
+        self.days = []  # 有记录的日期，升序
+        self._type_counts = defaultdict(int)
+        self._cat_counts = {}
+        self._day_counts = {}
+        self._bucket_counts = {"week": {}, "month": {}}
+        self.budget = None  # BudgetTracker：支出变化时同步累加当前预算周期的花费
+
+    @classmethod
+    def from_records(cls, records):
+        agg = cls()
+        for r in records:
+            agg.add(r)
+        agg.version = 0
+        return agg
+
+    # 从列式存储分组结果批量建立，启动时不再逐条处理
+    @classmethod
+    def from_columns(cls, columns):
+        agg = cls()
+        for r_type, category, day, amount, count in columns.groups():
+            agg.apply(r_type, category, day, amount, count)
+        agg.version = 0
+        return agg
+
+    # 持久化形式：按天的 (金额, 条数) 与分类支出的 (金额, 条数)；周/月汇总加载时由日汇总推出
+    def to_dict(self):
+        return {
+            "version": ROLLUP_VERSION,
+            "daily": {t: {d: [amount, self._day_counts[t][d]] for d, amount in per_day.items()}
+                      for t, per_day in self.daily.items()},
+            "categories": {c: [amount, self._cat_counts[c]] for c, amount in self.cat_expense.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        agg = cls()
+        for r_type, per_day in state["daily"].items():
+            for day, (amount, count) in per_day.items():
+                agg._apply_day(r_type, day, amount, count)
+        for category, (amount, count) in state["categories"].items():
+            _bump(agg.cat_expense, agg._cat_counts, category, amount, count)
+        agg.version = 0
+        return agg
+
+    @property
+    def income(self):
+        return self.totals["收入"]
+
+    @property
+    def expense(self):
+        return self.totals["支出"]
+
+    @property
+    def count(self):
+        return sum(self._type_counts.values())
+
+    # unit: "day" / "week" / "month"，返回 {类型: {桶: 金额}}
+    def buckets(self, unit):
+        return {"day": self.daily, "week": self.weekly, "month": self.monthly}[unit]
+
+    def add(self, record):
+        self.apply(record["type"], record["category"], record["date"][:10], record["amount"], 1)
+
+    def remove(self, record):
+        self.apply(record["type"], record["category"], record["date"][:10], -record["amount"], -1)
+
+    def apply(self, r_type, category, day, amount, count):
+        if r_type == "支出":
+            _bump(self.cat_expense, self._cat_counts, category, amount, count)
+            if self.budget is not None:
+                self.budget.apply(category, day, amount)
+        self._apply_day(r_type, day, amount, count)
+
+    def _apply_day(self, r_type, day, amount, count):
+        self.version += 1
+        self._type_counts[r_type] += count
+        self.totals[r_type] = self.totals.get(r_type, 0.0) + amount if self._type_counts[r_type] else 0.0
+
+        per_day = self.daily.setdefault(r_type, {})
+        day_counts = self._day_counts.setdefault(r_type, {})
+        _bump(per_day, day_counts, day, amount, count)
+        for unit, rollup, key in (("week", self.weekly, _week_start(day)), ("month", self.monthly, day[:7])):
+            _bump(rollup.setdefault(r_type, {}), self._bucket_counts[unit].setdefault(r_type, {}),
+                  key, amount, count)
+
+        n = self._day_counts.setdefault(None, {}).get(day, 0) + count
+        if n > 0:
+            if n == count:
+                bisect.insort(self.days, day)
+            self._day_counts[None][day] = n
+        else:
+            self._day_counts[None].pop(day, None)
+            i = bisect.bisect_left(self.days, day)
+            if i < len(self.days) and self.days[i] == day:
+                self.days.pop(i)
+
+
+# 快照里保存的汇总 + 加载时日志重放的增减量 (sign, 记录)；版本不符或条数对不上时返回 None，由调用方全量统计
+def _restore_aggregates(state, records, replayed=()):
+    if not state or state.get("version") != ROLLUP_VERSION:
+        return None
+    agg = LedgerAggregates.from_dict(state)
+    for sign, r in replayed:
+        if sign > 0:
+            agg.add(r)
+        else:
+            agg.remove(r)
+    if agg.count != len(records):
+        return None
+    agg.version = 0
+    return agg
+
+
+_WEEK_STARTS = {}
+
+
+# 日期所在周的周一 (YYYY-MM-DD)；日期数量有限，结果缓存
+def _week_start(day):
+    week = _WEEK_STARTS.get(day)
+    if week is None:
+        try:
+            d = date.fromisoformat(day)
+            week = (d - timedelta(days=d.weekday())).isoformat()
+        except ValueError:
+            week = day
+        _WEEK_STARTS[day] = week
+    return week
+
+
+def _bump(sums, counts, key, amount, count):
+    n = counts.get(key, 0) + count
+    if n > 0:
+        counts[key] = n
+        sums[key] = sums.get(key, 0.0) + amount
+    else:
+        counts.pop(key, None)
+        sums.pop(key, None)
+
+
+# ---------- 列式存储 ----------
+# 与 data["records"] 同步的 NumPy 列：金额 float64、类型/分类编码、日期 (1970 起的天数 int32)。
+# 按容量倍增预分配，追加均摊 O(1)；删除与 list.pop 一样移动后续元素。
+# 合计用 np.bincount、按天序列用分组求和，全部向量化。首次使用时才构建 (见 DataManager.columns)。
+# 旧账本里不是 YYYY-MM-DD 的日期 (如 "2026/02/26") 编码为从 _ODD_DAY 起的序号，原文保存在 odd_days：
+# 合计与分类统计照常包含这些行，按天序列不包含，分组时还原成原来的日期字符串
+_ODD_DAY = -2 ** 31
+_ODD_DAY_LIMIT = _ODD_DAY + 2 ** 24  # 正常日期的编码都大于它 (约公元前 44000 年)
+
+
+class ColumnStore:
+    def __init__(self, capacity=1024):
+        _load_numpy()
+        self.n = 0
+        self.amount = np.empty(capacity, dtype=np.float64)
+        self.type_code = np.empty(capacity, dtype=np.int8)
+        self.cat_code = np.empty(capacity, dtype=np.int16)
+        self.day = np.empty(capacity, dtype=np.int32)
+        self.types = []       # 编码 -> 类型字符串
+        self.categories = []  # 编码 -> 分类字符串
+        self.odd_days = []    # 编码 - _ODD_DAY -> 无法解析的日期字符串
+        self._type_ids = {}
+        self._cat_ids = {}
+        self._odd_ids = {}
+
+    @classmethod
+    def from_records(cls, records):
+        cols = cls(capacity=max(1024, len(records)))
+        n = len(records)
+        if n:
+            cols.amount[:n] = [r["amount"] for r in records]
+            cols.type_code[:n] = [cols._code(cols._type_ids, cols.types, r["type"]) for r in records]
+            cols.cat_code[:n] = [cols._code(cols._cat_ids, cols.categories, r["category"]) for r in records]
+            cols.day[:n] = cols._day_codes([r["date"][:10] for r in records])
+        cols.n = n
+        return cols
+
+    # 日期 (str 或 bytes) -> 天数；整批解析失败时逐个解析，只有无法解析的那几个编码为 odd_days 序号
+    def _day_codes(self, days):
+        try:
+            return np.array(days, dtype="datetime64[D]").astype(np.int32)
+        except ValueError:
+            return np.array([self._day_code(d.decode("utf-8") if isinstance(d, bytes) else d) for d in days],
+                            dtype=np.int32)
+
+    def _day_code(self, day):
+        try:
+            return np.datetime64(day, "D").astype(np.int32)
+        except ValueError:
+            return _ODD_DAY + self._code(self._odd_ids, self.odd_days, day)
+
+    @staticmethod
+    def _code(ids, names, value):
+        code = ids.get(value)
+        if code is None:
+            code = ids[value] = len(names)
+            names.append(value)
+        return code
+
+    def _grow(self):
+        cap = len(self.amount) * 2
+        for name in ("amount", "type_code", "cat_code", "day"):
+            old = getattr(self, name)
+            new = np.empty(cap, dtype=old.dtype)
+            new[:self.n] = old[:self.n]
+            setattr(self, name, new)
+
+    def append(self, record):
+        if self.n == len(self.amount):
+            self._grow()
+        i = self.n
+        self.amount[i] = record["amount"]
+        self.type_code[i] = self._code(self._type_ids, self.types, record["type"])
+        self.cat_code[i] = self._code(self._cat_ids, self.categories, record["category"])
+        self.day[i] = self._day_code(record["date"][:10])
+        self.n += 1
+
+    def extend(self, records):
+        k = len(records)
+        while self.n + k > len(self.amount):
+            self._grow()
+        if k:
+            n = self.n
+            self.amount[n:n + k] = [r["amount"] for r in records]
+            self.type_code[n:n + k] = [self._code(self._type_ids, self.types, r["type"]) for r in records]
+            self.cat_code[n:n + k] = [self._code(self._cat_ids, self.categories, r["category"]) for r in records]
+            self.day[n:n + k] = self._day_codes([r["date"][:10] for r in records])
+            self.n += k
+
+    def set(self, index, record):
+        self.amount[index] = record["amount"]
+        self.type_code[index] = self._code(self._type_ids, self.types, record["type"])
+        self.cat_code[index] = self._code(self._cat_ids, self.categories, record["category"])
+        self.day[index] = self._day_code(record["date"][:10])
+
+    def delete(self, index):
+        n = self.n
+        for col in (self.amount, self.type_code, self.cat_code, self.day):
+            col[index:n - 1] = col[index + 1:n]
+        self.n -= 1
+
+    def _select(self, rows):
+        n = self.n
+        if rows is None:
+            return self.amount[:n], self.type_code[:n], self.cat_code[:n], self.day[:n]
+        return self.amount[rows], self.type_code[rows], self.cat_code[rows], self.day[rows]
+
+    # 各类型合计；rows 为行号数组 (None 表示全部)
+    def totals(self, rows=None):
+        amount, type_code, _, _ = self._select(rows)
+        sums = np.bincount(type_code, weights=amount, minlength=len(self.types))
+        return {t: float(sums[code]) for code, t in enumerate(self.types)}
+
+    # 某类型的分类合计，按在 rows 中首次出现的顺序返回
+    def category_sums(self, r_type, rows=None):
+        amount, type_code, cat_code, _ = self._select(rows)
+        code = self._type_ids.get(r_type)
+        if code is None:
+            return {}
+        mask = type_code == code
+        cats, first = np.unique(cat_code[mask], return_index=True)
+        sums = np.bincount(cat_code[mask], weights=amount[mask], minlength=len(self.categories))
+        return {self.categories[c]: float(sums[c]) for c in cats[np.argsort(first)]}
+
+    # 按天分组求和，返回 (升序日期字符串数组, 金额数组)；r_type 为 None 时不区分类型
+    def daily(self, r_type=None, rows=None):
+        amount, type_code, _, day = self._select(rows)
+        mask = day >= _ODD_DAY_LIMIT
+        if r_type is not None:
+            mask &= type_code == self._type_ids.get(r_type, -1)
+        amount, day = amount[mask], day[mask]
+        days, inverse = np.unique(day, return_inverse=True)
+        sums = np.bincount(inverse, weights=amount, minlength=len(days))
+        return days.astype("datetime64[D]").astype(str), sums
+
+    # (类型, 分类, 日期, 金额合计, 条数) 分组，用于批量建立 LedgerAggregates
+    def groups(self):
+        amount, type_code, cat_code, day = self._select(None)
+        key = (type_code.astype(np.int64) << 48) | (cat_code.astype(np.int64) << 32) | (day.astype(np.int64) & 0xFFFFFFFF)
+        keys, first, inverse, counts = np.unique(key, return_index=True, return_inverse=True, return_counts=True)
+        sums = np.bincount(inverse, weights=amount, minlength=len(keys))
+        first_days = day[first]
+        days = first_days.astype("datetime64[D]").astype(str).astype(object)
+        for i in np.flatnonzero(first_days < _ODD_DAY_LIMIT):
+            days[i] = self.odd_days[first_days[i] - _ODD_DAY]
+        for i in np.argsort(first):
+            yield (self.types[type_code[first[i]]], self.categories[cat_code[first[i]]],
+                   str(days[i]), float(sums[i]), int(counts[i]))
+
+
+# ---------- 搜索索引 ----------
+# 列表搜索框的内存索引，键为记录 id (不随删除移位)。
+# 分类词表很小，按分类分组后扫描词表即可；备注建立 1~3 字 n-gram 倒排表，
+# 更长的查询取各 trigram 倒排表的交集再逐条校验。连续输入时若新查询包含上一次查询，
+# 只在上一次的结果里校验，候选集随输入逐步收窄。
+class SearchIndex:
+    GRAM = 3
+
+    def __init__(self):
+        self.version = 0
+        self._by_cat = {}                # 小写分类 -> {key}
+        self._grams = defaultdict(set)   # 备注 n-gram -> {key}
+        self._fields = {}                # key -> (小写分类, 小写备注)
+        self._last = (None, -1, None)    # (查询, 版本, 结果)
+
+    def _note_grams(self, note):
+        grams = set()
+        for n in range(1, self.GRAM + 1):
+            for i in range(len(note) - n + 1):
+                grams.add(note[i:i + n])
+        return grams
+
+    def add(self, key, record):
+        cat = sys.intern(record["category"].lower())
+        note = record.get("note", "").lower()
+        self._fields[key] = (cat, note)
+        self._by_cat.setdefault(cat, set()).add(key)
+        for g in self._note_grams(note):
+            self._grams[g].add(key)
+        self.version += 1
+
+    def remove(self, key):
+        cat, note = self._fields.pop(key)
+        keys = self._by_cat[cat]
+        keys.discard(key)
+        if not keys:
+            del self._by_cat[cat]
+        for g in self._note_grams(note):
+            posting = self._grams[g]
+            posting.discard(key)
+            if not posting:
+                del self._grams[g]
+        self.version += 1
+
+    def _matches(self, key, ft):
+        cat, note = self._fields[key]
+        return ft in cat or ft in note
+
+    # 返回匹配 ft (已小写) 的 key 集合
+    def search(self, ft):
+        last_ft, last_version, last_result = self._last
+        if last_ft and last_version == self.version and last_ft in ft:
+            result = {k for k in last_result if self._matches(k, ft)}
+        else:
+            result = set()
+            for cat, keys in self._by_cat.items():
+                if ft in cat:
+                    result |= keys
+            if len(ft) <= self.GRAM:
+                result |= self._grams.get(ft, set())
+            else:
+                postings = sorted((self._grams.get(ft[i:i + self.GRAM], set())
+                                   for i in range(len(ft) - self.GRAM + 1)), key=len)
+                candidates = set.intersection(*postings) - result
+                result |= {k for k in candidates if ft in self._fields[k][1]}
+        self._last = (ft, self.version, result)
+        return result
+
+
+# ---------- 预算 ----------
+# data["budget"] = {"period": "week" / "month" / "year", "total": 总预算或 null,
+#                   "categories": {分类: 预算}, "warn": 提醒比例}
+# 旧账本里只有一个数字，视为每月总预算。
+BUDGET_PERIODS = ("week", "month", "year")
+BUDGET_WARN_RATIO = 0.8  # 花费达到预算的这个比例时提醒
+
+
+def normalize_budget(raw):
+    if raw is None:
+        return None
+    if isinstance(raw, (int, float)) and not isinstance(raw, bool):
+        raw = {"total": raw}
+    if not isinstance(raw, dict):
+        raise ValueError(f"预算格式无效：{raw!r}")
+    period = raw.get("period", "month")
+    if period not in BUDGET_PERIODS:
+        raise ValueError(f"预算周期无效：{period}")
+    categories = raw.get("categories") or {}
+    if not isinstance(categories, dict):
+        raise ValueError(f"分类预算格式无效：{categories!r}")
+    limits = {None: raw.get("total")}
+    limits.update(categories)
+    try:
+        limits = {k: float(v) for k, v in limits.items() if v is not None}
+        warn = float(raw.get("warn", BUDGET_WARN_RATIO))
+    except (TypeError, ValueError):
+        raise ValueError(f"预算格式无效：{raw!r}") from None
+    if any(not (math.isfinite(v) and v > 0) for v in limits.values()):  # inf (JSON 的 Infinity) 会让使用率永远是 0%
+        raise ValueError("预算金额必须大于 0")
+    if not 0 < warn <= 1:
+        raise ValueError("提醒比例应在 0 ~ 1 之间")
+    return {"period": period, "total": limits.pop(None, None), "categories": limits, "warn": warn}
+
+
+# 当前预算周期内的花费计数器。由 LedgerAggregates.apply 在每次支出增删时调用，
+# 只更新总花费和该分类的花费并重新判定这两项，与历史记录多少无关。
+# 周期切换 (跨月/跨周) 后 expired() 为真，由 DataManager 按日期索引重新统计一次
+class BudgetTracker:
+    def __init__(self, config, today=None):
+        self.config = normalize_budget(config)
+        self.version = 0
+        self.spent = 0.0
+        self.by_category = {}
+        self._levels = {}  # 预算项 (None 为总预算) -> "near" / "over"，只保留需要提醒的项
+        if self.config is None:
+            self.start = self.end = None
+            self._limits = {}
+        else:
+            self.start, self.end = period_range(self.config["period"], today)
+            self._limits = dict(self.config["categories"])
+            if self.config["total"] is not None:
+                self._limits[None] = self.config["total"]
+
+    @property
+    def active(self):
+        return bool(self._limits)
+
+    def expired(self, today=None):
+        return self.active and (today or date.today()).isoformat() > self.end
+
+    def reset(self, spent, by_category):
+        self.spent = spent
+        self.by_category = dict(by_category)
+        self._levels.clear()
+        for key in self._limits:
+            self._evaluate(key)
+        self.version += 1
+
+    def apply(self, category, day, amount):
+        if self.start is None or not self.start <= day <= self.end:
+            return
+        self.spent += amount
+        self.by_category[category] = self.by_category.get(category, 0.0) + amount
+        self._evaluate(None)
+        self._evaluate(category)
+        self.version += 1
+
+    def _evaluate(self, key):
+        limit = self._limits.get(key)
+        if limit is None:
+            return
+        spent = self.spent if key is None else self.by_category.get(key, 0.0)
+        if spent >= limit:
+            self._levels[key] = "over"
+        elif spent >= limit * self.config["warn"]:
+            self._levels[key] = "near"
+        else:
+            self._levels.pop(key, None)
+
+    # [(分类或 None, 已花费, 预算, "ok" / "near" / "over")]，总预算在前
+    def status(self):
+        items = sorted(self._limits.items(), key=lambda kv: kv[0] is not None)
+        return [(key, self.spent if key is None else self.by_category.get(key, 0.0), limit,
+                 self._levels.get(key, "ok")) for key, limit in items]
+
+    # 需要提醒的项，超支的在前
+    def alerts(self):
+        return sorted((item for item in self.status() if item[3] != "ok"), key=lambda item: item[3] != "over")
+
+
+# ---------- 数据管理类 ----------
+class DataManager:
+    def __init__(self, storage=None):
+        self.storage = storage if storage is not None else JournalStorage(DATA_FILE)
+        self.lock = threading.RLock()  # 后台搜索线程与主线程共享数据时使用
+        self._load_state()
+
+    # 读入账本并重建汇总、索引和预算 (启动时；其他进程的变更无法增量接续时)
+    def _load_state(self):
+        self.data = self.load()
+        rollups = self.data.pop("rollups", None)
+        migrated = _assign_ids(self.data)
+        # 快照里有持久化的汇总时直接恢复，不再逐条统计
+        records = self.data["records"]
+        self.agg = (_restore_aggregates(rollups, records, self.storage.replayed)
+                    or LedgerAggregates.from_records(records))
+        self.storage.replayed = []
+        self.storage.snapshot_extras = lambda: {"rollups": self.agg.to_dict()}
+        if migrated:
+            self.storage.save(self.data)  # 旧账本补上 id 后立即写快照，之后的日志都按 id 记录
+        self._columns = None
+        self._build_indexes()
+        self._init_budget()
+
+    # 列式存储在第一次过滤统计时才构建，启动阶段不需要导入 numpy
+    @property
+    def columns(self):
+        with self.lock:
+            if self._columns is None:
+                self._columns = ColumnStore.from_records(self.data["records"])
+            return self._columns
+
+    # 记录按追加顺序分配递增 id，_keys 与 records 一一对应且有序，因此 id -> 列表位置可以二分得到；
+    # _by_id 为 id -> 记录的哈希索引；_date_index 为按 (日期, id) 升序的列表，日期范围查询二分定位。
+    # 记录基本按时间先后添加，排序和之后的插入几乎都落在末尾
+    def _build_indexes(self):
+        records = self.data["records"]
+        self.search_index = SearchIndex()
+        self._keys = [r["id"] for r in records]
+        self._by_id = dict(zip(self._keys, records))
+        self._date_index = sorted(zip((r["date"] for r in records), self._keys))
+        for key, r in zip(self._keys, records):
+            self.search_index.add(key, r)
+
+    def load(self):
+        with PERF.span("load"):
+            return self.storage.load()
+
+    def save(self):
+        with PERF.span("save"), self._write_lock():
+            self.storage.save(self.data)
+
+    def close(self):
+        self.storage.close()
+
+    # 修改账本时持有数据锁和文件锁，并先读入其他进程写入的变更，新分配的 id 与日志序号不会冲突
+    @contextlib.contextmanager
+    def _write_lock(self):
+        with self.lock, self.storage.file_lock:
+            self._catch_up()
+            yield
+
+    # 读入其他进程写入的变更 (界面定时调用)，返回账本是否有变化。
+    # 先不加锁比较锁文件里的序号，没有变化时只读几十个字节；blocking=False 时其他进程正持有锁就下次再试
+    def refresh(self, blocking=False):
+        if not self.storage.has_changes():
+            return False
+        with PERF.span("refresh"), self.lock:
+            if not self.storage.file_lock.acquire(blocking):
+                return False
+            try:
+                return self._catch_up()
+            finally:
+                self.storage.file_lock.release()
+
+    # 调用方持有两把锁：逐条应用新日志条目，接不上时完整重新加载
+    def _catch_up(self):
+        ops = self.storage.changes()
+        if ops is None or not all(map(self._apply_op, ops)):
+            self._reload()
+            return True
+        return bool(ops)
+
+    # 其他进程写入的日志条目；旧格式 (按位置删除、没有 id) 无法增量应用时返回 False
+    def _apply_op(self, op):
+        kind = op["op"]
+        if kind == "add":
+            record = op["record"]
+            if "id" not in record or record["id"] in self._by_id:
+                return False
+            self.data["next_id"] = max(self.data["next_id"], record["id"] + 1)
+            self._insert(record)
+            if self._columns is not None:
+                self._columns.append(record)
+        elif kind == "update":
+            self._replace(op["record"])
+        elif kind == "delete":
+            if "id" not in op:
+                return False
+            self._remove(op["id"])
+        elif kind == "meta":
+            _set_meta(self.data, op["key"], op["value"])
+            if op["key"] == "budget":
+                self._init_budget()
+        return True
+
+    # 界面按版本号判断是否需要重绘，重新加载后版本号接着递增
+    def _reload(self):
+        version = self.agg.version
+        with PERF.span("reload"):
+            self._load_state()
+        self.agg.version = version + 1
+
+    # 批量录入：之后的增删改照常立即更新内存中的账本、索引和聚合，持久化推迟到 flush() 一次完成
+    def defer_writes(self):
+        with self.lock:
+            self.storage.defer()
+            self._catch_up()
+
+    def flush(self):
+        with PERF.span("flush"), self.lock:
+            self.storage.flush_deferred()
+
+    def get_record(self, record_id):
+        return self._by_id.get(record_id)
+
+    # 按当前预算周期统计一次花费，之后由聚合增量更新
+    # 账本里存的预算无效 (手工编辑、旧版本写入的 0 等) 时按未设置预算处理，不影响打开账本
+    def _init_budget(self):
+        with self.lock:
+            try:
+                tracker = BudgetTracker(self.data.get("budget"))
+            except ValueError as e:
+                print(f"忽略无效的预算设置：{e}", file=sys.stderr)
+                tracker = BudgetTracker(None)
+            if tracker.active:
+                by_category = self._period_spend(tracker.start, tracker.end)
+                tracker.reset(sum(by_category.values(), 0.0), by_category)
+            self.agg.budget = self.budget = tracker
+
+    # {分类: 支出}，日期索引只扫描区间内的记录
+    def _period_spend(self, start, end):
+        by_category = {}
+        for _, r in self.query(start=start, end=end, r_type="支出"):
+            by_category[r["category"]] = by_category.get(r["category"], 0.0) + r["amount"]
+        return by_category
+
+    def set_budget(self, budget):
+        normalize_budget(budget)  # 先校验，格式无效时不改动账本
+        with self._write_lock():
+            if budget is None:
+                self.data.pop("budget", None)
+            else:
+                self.data["budget"] = budget
+            self._save_budget()
+            self._init_budget()
+
+    def _save_budget(self):
+        self.storage.meta_changed(self.data, "budget")
+
+    # 当前周期的预算状态；跨入新周期时重新统计
+    def budget_status(self):
+        with self.lock:
+            if self.budget.expired():
+                self._init_budget()
+            return self.budget.status()
+
+    def budget_alerts(self):
+        with self.lock:
+            if self.budget.expired():
+                self._init_budget()
+            return self.budget.alerts()
+
+    def _insert(self, record):
+        record_id = record["id"]
+        self.data["records"].append(record)
+        self._keys.append(record_id)
+        self._by_id[record_id] = record
+        bisect.insort(self._date_index, (record["date"], record_id))
+        self.search_index.add(record_id, record)
+        self.agg.add(record)
+
+    # 返回新记录的 id
+    def add_record(self, r_type, amount, category, note="", date=None):
+        with self._write_lock():
+            record = {
+                "id": self._take_ids(1),
+                "date": date or datetime.now().strftime("%Y-%m-%d %H:%M"),
+                "type": r_type,
+                "amount": float(amount),
+                "category": category,
+                "note": note,
+            }
+            self._insert(record)
+            if self._columns is not None:
+                self._columns.append(record)
+            self.storage.record_added(self.data, record)
+            return record["id"]
+
+    # 批量追加已校验的记录：一次更新索引/聚合，一次持久化
+    def add_records(self, records):
+        with self._write_lock():
+            start = self._take_ids(len(records))
+            records = [dict(r, id=record_id) for record_id, r in enumerate(records, start)]
+            for r in records:
+                self._insert(r)
+            if self._columns is not None:
+                self._columns.extend(records)
+            self.storage.records_added(self.data, records)
+
+    def _take_ids(self, count):
+        start = self.data["next_id"]
+        self.data["next_id"] = start + count
+        return start
+
+    # 按 id 删除：哈希索引 O(1) 定位记录，二分得到列表位置；返回是否删除
+    def delete_record(self, record_id):
+        with self._write_lock():
+            if self._remove(record_id) is None:
+                return False
+            self.storage.record_deleted(self.data, record_id)
+            return True
+
+    # 从账本、索引和聚合中移除，返回被删除的记录
+    def _remove(self, record_id):
+        record = self._by_id.pop(record_id, None)
+        if record is None:
+            return None
+        pos = bisect.bisect_left(self._keys, record_id)
+        del self.data["records"][pos]
+        del self._keys[pos]
+        self._unindex_date(record_id, record)
+        self.search_index.remove(record_id)
+        if self._columns is not None:
+            self._columns.delete(pos)
+        self.agg.remove(record)
+        return record
+
+    # 修改记录字段 (date / type / amount / category / note)，返回新记录；id 不存在时返回 None。
+    # 新记录替换旧字典而不是原地修改，后台写快照时复制的列表不受影响
+    def update_record(self, record_id, **changes):
+        with self._write_lock():
+            old = self._by_id.get(record_id)
+            if old is None:
+                return None
+            record = _updated_record(old, changes)
+            self._replace(record)
+            self.storage.record_updated(self.data, record)
+            return record
+
+    # 用新记录替换同 id 的旧记录并更新索引和聚合
+    def _replace(self, record):
+        record_id = record["id"]
+        old = self._by_id.get(record_id)
+        if old is None:
+            return
+        pos = bisect.bisect_left(self._keys, record_id)
+        self.data["records"][pos] = record
+        self._by_id[record_id] = record
+        if record["date"] != old["date"]:
+            self._unindex_date(record_id, old)
+            bisect.insort(self._date_index, (record["date"], record_id))
+        self.search_index.remove(record_id)
+        self.search_index.add(record_id, record)
+        if self._columns is not None:
+            self._columns.set(pos, record)
+        self.agg.remove(old)
+        self.agg.add(record)
+
+    def _unindex_date(self, record_id, record):
+        i = bisect.bisect_left(self._date_index, (record["date"], record_id))
+        del self._date_index[i]
+
+    # 日期范围 (YYYY-MM-DD，含两端) 内的记录 id，升序
+    def _ids_in_range(self, start=None, end=None):
+        index = self._date_index
+        lo = bisect.bisect_left(index, (start,)) if start else 0
+        hi = bisect.bisect_left(index, (end + "~",)) if end else len(index)  # "~" 排在当天所有时刻之后
+        return sorted(record_id for _, record_id in index[lo:hi])
+
+    # 组合查询的记录 id (升序)：先用日期索引和搜索索引缩小候选，再逐条检查类型/分类/金额
+    def _query_ids(self, start=None, end=None, r_type=None, categories=None,
+                   min_amount=None, max_amount=None, text=""):
+        ranged = bool(start or end)
+        keys = self._ids_in_range(start, end) if ranged else self._keys
+        if text:
+            hits = self.search_index.search(text.lower())
+            keys = sorted(hits.intersection(keys) if ranged else hits)
+        if r_type or categories or min_amount is not None or max_amount is not None:
+            match = _record_filter(None, None, r_type, categories, min_amount, max_amount)
+            by_id = self._by_id
+            keys = [k for k in keys if match(by_id[k])]
+        return keys
+
+    # 组合查询：日期范围、类型、分类集合、金额范围 (含两端)、分类/备注关键字，条件可任意组合。
+    # 返回按 id 升序的 [(记录 id, 记录)]
+    def query(self, start=None, end=None, r_type=None, categories=None,
+              min_amount=None, max_amount=None, text=""):
+        with PERF.span("query"), self.lock:
+            by_id = self._by_id
+            return [(k, by_id[k]) for k in self._query_ids(start, end, r_type, categories,
+                                                           min_amount, max_amount, text)]
+
+    # 返回 (收入, 支出, 分类支出, [(记录 id, 记录)])，列表按 id (即添加顺序) 升序；
+    # criteria 为 query() 的其他条件 (start / end / r_type / categories / min_amount / max_amount)
+    def get_stats(self, filter_text="", **criteria):
+        with PERF.span("get_stats"), self.lock:
+            if not filter_text and not _has_criteria(criteria):
+                indexed = list(zip(self._keys, self.data["records"]))
+                PERF.observe("get_stats.scanned", len(indexed))
+                return self.agg.income, self.agg.expense, dict(self.agg.cat_expense), indexed
+
+            by_id = self._by_id
+            hits = self._query_ids(text=filter_text, **criteria)
+            indexed = [(k, by_id[k]) for k in hits]
+            PERF.observe("get_stats.scanned", len(indexed))
+
+            columns = self.columns
+            rows = np.array([bisect.bisect_left(self._keys, k) for k in hits], dtype=np.intp)
+            totals = columns.totals(rows)
+            cat_map = columns.category_sums("支出", rows)
+
+        return totals.get("收入", 0), totals.get("支出", 0), cat_map, indexed
+
+    # 按条件流式遍历记录 (不预先构建完整列表)。每批在锁内按记录 id 续读，
+    # 遍历期间主线程增删记录也不会跳过或重复。on_batch(已扫描条数, 需要扫描的总条数) 用于报告进度。
+    # 给出日期范围时先从日期索引取出范围内的 id，只遍历这些记录
+    def iter_records(self, start=None, end=None, r_type=None, categories=None, text="",
+                     batch_size=2000, on_batch=None, min_amount=None, max_amount=None):
+        match = _record_filter(start, end, r_type, categories, min_amount, max_amount)
+        hits = ranged = total = None
+        next_key = scanned = 0
+        while True:
+            with self.lock:
+                if text and hits is None:
+                    hits = set(self.search_index.search(text.lower()))
+                if (start or end) and ranged is None:
+                    ranged = self._ids_in_range(start, end)
+                if total is None:
+                    total = len(self._keys if ranged is None else ranged)
+                if ranged is None:
+                    i = bisect.bisect_left(self._keys, next_key)
+                    keys = self._keys[i:i + batch_size]
+                    batch = self.data["records"][i:i + batch_size]
+                else:
+                    i = bisect.bisect_left(ranged, next_key)
+                    keys = ranged[i:i + batch_size]
+                    batch = [self._by_id.get(k) for k in keys]
+            if not batch:
+                return
+            next_key = keys[-1] + 1
+            for key, r in zip(keys, batch):
+                if r is not None and (hits is None or key in hits) and match(r):
+                    yield r
+            scanned += len(batch)
+            if on_batch:
+                on_batch(scanned, total)
+
+
+# 日期范围 (YYYY-MM-DD，含两端)、类型、分类集合、金额范围 (含两端) 的组合过滤条件
+def _record_filter(start=None, end=None, r_type=None, categories=None, min_amount=None, max_amount=None):
+    categories = set(categories) if categories else None
+
+    def match(r):
+        day = r["date"][:10]
+        return ((start is None or day >= start) and (end is None or day <= end)
+                and (r_type is None or r["type"] == r_type)
+                and (categories is None or r["category"] in categories)
+                and (min_amount is None or r["amount"] >= min_amount)
+                and (max_amount is None or r["amount"] <= max_amount))
+    return match
+
+
+def _has_criteria(criteria):
+    return any(v not in (None, "") for v in criteria.values())
+
+
+# 旧账本的记录没有 id：按现有顺序补上递增 id，并记录下一个可用 id。返回是否改动了数据
+def _assign_ids(data):
+    records = data.setdefault("records", [])
+    next_id = max([data.get("next_id", 1)] + [r["id"] + 1 for r in records if "id" in r])
+    migrated = False
+    for r in records:
+        if "id" not in r:
+            r["id"] = next_id
+            next_id += 1
+            migrated = True
+    if any(a["id"] >= b["id"] for a, b in zip(records, records[1:])):
+        # id 必须随位置递增 (按 id 二分定位)；顺序被打乱的旧文件整体重新编号
+        for next_id, r in enumerate(records, 1):
+            r["id"] = next_id
+        next_id = len(records) + 1
+        migrated = True
+    migrated = migrated or data.get("next_id") != next_id
+    data["next_id"] = next_id
+    return migrated
+
+
+_EDITABLE_FIELDS = ("date", "type", "amount", "category", "note")
+
+
+def _updated_record(record, changes):
+    unknown = set(changes) - set(_EDITABLE_FIELDS)
+    if unknown:
+        raise ValueError(f"不能修改的字段: {', '.join(sorted(unknown))}")
+    record = dict(record, **changes)
+    record["amount"] = float(record["amount"])
+    return record
+
+
+# ---------- SQLite 数据管理 ----------
+_RECORD_COLUMNS = "date, type, amount, category, note"
+
+
+# row 为 (id, date, type, amount, category, note)
+def _row_to_record(row):
+    return {"id": row[0], "date": row[1], "type": row[2], "amount": row[3], "category": row[4], "note": row[5]}
+
+
+# query() 条件对应的 WHERE 子句 (日期范围走 idx_records_date)，没有条件时为 "WHERE 1"
+def _sql_where(start=None, end=None, r_type=None, categories=None, min_amount=None, max_amount=None, text=""):
+    clauses, params = [], []
+    if start:
+        clauses.append("date >= ?")
+        params.append(start)
+    if end:
+        clauses.append("date < ?")
+        params.append(end + "~")  # 含结束当天的所有时刻
+    if r_type:
+        clauses.append("type = ?")
+        params.append(r_type)
+    if categories:
+        clauses.append(f"category IN ({', '.join('?' * len(categories))})")
+        params.extend(categories)
+    if min_amount is not None:
+        clauses.append("amount >= ?")
+        params.append(min_amount)
+    if max_amount is not None:
+        clauses.append("amount <= ?")
+        params.append(max_amount)
+    if text:
+        ft = text.lower()
+        clauses.append("(instr(lower(category), ?) > 0 OR instr(lower(note), ?) > 0)")
+        params.extend((ft, ft))
+    return f"WHERE {' AND '.join(clauses) or '1'}", params
+
+
+# 只读序列视图：按需从 SQLite 取记录，支持 len / 迭代 / reversed / 下标
+class _SqliteRecords:
+    def __init__(self, conn, where="", params=(), indexed=False):
+        self._conn = conn
+        self._where = where
+        self._params = tuple(params)
+        self._indexed = indexed  # True 时产出 (记录 id, 记录)
+
+    def _query(self, order="ASC", limit=-1, offset=0):
+        sql = (f"SELECT id, {_RECORD_COLUMNS} FROM records {self._where} "
+               f"ORDER BY id {order} LIMIT ? OFFSET ?")
+        for row in self._conn.execute(sql, self._params + (limit, offset)):
+            record = _row_to_record(row)
+            yield (row[0], record) if self._indexed else record
+
+    def __len__(self):
+        sql = f"SELECT COUNT(*) FROM records {self._where}"
+        return self._conn.execute(sql, self._params).fetchone()[0]
+
+    def __iter__(self):
+        return self._query()
+
+    def __reversed__(self):
+        return self._query("DESC")
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                return list(self)[i]
+            return list(self._query(limit=max(stop - start, 0), offset=start))
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("record index out of range")
+        return next(self._query(limit=1, offset=i))
+
+
+class SqliteDataManager(DataManager):
+    def __init__(self, db_path=SQLITE_FILE, json_path=DATA_FILE):
+        self.db_path = db_path
+        self.json_path = json_path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._deferred = False
+        self.data = self.load()
+        self.agg = self._load_aggregates()
+        self._data_version = self._read_data_version()
+        self._init_budget()
+
+    # 启动时直接读 rollups 表建立增量聚合 (行数只与 类型×分类×天数 有关)，之后随增删更新
+    def _load_aggregates(self):
+        agg = LedgerAggregates()
+        rows = self.conn.execute(
+            "SELECT type, category, day, amount, count FROM rollups WHERE count > 0 ORDER BY rowid")
+        for r_type, category, day, amount, count in rows:
+            agg.apply(r_type, category, day, amount, count)
+        agg.version = 0
+        return agg
+
+    def load(self):
+        with PERF.span("load"):
+            return self._load()
+
+    def _load(self):
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS records (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date TEXT NOT NULL,
+                type TEXT NOT NULL,
+                amount REAL NOT NULL,
+                category TEXT NOT NULL,
+                note TEXT NOT NULL DEFAULT ''
+            );
+            CREATE INDEX IF NOT EXISTS idx_records_date ON records(date);
+            CREATE INDEX IF NOT EXISTS idx_records_type ON records(type);
+            CREATE INDEX IF NOT EXISTS idx_records_category ON records(category);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+
+            -- 按 (类型, 分类, 天) 汇总，由触发器随记录增删改维护；count 归零的行保留，rowid 即首次出现顺序
+            CREATE TABLE IF NOT EXISTS rollups (
+                type TEXT NOT NULL,
+                category TEXT NOT NULL,
+                day TEXT NOT NULL,
+                amount REAL NOT NULL DEFAULT 0,
+                count INTEGER NOT NULL DEFAULT 0,
+                UNIQUE (type, category, day)
+            );
+            CREATE TRIGGER IF NOT EXISTS rollups_insert AFTER INSERT ON records BEGIN
+                INSERT INTO rollups (type, category, day, amount, count)
+                VALUES (NEW.type, NEW.category, substr(NEW.date, 1, 10), NEW.amount, 1)
+                ON CONFLICT (type, category, day)
+                DO UPDATE SET amount = amount + excluded.amount, count = count + 1;
+            END;
+            CREATE TRIGGER IF NOT EXISTS rollups_delete AFTER DELETE ON records BEGIN
+                UPDATE rollups SET amount = CASE WHEN count = 1 THEN 0 ELSE amount - OLD.amount END,
+                                   count = count - 1
+                WHERE type = OLD.type AND category = OLD.category AND day = substr(OLD.date, 1, 10);
+            END;
+            CREATE TRIGGER IF NOT EXISTS rollups_update AFTER UPDATE ON records BEGIN
+                UPDATE rollups SET amount = CASE WHEN count = 1 THEN 0 ELSE amount - OLD.amount END,
+                                   count = count - 1
+                WHERE type = OLD.type AND category = OLD.category AND day = substr(OLD.date, 1, 10);
+                INSERT INTO rollups (type, category, day, amount, count)
+                VALUES (NEW.type, NEW.category, substr(NEW.date, 1, 10), NEW.amount, 1)
+                ON CONFLICT (type, category, day)
+                DO UPDATE SET amount = amount + excluded.amount, count = count + 1;
+            END;
+        """)
+        if self._meta("migrated") is None:
+            self._migrate_json()
+        if self._meta("rollups") is None:
+            self._rebuild_rollups()
+        data = {"records": _SqliteRecords(self.conn)}
+        budget = self._meta("budget")
+        if budget is not None:
+            data["budget"] = json.loads(budget)
+        return data
+
+    def _meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    # 一次性从 money_data.json 迁移 (整批单事务)，保留记录原有的 id
+    def _migrate_json(self):
+        storage = JournalStorage(self.json_path, read_only=True)
+        try:
+            legacy = storage.load()
+        finally:
+            storage.close()  # 关闭锁文件句柄
+        _assign_ids(legacy)
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT INTO records (id, {_RECORD_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)",
+                [(r["id"], r["date"], r["type"], float(r["amount"]), r["category"], r.get("note", ""))
+                 for r in legacy["records"]],
+            )
+            if "budget" in legacy:
+                self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('budget', ?)",
+                                  (json.dumps(legacy["budget"]),))
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('migrated', ?)",
+                              (self.json_path,))
+
+    # 旧数据库没有 rollups 表时用一次 GROUP BY 补建
+    def _rebuild_rollups(self):
+        with self.conn:
+            self.conn.execute("DELETE FROM rollups")
+            self.conn.execute(
+                "INSERT INTO rollups (type, category, day, amount, count) "
+                "SELECT type, category, substr(date, 1, 10), SUM(amount), COUNT(*) FROM records "
+                "GROUP BY type, category, substr(date, 1, 10) ORDER BY MIN(id)")
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('rollups', ?)", (str(ROLLUP_VERSION),))
+
+    def save(self):
+        with PERF.span("save"):
+            self.conn.commit()
+
+    # 多进程并发写入由 SQLite 自己加锁；修改前只需读入其他连接提交的变更
+    @contextlib.contextmanager
+    def _write_lock(self):
+        with self.lock:
+            self.refresh()
+            yield
+
+    # 其他连接提交过修改时 data_version 会变：重新读取 rollups 汇总和预算，记录本身每次都直接查询
+    def refresh(self, blocking=False):
+        with self.lock:
+            version = self._read_data_version()
+            if version == self._data_version:
+                return False
+            self._data_version = version
+            with PERF.span("refresh"):
+                budget = self._meta("budget")
+                _set_meta(self.data, "budget", json.loads(budget) if budget is not None else None)
+                previous = self.agg.version
+                self.agg = self._load_aggregates()
+                self.agg.version = previous + 1
+                self._init_budget()
+            return True
+
+    def _read_data_version(self):
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    # 批量录入期间的修改不逐条提交，flush() 时一次 commit
+    def defer_writes(self):
+        self._deferred = True
+
+    def flush(self):
+        with PERF.span("flush"), self.lock:
+            self._deferred = False
+            self.conn.commit()
+
+    def _transaction(self):
+        return contextlib.nullcontext() if self._deferred else self.conn
+
+    def add_record(self, r_type, amount, category, note="", date=None):
+        record = {"date": date or datetime.now().strftime("%Y-%m-%d %H:%M"), "type": r_type,
+                  "amount": float(amount), "category": category, "note": note}
+        with self._write_lock(), self._transaction():
+            cur = self.conn.execute(
+                f"INSERT INTO records ({_RECORD_COLUMNS}) VALUES (?, ?, ?, ?, ?)",
+                (record["date"], r_type, record["amount"], category, note),
+            )
+            self.agg.add(record)
+            return cur.lastrowid
+
+    def add_records(self, records):
+        with self._write_lock(), self._transaction():
+            self.conn.executemany(
+                f"INSERT INTO records ({_RECORD_COLUMNS}) VALUES (?, ?, ?, ?, ?)",
+                [(r["date"], r["type"], r["amount"], r["category"], r["note"]) for r in records],
+            )
+            for r in records:
+                self.agg.add(r)
+
+    # 直接汇总按天维护的 rollups 表，不扫描记录
+    def _period_spend(self, start, end):
+        with self.lock:
+            return dict(self.conn.execute(
+                "SELECT category, SUM(amount) FROM rollups WHERE type = '支出' AND day BETWEEN ? AND ? "
+                "GROUP BY category", (start, end)))
+
+    def _save_budget(self):
+        with self.lock, self.conn:
+            if "budget" in self.data:
+                self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('budget', ?)",
+                                  (json.dumps(self.data["budget"], ensure_ascii=False),))
+            else:
+                self.conn.execute("DELETE FROM meta WHERE key = 'budget'")
+
+    def get_record(self, record_id):
+        row = self.conn.execute(f"SELECT id, {_RECORD_COLUMNS} FROM records WHERE id = ?",
+                                (record_id,)).fetchone()
+        return _row_to_record(row) if row else None
+
+    def delete_record(self, record_id):
+        with self._write_lock():
+            record = self.get_record(record_id)
+            if record is None:
+                return False
+            with self._transaction():
+                self.conn.execute("DELETE FROM records WHERE id = ?", (record_id,))
+            self.agg.remove(record)
+            return True
+
+    def update_record(self, record_id, **changes):
+        with self._write_lock():
+            old = self.get_record(record_id)
+            if old is None:
+                return None
+            record = _updated_record(old, changes)
+            with self._transaction():
+                self.conn.execute(
+                    "UPDATE records SET date = ?, type = ?, amount = ?, category = ?, note = ? WHERE id = ?",
+                    tuple(record[f] for f in _EDITABLE_FIELDS) + (record_id,))
+            self.agg.remove(old)
+            self.agg.add(record)
+            return record
+
+    def query(self, start=None, end=None, r_type=None, categories=None,
+              min_amount=None, max_amount=None, text=""):
+        where, params = _sql_where(start, end, r_type, categories, min_amount, max_amount, text)
+        with PERF.span("query"), self.lock:
+            return list(_SqliteRecords(self.conn, where, params, indexed=True))
+
+    def get_stats(self, filter_text="", **criteria):
+        if not filter_text and not _has_criteria(criteria):
+            with self.lock:
+                return (self.agg.income, self.agg.expense, dict(self.agg.cat_expense),
+                        _SqliteRecords(self.conn, indexed=True))
+
+        where, params = _sql_where(text=filter_text, **criteria)
+
+        with PERF.span("get_stats"), self.lock:
+            sums = dict(self.conn.execute(
+                f"SELECT type, SUM(amount) FROM records {where} GROUP BY type", params))
+            # 按首次出现顺序输出分类，与列表版本的 cat_map 保持一致 (饼图配色稳定)
+            cat_map = dict(self.conn.execute(
+                f"SELECT category, SUM(amount) FROM records {where} AND type = '支出' "
+                f"GROUP BY category ORDER BY MIN(id)", params))
+        income = sums.get("收入", 0)
+        expense = sums.get("支出", 0)
+
+        indexed = _SqliteRecords(self.conn, where, params, indexed=True)
+        return income, expense, cat_map, indexed
+
+    def iter_records(self, start=None, end=None, r_type=None, categories=None, text="",
+                     batch_size=2000, on_batch=None, min_amount=None, max_amount=None):
+        where, params = _sql_where(start, end, r_type, categories, min_amount, max_amount, text)
+        last_id = scanned = 0
+        if on_batch:
+            with self.lock:
+                total = self.conn.execute(f"SELECT COUNT(*) FROM records {where}", params).fetchone()[0]
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    f"SELECT id, {_RECORD_COLUMNS} FROM records "
+                    f"{where} AND id > ? ORDER BY id LIMIT ?",
+                    params + [last_id, batch_size]).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            for row in rows:
+                yield _row_to_record(row)
+            scanned += len(rows)
+            if on_batch:
+                on_batch(scanned, total)
+
+
+# ---------- 导入导出 ----------
+CSV_HEADER = ["时间", "类型", "分类", "金额", "备注"]
+
+
+# 流式导出 CSV：records 可以是任意可迭代对象 (如 DataManager.iter_records)，按批写入。
+# 先写 .part 临时文件，完成后再替换目标文件；cancelled() 为真时中止并删除临时文件，返回 None。
+def export_csv(path, records, progress=None, cancelled=None, batch_size=2000):
+    tmp = path + ".part"
+    written = 0
+    try:
+        with PERF.span("export_csv"), open(tmp, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_HEADER)
+            batch = []
+            for r in records:
+                batch.append([r["date"], r["type"], r["category"], r["amount"], r.get("note", "")])
+                if len(batch) >= batch_size:
+                    if cancelled and cancelled():
+                        raise ExportCancelled
+                    writer.writerows(batch)
+                    written += len(batch)
+                    batch.clear()
+                    if progress:
+                        progress(written)
+            writer.writerows(batch)
+            written += len(batch)
+        os.replace(tmp, path)
+    except ExportCancelled:
+        os.remove(tmp)
+        return None
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    PERF.observe("export_csv.rows", written)
+    if progress:
+        progress(written)
+    return written
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+# 读取 CSV (export_csv 的格式) 或 JSON ({"records": [...]} 或记录数组) 文件，
+# 返回 (合法记录, 错误列表)。错误为 (行号, 原因)。
+def parse_import_file(path):
+    if path.lower().endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        rows = raw.get("records", []) if isinstance(raw, dict) else raw
+        start = 1
+    else:
+        with open(path, "r", newline="", encoding="utf-8-sig") as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header != CSV_HEADER:
+                return [], [(1, "表头应为: " + ",".join(CSV_HEADER))]
+            rows = [dict(zip(("date", "type", "category", "amount", "note"), row)) for row in reader]
+        start = 2
+
+    records, errors = [], []
+    for line, raw in enumerate(rows, start):
+        try:
+            records.append(normalize_record(raw))
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            errors.append((line, str(e) or type(e).__name__))
+    return records, errors
+
+
+def normalize_record(raw):
+    date = str(raw["date"]).strip()
+    try:
+        parsed = datetime.fromisoformat(date)
+    except ValueError:
+        raise ValueError(f"无法识别的时间: {date}") from None
+    if len(date) != 16 or date[10] != " ":
+        date = parsed.strftime("%Y-%m-%d %H:%M")
+    r_type = str(raw["type"]).strip()
+    if r_type not in CATEGORIES:
+        raise ValueError(f"未知类型: {r_type}")
+    amount = float(raw["amount"])
+    if not (math.isfinite(amount) and amount > 0):  # nan / inf 会让汇总变成 inf，JSON 输出也不合法
+        raise ValueError(f"金额必须为正数: {amount}")
+    category = str(raw["category"]).strip()
+    if not category:
+        raise ValueError("分类为空")
+    note = raw.get("note") or ""
+    return {"date": date, "type": r_type, "amount": amount, "category": category, "note": str(note)}
+
+
+def _record_identity(r):
+    return r["date"], r["type"], float(r["amount"]), r["category"], r.get("note", "")
+
+
+# 批量导入：校验、去重 (与现有记录及文件内部重复)、按时间排序后一次性写入。
+# 返回 (新增条数, 重复跳过条数, 错误列表)
+def import_records(db, path):
+    records, errors = parse_import_file(path)
+    with db.lock:
+        seen = {_record_identity(r) for r in db.iter_records()}
+        fresh = []
+        for r in records:
+            ident = _record_identity(r)
+            if ident not in seen:
+                seen.add(ident)
+                fresh.append(r)
+        fresh.sort(key=lambda r: r["date"])
+        if fresh:
+            db.add_records(fresh)
+    return len(fresh), len(records) - len(fresh), errors
+
+
+# ---------- 图表与报表数据 ----------
+# 图表只依赖少量聚合值 (分类支出 / 最近 N 天)
+# 趋势图的时间范围：(汇总粒度, 桶数)；"auto" 按跨度选周或月
+CHART_SPANS = {"7d": ("day", 7), "30d": ("day", 30), "12m": ("month", 12), "all": ("auto", None)}
+AUTO_WEEKLY_MAX = 26  # 全部范围不超过这么多周时按周显示，否则按月
+
+
+# 取最近 n 个有数据的桶 (n 为 None 时全部)
+def _recent_keys(keys, n):
+    return sorted(keys) if n is None else sorted(heapq.nlargest(n, keys))
+
+
+def chart_unit(agg, span="7d"):
+    unit = CHART_SPANS[span][0]
+    if unit == "auto":
+        weeks = set().union(*agg.weekly.values())
+        unit = "week" if len(weeks) <= AUTO_WEEKLY_MAX else "month"
+    return unit
+
+
+def chart_series(agg, mode, span="7d"):
+    if mode == "pie":
+        return tuple(agg.cat_expense.items())
+    unit, n = chart_unit(agg, span), CHART_SPANS[span][1]
+    buckets = agg.buckets(unit)
+    out = buckets["支出"]
+    if mode == "bar":
+        return tuple((k, out[k]) for k in _recent_keys(out, n))
+    inc = buckets["收入"]
+    keys = agg.days[-n:] if unit == "day" and n else _recent_keys(set(inc) | set(out), n)
+    return tuple((k, inc.get(k, 0), out.get(k, 0)) for k in keys)
+
+
+# 常用统计区间 -> (开始, 结束) 日期 (YYYY-MM-DD，含两端)；"all" 为不限
+PERIODS = ("all", "week", "month", "last_month", "30d", "year")
+
+
+def period_range(period, today=None):
+    today = today or date.today()
+    if period == "all":
+        return None, None
+    if period == "week":
+        monday = today - timedelta(days=today.weekday())
+        return monday.isoformat(), (monday + timedelta(days=6)).isoformat()
+    if period == "month":
+        first = today.replace(day=1)
+    elif period == "last_month":
+        first = (today.replace(day=1) - timedelta(days=1)).replace(day=1)
+    elif period == "30d":
+        return (today - timedelta(days=29)).isoformat(), today.isoformat()
+    elif period == "year":
+        return f"{today.year}-01-01", f"{today.year}-12-31"
+    else:
+        raise ValueError(f"unknown period: {period}")
+    last = (first.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    return first.isoformat(), last.isoformat()
+
+
+# 汇总报表：卡片数字、分类支出、最近 days 天收支
+def build_report(db, days=7):
+    agg = db.agg
+    return _report(len(db.data["records"]), agg.totals, agg.cat_expense, agg.daily, days)
+
+
+def _report(records, totals, categories, daily, days):
+    income, expense = totals.get("收入", 0.0), totals.get("支出", 0.0)
+    daily_in, daily_out = daily.get("收入", {}), daily.get("支出", {})
+    recent = sorted(heapq.nlargest(days, set(daily_in) | set(daily_out)))
+    return {
+        "records": records,
+        "income": income,
+        "expense": expense,
+        "balance": income - expense,
+        "categories": dict(categories),
+        "daily": [{"date": d, "income": daily_in.get(d, 0), "expense": daily_out.get(d, 0)} for d in recent],
+    }
+
+
+# ---------- 多账本批量报表 ----------
+# 每个账本在子进程中只读加载并用列式分组求和，返回可 pickle 的部分结果，主进程再合并。
+def ledger_summary(path):
+    storage = (BinaryStorage if path.endswith(BINARY_EXT) else JournalStorage)(path, read_only=True)
+    try:
+        data = storage.load()
+    finally:
+        storage.close()
+    records = data.get("records", [])
+    agg = _restore_aggregates(data.get("rollups"), records, storage.replayed)
+    if agg is None:
+        columns = records.columns() if isinstance(records, MappedLedger) else ColumnStore.from_records(records)
+        agg = LedgerAggregates.from_columns(columns)
+    if isinstance(records, MappedLedger):
+        records.close()
+    return {
+        "path": path,
+        "records": len(records),
+        "totals": dict(agg.totals),
+        "categories": dict(agg.cat_expense),
+        "daily": {t: dict(v) for t, v in agg.daily.items()},
+    }
+
+
+def merge_summaries(parts):
+    merged = {"records": 0, "totals": defaultdict(float), "categories": {},
+              "daily": defaultdict(lambda: defaultdict(float))}
+    for part in parts:
+        merged["records"] += part["records"]
+        for t, amount in part["totals"].items():
+            merged["totals"][t] += amount
+        for cat, amount in part["categories"].items():
+            merged["categories"][cat] = merged["categories"].get(cat, 0.0) + amount
+        for t, per_day in part["daily"].items():
+            target = merged["daily"][t]
+            for day, amount in per_day.items():
+                target[day] += amount
+    return merged
+
+
+# 账本列表：目录下的 *.json / *.ptl 加上直接给出的文件。
+# 同名的 x.json 与 x.ptl 是同一个账本 (二进制后端首次打开时转换而来，之后只写 .ptl)，只保留 .ptl
+def discover_ledgers(inputs):
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(sorted(os.path.join(item, name) for name in os.listdir(item)
+                                if name.endswith((".json", BINARY_EXT))))
+        else:
+            paths.append(item)
+    stems = {}
+    for path in paths:
+        key = os.path.normcase(os.path.abspath(os.path.splitext(path)[0]))
+        if key not in stems or path.endswith(BINARY_EXT) and not stems[key].endswith(BINARY_EXT):
+            stems[key] = path
+    return list(stems.values())
+
+
+# 用进程池并行汇总多个账本。workers=1 时在本进程顺序执行。
+# 单个账本读取失败不会中断整体，记录在 errors 中。
+def batch_report(paths, workers=None, days=7):
+    parts, errors = [], []
+    if workers == 1 or len(paths) <= 1:
+        results = map(_safe_summary, paths)
+        executor = None
+    else:
+        workers = workers or os.cpu_count() or 1
+        executor = ProcessPoolExecutor(max_workers=workers)
+        results = executor.map(_safe_summary, paths, chunksize=max(1, len(paths) // (workers * 4)))
+    try:
+        for part in results:
+            (errors if "error" in part else parts).append(part)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    merged = merge_summaries(parts)
+    report = _report(merged["records"], merged["totals"], merged["categories"], merged["daily"], days)
+    report["ledgers"] = [{"path": p["path"], "records": p["records"],
+                          "income": p["totals"].get("收入", 0.0), "expense": p["totals"].get("支出", 0.0)}
+                         for p in parts]
+    report["errors"] = errors
+    return report
+
+
+def _safe_summary(path):
+    try:
+        return ledger_summary(path)
+    except (OSError, ValueError, KeyError, TypeError, LedgerCorruptError) as e:
+        return {"path": path, "error": str(e)}
+
+
+def open_ledger(path=DATA_FILE, backend=STORAGE_BACKEND):
+    if backend == "sqlite":
+        return SqliteDataManager(db_path=os.path.splitext(path)[0] + ".db", json_path=path)
+    if backend == "journal":
+        return DataManager(JournalStorage(path))
+    if backend == "binary":
+        if path.endswith(BINARY_EXT):
+            return DataManager(BinaryStorage(path))
+        return DataManager(BinaryStorage(os.path.splitext(path)[0] + BINARY_EXT, json_path=path))
+    raise ValueError(f"unknown storage backend: {backend}")
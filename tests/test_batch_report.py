@@ -0,0 +1,104 @@
+# 多账本批量报表的回归测试：合并结果与逐个统计一致、同名 .json / .ptl 只算一次、
+# 只读加载不创建锁文件也不等待正在写入的实例。
+#
+#   python -m pytest tests
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pocket_core import (JournalStorage, batch_report, convert_ledger, discover_ledgers,  # noqa: E402
+                         ledger_summary, open_ledger)
+
+
+def _ledger(path, backend="journal", base=1.0, count=6):
+    db = open_ledger(str(path), backend)
+    for i in range(count):
+        db.add_record("收入" if i == 0 else "支出", base + i, "工资" if i == 0 else "餐饮", f"n{i}",
+                      date=f"2026-03-{1 + i:02d} 12:00")
+    return db
+
+
+def _totals(db):
+    income, expense, _, _ = db.get_stats()
+    return income, expense
+
+
+# ---------- 合并 ----------
+@pytest.mark.parametrize("workers", [1, 2])
+def test_merged_totals_match_each_ledger(tmp_path, workers):
+    expected = [0.0, 0.0, 0]
+    for name, backend, base in (("a.json", "journal", 1.0), ("b.ptl", "binary", 10.0)):
+        db = _ledger(tmp_path / name, backend, base)
+        income, expense = _totals(db)
+        expected[0] += income
+        expected[1] += expense
+        expected[2] += len(db.data["records"])
+        db.close()
+    (tmp_path / "broken.json").write_text("{not json", encoding="utf-8")
+
+    report = batch_report(discover_ledgers([str(tmp_path)]), workers=workers, days=3)
+    assert (report["income"], report["expense"], report["records"]) == pytest.approx(tuple(expected))
+    assert [e["path"] for e in report["errors"]] == [str(tmp_path / "broken.json")]  # 损坏的账本不影响其他
+    assert len(report["daily"]) == 3
+    assert report["categories"]["餐饮"] == report["expense"]
+
+
+def test_json_and_migrated_ptl_are_counted_once(tmp_path):
+    db = _ledger(tmp_path / "x.json")
+    db.close()
+    convert_ledger(str(tmp_path / "x.json"), str(tmp_path / "x.ptl"))
+    db = _ledger(tmp_path / "y.json")
+    db.close()
+
+    paths = discover_ledgers([str(tmp_path), str(tmp_path / "x.json")])
+    assert sorted(os.path.basename(p) for p in paths) == ["x.ptl", "y.json"]
+    assert batch_report(paths, workers=1)["records"] == 12
+
+
+# ---------- 只读加载 ----------
+def test_summary_does_not_create_lock_file(tmp_path):
+    db = _ledger(tmp_path / "a.json")
+    db.close()
+    os.remove(tmp_path / "a.lock")
+
+    assert ledger_summary(str(tmp_path / "a.json"))["records"] == 6
+    assert not (tmp_path / "a.lock").exists()
+
+
+def test_summary_does_not_wait_for_writer_lock(tmp_path):
+    db = _ledger(tmp_path / "a.json")
+    result = {}
+    with db.storage.file_lock:  # 正在运行的界面持有排他锁
+        reader = threading.Thread(target=lambda: result.update(ledger_summary(str(tmp_path / "a.json"))),
+                                  daemon=True)
+        reader.start()
+        reader.join(timeout=5)
+        assert not reader.is_alive()
+    assert result["records"] == 6
+    db.close()
+
+
+def test_read_only_load_retries_when_compacted_meanwhile(tmp_path):
+    db = _ledger(tmp_path / "a.json")
+    storage = JournalStorage(str(tmp_path / "a.json"), read_only=True)
+    load = storage._load
+    calls = []
+
+    # 第一次读完后另一个实例追加并压缩：快照与日志代数都变了，读到的内容作废重读
+    def racing_load():
+        data = load()
+        if not calls:
+            db.add_record("支出", 99.0, "餐饮", "late", date="2026-03-20 12:00")
+            db.save()
+        calls.append(len(data["records"]))
+        return data
+
+    storage._load = racing_load
+    data = storage.load()
+    storage.close()
+    assert calls == [6, 7]
+    assert len(data["records"]) == 7
+    db.close()
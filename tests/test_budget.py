@@ -0,0 +1,71 @@
+# 预算的回归测试：格式校验、当前周期花费计数器随增删更新、跨周期后重新统计。
+#
+#   python -m pytest tests
+import os
+import sys
+from datetime import date
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pocket_core import BudgetTracker, normalize_budget, open_ledger  # noqa: E402
+
+
+# ---------- 格式 ----------
+def test_legacy_number_is_monthly_total():
+    assert normalize_budget(500) == {"period": "month", "total": 500.0, "categories": {}, "warn": 0.8}
+
+
+@pytest.mark.parametrize("budget", [
+    {"period": "day", "total": 1},
+    {"total": float("nan")},
+    {"total": 100, "warn": 0},
+    {"total": 100, "warn": 1.5},
+    {"categories": ["餐饮"]},
+])
+def test_invalid_budget_is_rejected(budget):
+    with pytest.raises(ValueError):
+        normalize_budget(budget)
+
+
+# ---------- 计数器 ----------
+def test_tracker_counts_only_current_period():
+    tracker = BudgetTracker({"period": "month", "total": 100, "categories": {"餐饮": 50}}, today=date(2026, 3, 15))
+    assert (tracker.start, tracker.end) == ("2026-03-01", "2026-03-31")
+    tracker.reset(0.0, {})
+    tracker.apply("餐饮", "2026-02-28", 80.0)  # 上个月的支出不计入
+    tracker.apply("餐饮", "2026-03-02", 45.0)
+    assert tracker.alerts() == [("餐饮", 45.0, 50.0, "near")]
+    tracker.apply("交通", "2026-03-31", 60.0)
+    assert tracker.alerts() == [(None, 105.0, 100.0, "over"), ("餐饮", 45.0, 50.0, "near")]
+    tracker.apply("餐饮", "2026-03-02", -45.0)  # 删除记录
+    assert tracker.status() == [(None, 60.0, 100.0, "ok"), ("餐饮", 0.0, 50.0, "ok")]
+
+
+@pytest.mark.parametrize("period, today, last_day", [
+    ("week", date(2026, 3, 4), date(2026, 3, 8)),
+    ("month", date(2026, 2, 10), date(2026, 2, 28)),
+    ("year", date(2026, 6, 1), date(2026, 12, 31)),
+])
+def test_tracker_expires_after_period_end(period, today, last_day):
+    tracker = BudgetTracker({"period": period, "total": 10}, today=today)
+    assert tracker.end == last_day.isoformat()
+    assert not tracker.expired(last_day)
+    assert tracker.expired(date.fromordinal(last_day.toordinal() + 1))
+
+
+def test_ledger_recounts_when_period_rolls_over(tmp_path):
+    db = open_ledger(str(tmp_path / "ledger.json"), "journal")
+    this_month = date.today().strftime("%Y-%m")
+    db.add_record("支出", 30.0, "餐饮", date=f"{this_month}-01 09:00")
+    db.add_record("支出", 500.0, "餐饮", date="2020-01-15 09:00")
+    db.set_budget({"period": "month", "total": 100.0})
+    assert db.budget_status() == [(None, 30.0, 100.0, "ok")]
+
+    # 模拟账本从 2020 年 1 月一直开着：旧周期的计数器过期后按当前月份重新统计
+    stale = BudgetTracker(db.data["budget"], today=date(2020, 1, 20))
+    stale.reset(500.0, {"餐饮": 500.0})
+    db.agg.budget = db.budget = stale
+    assert db.budget_status() == [(None, 30.0, 100.0, "ok")]
+    assert db.budget is not stale
+    db.close()
@@ -0,0 +1,100 @@
+# 趋势图数据的回归测试：日 / 周 / 月汇总与逐条统计一致，各时间范围取最近的桶，
+# 删除后空桶消失，重新打开账本 (从快照恢复汇总) 后图表数据不变。
+#
+#   python -m pytest tests
+import os
+import random
+import sys
+from collections import defaultdict
+from datetime import date, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pocket_core import AUTO_WEEKLY_MAX, LedgerAggregates, chart_series, chart_unit, open_ledger  # noqa: E402
+
+
+def _record(day, r_type="支出", amount=1.0, category="餐饮"):
+    return {"date": f"{day} 12:00", "type": r_type, "amount": amount, "category": category, "note": ""}
+
+
+def _random_records(count=400, days=500, seed=3):
+    rng = random.Random(seed)
+    first = date(2025, 1, 1)
+    return [_record((first + timedelta(days=rng.randrange(days))).isoformat(),
+                    "收入" if rng.random() < 0.3 else "支出", float(rng.randint(1, 50)),
+                    rng.choice(["餐饮", "交通", "零食"]))
+            for _ in range(count)]
+
+
+def _brute(records, r_type, bucket):
+    sums = defaultdict(float)
+    for r in records:
+        if r["type"] == r_type:
+            sums[bucket(r["date"][:10])] += r["amount"]
+    return dict(sums)
+
+
+def _monday(day):
+    d = date.fromisoformat(day)
+    return (d - timedelta(days=d.weekday())).isoformat()
+
+
+@pytest.mark.parametrize("unit, bucket", [
+    ("day", lambda day: day),
+    ("week", _monday),
+    ("month", lambda day: day[:7]),
+])
+def test_rollups_match_brute_force(unit, bucket):
+    records = _random_records()
+    agg = LedgerAggregates.from_records(records)
+    for r_type in ("收入", "支出"):
+        assert agg.buckets(unit)[r_type] == pytest.approx(_brute(records, r_type, bucket))
+
+
+def test_spans_take_most_recent_buckets():
+    records = _random_records()
+    agg = LedgerAggregates.from_records(records)
+    out = _brute(records, "支出", lambda day: day)
+    last_days = sorted(out)[-7:]
+    assert chart_series(agg, "bar", "7d") == tuple((d, out[d]) for d in last_days)  # 金额都是整数，求和没有误差
+
+    months_out = _brute(records, "支出", lambda day: day[:7])
+    months_in = _brute(records, "收入", lambda day: day[:7])
+    keys = sorted(set(months_out) | set(months_in))[-12:]
+    assert chart_series(agg, "compare", "12m") == tuple((k, months_in.get(k, 0), months_out.get(k, 0)) for k in keys)
+
+    # 对比图按天显示时取最近有记录的日期 (收入或支出)
+    assert [k for k, _, _ in chart_series(agg, "compare", "30d")] == agg.days[-30:]
+
+
+def test_all_span_switches_from_weeks_to_months():
+    first = date(2026, 1, 5)
+    few = [_record((first + timedelta(weeks=i)).isoformat()) for i in range(AUTO_WEEKLY_MAX)]
+    agg = LedgerAggregates.from_records(few)
+    assert chart_unit(agg, "all") == "week"
+    assert len(chart_series(agg, "bar", "all")) == AUTO_WEEKLY_MAX
+
+    extra = _record((first + timedelta(weeks=AUTO_WEEKLY_MAX)).isoformat())
+    agg.add(extra)
+    assert chart_unit(agg, "all") == "month"
+    assert [k for k, _ in chart_series(agg, "bar", "all")] == sorted({r["date"][:7] for r in few + [extra]})
+
+
+def test_series_follow_deletes_and_survive_reopen(tmp_path):
+    path = str(tmp_path / "ledger.json")
+    db = open_ledger(path, "journal")
+    db.add_record("支出", 10.0, "餐饮", date="2026-03-01 09:00")
+    gone = db.add_record("支出", 4.0, "交通", date="2026-03-02 09:00")
+    db.add_record("收入", 50.0, "工资", date="2026-03-02 10:00")
+    db.delete_record(gone)
+    assert chart_series(db.agg, "bar", "7d") == (("2026-03-01", 10.0),)
+    assert chart_series(db.agg, "compare", "7d") == (("2026-03-01", 0, 10.0), ("2026-03-02", 50.0, 0))
+    assert chart_series(db.agg, "pie") == (("餐饮", 10.0),)
+    expected = {span: chart_series(db.agg, "compare", span) for span in ("7d", "30d", "12m", "all")}
+    db.save()
+    db.close()
+
+    db = open_ledger(path, "journal")
+    assert {span: chart_series(db.agg, "compare", span) for span in expected} == expected
+    db.close()
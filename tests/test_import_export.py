@@ -0,0 +1,105 @@
+# 导入导出的回归测试：逐行校验、错误行号、去重，以及 export_csv -> import_records 往返不丢字段。
+#
+#   python -m pytest tests
+import csv
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pocket_core import (CSV_HEADER, export_csv, import_records, normalize_record,  # noqa: E402
+                         open_ledger, parse_import_file)
+
+
+def _write_csv(path, rows, header=CSV_HEADER):
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    return str(path)
+
+
+def _fields(records):
+    return sorted((r["date"], r["type"], r["amount"], r["category"], r["note"]) for r in records)
+
+
+# ---------- 校验 ----------
+@pytest.mark.parametrize("amount", ["inf", "-inf", "nan", "Infinity", "-1", "0", "", "abc"])
+def test_invalid_amount_is_reported_with_line(tmp_path, amount):
+    path = _write_csv(tmp_path / "in.csv", [
+        ["2026-03-01 12:00", "支出", "餐饮", "12.5", "午饭"],
+        ["2026-03-02 12:00", "支出", "餐饮", amount, "坏行"],
+    ])
+    records, errors = parse_import_file(path)
+    assert [r["note"] for r in records] == ["午饭"]
+    assert [line for line, _ in errors] == [3]  # 表头占第 1 行
+
+
+def test_non_finite_amount_in_json_is_rejected(tmp_path):
+    path = tmp_path / "in.json"
+    path.write_text('{"records": [{"date": "2026-03-01 12:00", "type": "支出", "category": "餐饮", '
+                    '"amount": Infinity}, {"date": "2026-03-01 12:00", "type": "支出", '
+                    '"category": "餐饮", "amount": NaN}]}', encoding="utf-8")
+    records, errors = parse_import_file(str(path))
+    assert records == []
+    assert [line for line, _ in errors] == [1, 2]
+
+
+def test_other_invalid_fields(tmp_path):
+    path = _write_csv(tmp_path / "in.csv", [
+        ["昨天", "支出", "餐饮", "1", ""],
+        ["2026-03-01 12:00", "转账", "餐饮", "1", ""],
+        ["2026-03-01 12:00", "支出", " ", "1", ""],
+        ["2026-03-01", "收入", "工资", "100", ""],
+    ])
+    records, errors = parse_import_file(path)
+    assert [line for line, _ in errors] == [2, 3, 4]
+    assert records[0]["date"] == "2026-03-01 00:00"  # 只有日期时补成规范格式
+
+
+def test_wrong_header_rejects_whole_file(tmp_path):
+    path = _write_csv(tmp_path / "in.csv", [["2026-03-01 12:00", "支出", "餐饮", "1", ""]],
+                      header=["date", "type", "category", "amount", "note"])
+    records, errors = parse_import_file(path)
+    assert records == [] and errors[0][0] == 1
+
+
+def test_normalize_record_accepts_valid_amount():
+    r = normalize_record({"date": "2026-03-01 12:00", "type": "支出", "category": "餐饮", "amount": "3.5"})
+    assert r["amount"] == 3.5 and r["note"] == ""
+
+
+# ---------- 导入与导出 ----------
+def test_import_skips_duplicates_and_keeps_totals_finite(tmp_path):
+    db = open_ledger(str(tmp_path / "ledger.json"), "journal")
+    db.add_record("支出", 12.5, "餐饮", "午饭", date="2026-03-01 12:00")
+    path = _write_csv(tmp_path / "in.csv", [
+        ["2026-03-01 12:00", "支出", "餐饮", "12.5", "午饭"],   # 与账本重复
+        ["2026-03-02 08:00", "支出", "交通", "3", "地铁"],
+        ["2026-03-02 08:00", "支出", "交通", "3", "地铁"],      # 文件内部重复
+        ["2026-03-03 08:00", "支出", "交通", "inf", "坏行"],
+    ])
+    added, skipped, errors = import_records(db, path)
+    assert (added, skipped, [line for line, _ in errors]) == (1, 2, [5])
+    income, expense, cat_expense, _ = db.get_stats()
+    assert expense == 15.5
+    json.dumps([income, expense, cat_expense], allow_nan=False)  # stats --json 不能输出 Infinity / NaN
+    db.close()
+
+
+def test_export_import_round_trip(tmp_path):
+    src = open_ledger(str(tmp_path / "src.json"), "journal")
+    src.add_record("收入", 100.0, "工资", "三月", date="2026-03-01 09:00")
+    src.add_record("支出", 12.5, "餐饮", "含,逗号", date="2026-03-02 12:30")
+    src.add_record("支出", 3.0, "交通", "", date="2026-03-03 08:00")
+    out = str(tmp_path / "out.csv")
+    assert export_csv(out, src.iter_records(), batch_size=2) == 3
+    assert not os.path.exists(out + ".part")
+
+    dst = open_ledger(str(tmp_path / "dst.json"), "journal")
+    assert import_records(dst, out) == (3, 0, [])
+    assert _fields(dst.iter_records()) == _fields(src.iter_records())
+    src.close()
+    dst.close()
@@ -0,0 +1,86 @@
+# 组合查询的回归测试：query / get_stats / iter_records 的结果与逐条过滤一致，
+# 日期范围两端按天包含，SQLite 后端给出同样的结果。
+#
+#   python -m pytest tests
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pocket_core import open_ledger  # noqa: E402
+
+CATEGORIES = ["餐饮", "交通", "零食", "工资"]
+NOTES = ["午饭", "地铁", "奶茶", "", "三月工资"]
+
+CRITERIA = [
+    {},
+    {"start": "2026-03-01", "end": "2026-03-31"},
+    {"start": "2026-02-10"},
+    {"end": "2026-01-05"},
+    {"start": "2026-03-15", "end": "2026-03-15"},
+    {"r_type": "支出", "categories": ["餐饮", "零食"]},
+    {"min_amount": 5, "max_amount": 10},
+    {"start": "2026-02-01", "end": "2026-03-31", "r_type": "支出", "min_amount": 8},
+    {"text": "午"},
+    {"text": "饭", "start": "2026-03-01", "categories": ["餐饮"]},
+    {"start": "2027-01-01"},
+]
+
+
+def _ledger(path, backend, count=300, seed=11):
+    rng = random.Random(seed)
+    db = open_ledger(str(path), backend)
+    for _ in range(count):
+        r_type = "收入" if rng.random() < 0.2 else "支出"
+        day = f"2026-{rng.randint(1, 4):02d}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}"
+        db.add_record(r_type, float(rng.randint(1, 20)), rng.choice(CATEGORIES), rng.choice(NOTES), date=day)
+    for record_id in rng.sample([k for k, _ in db.query()], 30):  # 删除后日期索引也要同步
+        db.delete_record(record_id)
+    return db
+
+
+def _expected(records, start=None, end=None, r_type=None, categories=None, min_amount=None, max_amount=None,
+              text=""):
+    ft = text.lower()
+    return [r["id"] for r in records
+            if (start is None or r["date"][:10] >= start) and (end is None or r["date"][:10] <= end)
+            and (r_type is None or r["type"] == r_type) and (categories is None or r["category"] in categories)
+            and (min_amount is None or r["amount"] >= min_amount)
+            and (max_amount is None or r["amount"] <= max_amount)
+            and (ft in r["category"].lower() or ft in r["note"].lower())]
+
+
+@pytest.mark.parametrize("backend", ["journal", "sqlite"])
+def test_query_matches_linear_filter(tmp_path, backend):
+    db = _ledger(tmp_path / "ledger.json", backend)
+    records = sorted((r for _, r in db.query()), key=lambda r: r["id"])
+    for criteria in CRITERIA:
+        expected = _expected(records, **criteria)
+        assert [k for k, _ in db.query(**criteria)] == expected, criteria
+
+        stats_criteria = dict(criteria)
+        text = stats_criteria.pop("text", "")
+        income, expense, cat_map, indexed = db.get_stats(text, **stats_criteria)
+        assert [k for k, _ in indexed] == expected
+        hits = [r for r in records if r["id"] in set(expected)]
+        assert income == pytest.approx(sum(r["amount"] for r in hits if r["type"] == "收入"))
+        assert expense == pytest.approx(sum(r["amount"] for r in hits if r["type"] == "支出"))
+        assert sum(cat_map.values()) == pytest.approx(expense)
+
+        streamed = [r["id"] for r in db.iter_records(batch_size=17, **criteria)]
+        assert streamed == expected
+    db.close()
+
+
+def test_date_index_follows_edits(tmp_path):
+    db = open_ledger(str(tmp_path / "ledger.json"), "journal")
+    a = db.add_record("支出", 5.0, "餐饮", date="2026-03-31 23:59")
+    b = db.add_record("支出", 6.0, "交通", date="2026-04-01 00:00")
+    assert [k for k, _ in db.query(start="2026-03-31", end="2026-03-31")] == [a]
+    db.update_record(b, date="2026-03-31 08:00")
+    assert [k for k, _ in db.query(start="2026-03-31", end="2026-03-31")] == [a, b]
+    db.delete_record(a)
+    assert [k for k, _ in db.query(end="2026-03-31")] == [b]
+    db.close()
@@ -0,0 +1,88 @@
+# 列表搜索索引的回归测试：n-gram 索引的结果与逐条子串匹配一致，增删改之后也一致；
+# 输入逐字变长时复用上次结果缩小范围，索引变化后不会用到过期结果。
+#
+#   python -m pytest tests
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pocket_core import SearchIndex, open_ledger  # noqa: E402
+
+NOTES = ["午饭", "午饭加饮料", "Taxi home", "taxi", "地铁卡充值", "", "生日礼物 for Mom", "饮料"]
+CATEGORIES = ["餐饮", "交通", "娱乐", "Salary"]
+QUERIES = ["饭", "午饭", "午饭加", "饮料", "taxi", "TAXI", "axi h", "xi", "餐", "sal", "salary",
+           "地铁卡充值", "卡充", "mom", "无此内容", "for mom"]
+
+
+def _brute(fields, text):
+    ft = text.lower()
+    return {k for k, (cat, note) in fields.items() if ft in cat.lower() or ft in note.lower()}
+
+
+def _random_record(rng):
+    return {"category": rng.choice(CATEGORIES), "note": rng.choice(NOTES)}
+
+
+def test_index_matches_substring_search():
+    rng = random.Random(4)
+    index, fields = SearchIndex(), {}
+    for key in range(200):
+        r = _random_record(rng)
+        index.add(key, r)
+        fields[key] = (r["category"], r["note"])
+    for text in QUERIES:
+        assert index.search(text.lower()) == _brute(fields, text), text
+
+
+def test_index_follows_add_remove_and_update():
+    rng = random.Random(5)
+    index, fields = SearchIndex(), {}
+    for step in range(300):
+        if fields and rng.random() < 0.4:
+            key = rng.choice(sorted(fields))
+            index.remove(key)
+            del fields[key]
+            if rng.random() < 0.5:  # 修改 = 删除旧内容再加入新内容
+                r = _random_record(rng)
+                index.add(key, r)
+                fields[key] = (r["category"], r["note"])
+        else:
+            r = _random_record(rng)
+            index.add(step, r)
+            fields[step] = (r["category"], r["note"])
+        text = rng.choice(QUERIES)
+        assert index.search(text.lower()) == _brute(fields, text)
+
+
+def test_narrowing_reuses_last_result_only_while_index_unchanged():
+    index = SearchIndex()
+    index.add(1, {"category": "餐饮", "note": "午饭"})
+    assert index.search("午") == {1}
+    index.add(2, {"category": "餐饮", "note": "午饭加饮料"})
+    assert index.search("午饭") == {1, 2}  # "午" 的缓存结果已过期，不能只在 {1} 里缩小
+    assert index.search("午饭加") == {2}
+    assert index.search("饭") == {1, 2}     # 变短的查询不复用缓存
+
+
+@pytest.mark.parametrize("backend", ["journal", "sqlite"])
+def test_ledger_search_after_edits(tmp_path, backend):
+    db = open_ledger(str(tmp_path / "ledger.json"), backend)
+    lunch = db.add_record("支出", 20.0, "餐饮", "午饭")
+    taxi = db.add_record("支出", 35.0, "交通", "Taxi home")
+    db.add_record("收入", 100.0, "工资", "")
+
+    def hits(text):
+        return [k for k, _ in db.get_stats(text)[3]]
+
+    assert hits("taxi") == [taxi]
+    assert hits("餐") == [lunch]
+    db.update_record(lunch, note="晚饭")
+    assert hits("午饭") == [] and hits("晚饭") == [lunch]
+    db.delete_record(taxi)
+    assert hits("taxi") == []
+    income, expense, _, _ = db.get_stats("饭")
+    assert (income, expense) == (0, 20.0)
+    db.close()
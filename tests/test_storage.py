@@ -0,0 +1,312 @@
+# 账本存储层的回归测试：日志重放与压缩、崩溃后的残行、旧账本迁移、JSON <-> .ptl 转换、
+# 重新打开后的增量汇总、多实例共用账本。只依赖 pocket_core 与 pytest，不需要界面。
+#
+#   python -m pytest tests
+import json
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pocket_core import (BinaryStorage, DataManager, JournalStorage, LedgerAggregates,  # noqa: E402
+                         LedgerCorruptError, convert_ledger, open_ledger, restore_backup)
+
+CATEGORIES = ["餐饮", "交通", "零食", "工资"]
+
+
+def _record(i):
+    return {"date": f"2026-{1 + i % 12:02d}-{1 + i % 28:02d} 12:{i % 60:02d}",
+            "type": "收入" if i % 5 == 0 else "支出",
+            "amount": float(1 + i % 17), "category": CATEGORIES[i % len(CATEGORIES)], "note": f"n{i}"}
+
+
+def _fields(records):
+    return [(r["id"], r["date"], r["type"], r["amount"], r["category"], r["note"]) for r in records]
+
+
+# 随机增删改，返回按 id 排列的期望结果
+def _random_ops(db, count, seed=7):
+    rng = random.Random(seed)
+    for i in range(count):
+        roll = rng.random()
+        ids = [r["id"] for r in db.data["records"]]
+        if roll < 0.6 or not ids:
+            r = _record(i)
+            db.add_record(r["type"], r["amount"], r["category"], r["note"], date=r["date"])
+        elif roll < 0.8:
+            db.delete_record(rng.choice(ids))
+        else:
+            db.update_record(rng.choice(ids), amount=float(rng.randint(1, 99)), category=rng.choice(CATEGORIES))
+    return _fields(db.data["records"])
+
+
+def _open(path, backend, compact_every=None):
+    db = open_ledger(str(path), backend)
+    if compact_every is not None:
+        db.storage.compact_every = compact_every
+    return db
+
+
+# ---------- 日志重放与压缩 ----------
+@pytest.mark.parametrize("backend", ["journal", "binary"])
+def test_replay_and_compaction_round_trip(tmp_path, backend):
+    path = tmp_path / "ledger.json"
+    db = _open(path, backend, compact_every=25)  # 100 次修改中途压缩数次
+    expected = _random_ops(db, 100)
+    db.close()
+
+    db = _open(path, backend)
+    assert _fields(db.data["records"]) == expected
+    assert not os.path.exists(db.storage.old_journal_path)  # 后台快照写完后删除旧日志
+    db.close()
+
+
+def test_replay_without_snapshot(tmp_path):
+    path = tmp_path / "ledger.json"
+    db = _open(path, "journal")
+    expected = _random_ops(db, 40)
+    db.close()
+    assert (tmp_path / "ledger.journal").stat().st_size > 0  # 没达到压缩阈值：修改都在日志里
+
+    db = _open(path, "journal")
+    assert _fields(db.data["records"]) == expected
+    db.close()
+
+
+# ---------- 崩溃后的日志 ----------
+def _ledger_with_journal(tmp_path, adds=5):
+    path = tmp_path / "ledger.json"
+    db = _open(path, "journal")
+    db.save()
+    for i in range(adds):
+        r = _record(i)
+        db.add_record(r["type"], r["amount"], r["category"], r["note"], date=r["date"])
+    db.close()
+    journal = tmp_path / "ledger.journal"
+    return path, journal, journal.read_bytes().splitlines(keepends=True)
+
+
+def test_torn_last_line_is_truncated(tmp_path):
+    path, journal, lines = _ledger_with_journal(tmp_path)
+    journal.write_bytes(b"".join(lines[:-1]) + lines[-1][:15])  # 最后一行写了一半
+
+    db = _open(path, "journal")
+    assert len(db.data["records"]) == 4
+    db.close()
+    assert journal.read_bytes() == b"".join(lines[:-1])
+
+    # 截断后继续追加，不会接在残行后面
+    db = _open(path, "journal")
+    db.add_record("支出", 1.0, "餐饮")
+    db.close()
+    db = _open(path, "journal")
+    assert len(db.data["records"]) == 5
+    db.close()
+
+
+def test_corrupt_middle_line_raises_and_keeps_journal(tmp_path):
+    path, journal, lines = _ledger_with_journal(tmp_path)
+    lines[1] = b'{"op": "add", "rec\n'
+    damaged = b"".join(lines)
+    journal.write_bytes(damaged)
+
+    with pytest.raises(LedgerCorruptError) as info:
+        open_ledger(str(path), "journal")
+    assert info.value.path == str(path)
+    assert journal.read_bytes() == damaged  # 不截断，之后的修改留给恢复流程处理
+    assert info.value.journal == str(journal)
+
+
+# 快照完好、只有日志中间损坏：恢复后保留当前快照和损坏之前的日志，不退回到更旧的 .N 备份
+def test_restore_keeps_snapshot_when_only_journal_is_corrupt(tmp_path):
+    path = tmp_path / "ledger.json"
+    db = _open(path, "journal")
+    for i in range(10):
+        db.add_record("支出", 1.0, "餐饮", f"a{i}")
+    db.save()
+    for i in range(10):
+        db.add_record("支出", 1.0, "餐饮", f"b{i}")
+    db.save()  # 快照 20 条，上一份快照 (10 条) 轮换为 ledger.json.1
+    for i in range(5):
+        db.add_record("支出", 1.0, "餐饮", f"c{i}")
+    db.close()
+
+    journal = tmp_path / "ledger.journal"
+    lines = journal.read_bytes().splitlines(keepends=True)
+    lines[2] = b"{garbage\n"
+    journal.write_bytes(b"".join(lines))
+    with pytest.raises(LedgerCorruptError):
+        open_ledger(str(path), "journal")
+
+    assert restore_backup(str(path)) == str(path)
+    quarantined = list(tmp_path.glob("ledger.journal.corrupt-*"))
+    assert len(quarantined) == 1 and quarantined[0].read_bytes() == b"".join(lines[2:])
+
+    db = _open(path, "journal")
+    notes = [r["note"] for r in db.data["records"]]
+    assert notes == [f"a{i}" for i in range(10)] + [f"b{i}" for i in range(10)] + ["c0", "c1"]
+    db.add_record("支出", 1.0, "餐饮", "after")  # 锁文件里的序号已退回，之后的写入照常接续
+    db.close()
+    db = _open(path, "journal")
+    assert [r["note"] for r in db.data["records"]][-3:] == ["c0", "c1", "after"]
+    db.close()
+
+
+def test_restore_uses_backup_when_snapshot_is_corrupt(tmp_path):
+    path = tmp_path / "ledger.json"
+    db = _open(path, "journal")
+    db.add_record("支出", 1.0, "餐饮", "old")
+    db.save()
+    db.add_record("支出", 1.0, "餐饮", "new")
+    db.save()
+    db.close()
+    path.write_text("{broken", encoding="utf-8")
+
+    with pytest.raises(LedgerCorruptError) as info:
+        open_ledger(str(path), "journal")
+    assert info.value.journal is None
+    assert restore_backup(str(path)) == str(path) + ".1"
+    db = _open(path, "journal")
+    assert [r["note"] for r in db.data["records"]] == ["old"]
+    db.close()
+
+
+def test_crashed_writer_tail_is_dropped_by_other_instance(tmp_path):
+    path = tmp_path / "ledger.json"
+    a, b = _open(path, "journal"), _open(path, "journal")
+    a.add_record("支出", 1.0, "餐饮")
+    with open(tmp_path / "ledger.journal", "ab") as f:
+        f.write(b'{"op": "add", "rec')  # 另一个进程写到一半时退出
+    b.add_record("支出", 2.0, "餐饮")
+    a.close()
+    b.close()
+
+    db = _open(path, "journal")
+    assert sorted(r["amount"] for r in db.data["records"]) == [1.0, 2.0]
+    db.close()
+
+
+# ---------- 旧账本迁移 ----------
+def test_legacy_index_journal_migrates_to_ids(tmp_path):
+    path = tmp_path / "ledger.json"
+    records = [_record(i) for i in range(4)]  # 旧快照：记录没有 id，也没有 next_id
+    path.write_text(json.dumps({"records": records}, ensure_ascii=False), encoding="utf-8")
+    legacy_ops = [
+        {"op": "add", "record": _record(10), "seq": 1},
+        {"op": "delete", "index": 1, "seq": 2},  # 旧版本按位置删除
+    ]
+    (tmp_path / "ledger.journal").write_text(
+        "".join(json.dumps(op, ensure_ascii=False) + "\n" for op in legacy_ops), encoding="utf-8")
+
+    db = DataManager(JournalStorage(str(path)))
+    notes = [r["note"] for r in db.data["records"]]
+    assert notes == ["n0", "n2", "n3", "n10"]
+    ids = [r["id"] for r in db.data["records"]]
+    assert ids == sorted(ids) and len(set(ids)) == len(ids)
+    new_id = db.add_record("支出", 3.0, "零食")
+    assert new_id > max(ids)
+    db.delete_record(ids[0])
+    db.close()
+
+    # 迁移后立即写了快照，之后的日志按 id 记录
+    db = DataManager(JournalStorage(str(path)))
+    assert [r["note"] for r in db.data["records"]] == ["n2", "n3", "n10", ""]
+    assert [r["id"] for r in db.data["records"]] == ids[1:] + [new_id]
+    db.close()
+
+
+# ---------- JSON <-> .ptl ----------
+def test_json_binary_conversion_round_trip(tmp_path):
+    src = tmp_path / "ledger.json"
+    db = _open(src, "journal")
+    expected = _random_ops(db, 60)
+    db.set_budget({"period": "month", "total": 300.0})
+    db.close()  # 部分修改还在日志里，转换时一并重放
+
+    ptl, back = tmp_path / "ledger.ptl", tmp_path / "back.json"
+    assert convert_ledger(str(src), str(ptl)) == len(expected)
+    assert convert_ledger(str(ptl), str(back)) == len(expected)
+
+    for path, storage in ((ptl, BinaryStorage), (back, JournalStorage)):
+        db = DataManager(storage(str(path)))
+        assert _fields(db.data["records"]) == expected
+        assert db.data["budget"] == {"period": "month", "total": 300.0}
+        db.close()
+
+
+def test_binary_migrates_from_json(tmp_path):
+    src = tmp_path / "ledger.json"
+    db = _open(src, "journal")
+    expected = _random_ops(db, 30)
+    db.close()
+
+    db = _open(src, "binary")  # 首次打开时从 JSON 转换成 ledger.ptl
+    assert (tmp_path / "ledger.ptl").exists()
+    assert _fields(db.data["records"]) == expected
+    db.close()
+
+
+# ---------- 增量汇总 ----------
+@pytest.mark.parametrize("backend", ["journal", "binary", "sqlite"])
+def test_aggregates_match_recompute_after_reopen(tmp_path, backend):
+    path = tmp_path / "ledger.json"
+    db = _open(path, backend, compact_every=None if backend == "sqlite" else 30)
+    _random_ops(db, 120)
+    db.close()
+
+    db = _open(path, backend)
+    records = list(db.data["records"])
+    assert db.agg.to_dict() == LedgerAggregates.from_records(records).to_dict()
+    if backend != "sqlite":  # SQLite 后端没有列式存储
+        assert db.agg.to_dict() == LedgerAggregates.from_columns(db.columns).to_dict()
+    db.close()
+
+
+# ---------- 多实例共用账本 ----------
+@pytest.mark.parametrize("backend", ["journal", "binary"])
+def test_two_instances_share_ledger(tmp_path, backend):
+    path = tmp_path / ("ledger.ptl" if backend == "binary" else "ledger.json")
+    a, b = _open(path, backend, compact_every=20), _open(path, backend, compact_every=20)
+    first = a.add_record("支出", 5.0, "餐饮")
+    second = b.add_record("支出", 7.0, "交通")
+    assert first != second
+    assert a.refresh() and not a.refresh()
+    assert a.get_record(second)["amount"] == 7.0
+
+    b.set_budget({"period": "month", "total": 100.0})
+    assert a.refresh() and a.budget.active
+    for i in range(50):  # 两边交替写入，中途各自压缩
+        (a if i % 2 else b).add_record("支出", 1.0, "零食")
+    a.refresh()
+    b.refresh()
+    assert _fields(a.data["records"]) == _fields(b.data["records"])
+    assert a.agg.to_dict() == b.agg.to_dict()
+    a.close()
+    b.close()
+
+
+# ---------- 旧数据的容错 ----------
+@pytest.mark.parametrize("budget", [0, -5, "abc", [1], True, {"total": "x"}, float("inf"),
+                                    {"total": 100, "categories": {"餐饮": float("inf")}}])
+def test_invalid_stored_budget_is_ignored(tmp_path, budget):
+    path = tmp_path / "ledger.json"
+    path.write_text(json.dumps({"records": [_record(1)], "budget": budget}), encoding="utf-8")
+    db = _open(path, "journal")
+    assert not db.budget.active and db.budget_status() == []
+    with pytest.raises(ValueError):
+        db.set_budget(budget)
+    db.close()
+
+
+def test_non_iso_dates_in_filtered_stats(tmp_path):
+    path = tmp_path / "ledger.json"
+    legacy = [dict(_record(1), date="2026/02/26 21:48", category="餐饮"), dict(_record(2), category="餐饮")]
+    path.write_text(json.dumps({"records": legacy}, ensure_ascii=False), encoding="utf-8")
+    db = _open(path, "journal")
+    _, expense, categories, rows = db.get_stats("餐")
+    assert len(rows) == 2 and categories == {"餐饮": expense}
+    db.get_stats(start="2026-01-01")
+    assert db.agg.to_dict() == LedgerAggregates.from_columns(db.columns).to_dict()
+    db.close()